@@ -0,0 +1,54 @@
+import re
+from django.db import models
+from django.db.models.functions import Upper
+from drfpasswordless.settings import api_settings
+
+MOBILE_SEPARATORS = re.compile(r'[\s\-().]')
+
+
+def normalize_email(email):
+    """
+    Canonical form of an email alias: trimmed and lowercased.
+    """
+    return email.strip().lower()
+
+
+def normalize_mobile(mobile):
+    """
+    Canonical E.164 form of a mobile alias, e.g. '+1 (555) 123-4567' becomes '+15551234567'.
+    """
+    mobile = MOBILE_SEPARATORS.sub('', str(mobile))
+    if mobile.startswith('00'):
+        mobile = '+' + mobile[2:]
+    return mobile
+
+
+def normalize_alias(alias_type, alias):
+    if alias is None or alias == '':
+        return alias
+    if alias_type == 'email':
+        return normalize_email(alias)
+    elif alias_type == 'mobile':
+        return normalize_mobile(alias)
+    return alias
+
+
+def alias_lookup(alias_type, alias, prefix=''):
+    """
+    Returns the filter arguments that find a user by alias.
+
+    With PASSWORDLESS_NORMALIZE_ALIASES the alias is normalized and matched
+    exactly, which a plain index on the column can serve. Otherwise it is
+    matched case-insensitively as before.
+    """
+    if api_settings.PASSWORDLESS_NORMALIZE_ALIASES is True:
+        return {prefix + alias_type: normalize_alias(alias_type, alias)}
+    return {prefix + alias_type + '__iexact': alias}
+
+
+def case_insensitive_alias_index(field_name, name):
+    """
+    An index on UPPER(field_name), which is what iexact lookups compare on PostgreSQL.
+    Add it to your user model's Meta.indexes if you keep case-insensitive alias matching.
+    """
+    return models.Index(Upper(field_name), name=name)
@@ -7,3 +7,5 @@ class DrfpasswordlessConfig(AppConfig):
 
     def ready(self):
         import drfpasswordless.signals
+        from drfpasswordless.settings import resolved_settings
+        resolved_settings.validate()
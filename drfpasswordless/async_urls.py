@@ -0,0 +1,27 @@
+from drfpasswordless.settings import api_settings
+from django.urls import path
+from drfpasswordless.async_views import (
+     AsyncObtainEmailCallbackToken,
+     AsyncObtainMobileCallbackToken,
+     AsyncObtainAuthTokenFromCallbackToken,
+)
+from drfpasswordless.views import (
+     VerifyAliasFromCallbackToken,
+     ObtainEmailVerificationCallbackToken,
+     ObtainMobileVerificationCallbackToken,
+     ObtainEmailMagicLink,
+     ObtainAuthTokenFromMagicLink,
+)
+
+app_name = 'drfpasswordless'
+
+urlpatterns = [
+     path(api_settings.PASSWORDLESS_AUTH_PREFIX + 'email/', AsyncObtainEmailCallbackToken.as_view(), name='auth_email'),
+     path(api_settings.PASSWORDLESS_AUTH_PREFIX + 'mobile/', AsyncObtainMobileCallbackToken.as_view(), name='auth_mobile'),
+     path(api_settings.PASSWORDLESS_AUTH_PREFIX + 'token/', AsyncObtainAuthTokenFromCallbackToken.as_view(), name='auth_token'),
+     path(api_settings.PASSWORDLESS_AUTH_PREFIX + 'email/magic/', ObtainEmailMagicLink.as_view(), name='auth_email_magic_link'),
+     path(api_settings.PASSWORDLESS_AUTH_PREFIX + 'magic/', ObtainAuthTokenFromMagicLink.as_view(), name='auth_magic_link'),
+     path(api_settings.PASSWORDLESS_VERIFY_PREFIX + 'email/', ObtainEmailVerificationCallbackToken.as_view(), name='verify_email'),
+     path(api_settings.PASSWORDLESS_VERIFY_PREFIX + 'mobile/', ObtainMobileVerificationCallbackToken.as_view(), name='verify_mobile'),
+     path(api_settings.PASSWORDLESS_VERIFY_PREFIX, VerifyAliasFromCallbackToken.as_view(), name='verify_token'),
+]
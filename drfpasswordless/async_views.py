@@ -0,0 +1,200 @@
+import json
+import logging
+import math
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.utils.translation import gettext_lazy as _
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings as drf_settings
+from drfpasswordless.aliases import alias_lookup, normalize_alias
+from drfpasswordless.metrics import timer
+from drfpasswordless.models import CallbackToken
+from drfpasswordless.serializers import (
+    EmailAuthSerializer,
+    MobileAuthSerializer,
+    CallbackTokenAuthSerializer,
+)
+from drfpasswordless.services import TokenService
+from drfpasswordless.settings import api_settings, resolved_settings
+from drfpasswordless.throttling import AliasRateThrottle, IPRateThrottle, ResendCooldownThrottle
+from drfpasswordless.utils import aconsume_callback_token, aget_or_register_user, verify_user_alias
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+def invalid(msg):
+    return ValidationError({drf_settings.NON_FIELD_ERRORS_KEY: [msg]})
+
+
+async def aget_alias_user(alias_type, alias):
+    """
+    Finds the user with the given alias, registering them if PASSWORDLESS_REGISTER_NEW_USERS is on.
+    """
+    if api_settings.PASSWORDLESS_NORMALIZE_ALIASES is True:
+        alias = normalize_alias(alias_type, alias)
+    with timer('user_lookup', alias_type=alias_type) as t:
+        if api_settings.PASSWORDLESS_REGISTER_NEW_USERS is True:
+            user, created = await aget_or_register_user(alias_type, alias)
+            t.outcome = 'registered' if created else 'found'
+            return user
+
+        try:
+            user = await User.objects.aget(**alias_lookup(alias_type, alias))
+            t.outcome = 'found'
+            return user
+        except User.DoesNotExist:
+            t.outcome = 'missing'
+            return None
+
+
+class AsyncAPIView(View):
+    """
+    Async counterpart of the parts of DRF's APIView the passwordless endpoints
+    rely on: JSON and form bodies are parsed into request.data, the view's
+    throttle_classes are checked and validation errors are answered in JSON.
+
+    DRF doesn't run async views, so its authentication, permission, renderer
+    and DEFAULT_THROTTLE_CLASSES settings don't apply. These views are meant
+    for anonymous users only.
+    """
+    throttle_classes = ()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            request.data = self.parse(request)
+        except ValueError:
+            return JsonResponse({'detail': 'Malformed request.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        for throttle in [throttle_class() for throttle_class in self.throttle_classes]:
+            # Throttles keep their counters in the cache, which may be across the network.
+            if not await sync_to_async(throttle.allow_request, thread_sensitive=False)(request, self):
+                response = JsonResponse({'detail': 'Request was throttled.'},
+                                        status=status.HTTP_429_TOO_MANY_REQUESTS)
+                wait = throttle.wait()
+                if wait is not None:
+                    response['Retry-After'] = '%d' % math.ceil(wait)
+                return response
+
+        try:
+            return await self.handle(request)
+        except ValidationError as e:
+            return JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST, safe=False)
+
+    def parse(self, request):
+        if request.content_type == 'application/json':
+            return json.loads(request.body or b'{}')
+        return request.POST
+
+    async def handle(self, request):
+        raise NotImplementedError
+
+
+class AsyncAbstractBaseObtainCallbackToken(AsyncAPIView):
+    """
+    Async version of AbstractBaseObtainCallbackToken.
+    """
+    success_response = "A login token has been sent to you."
+    failure_response = "Unable to send you a login code. Try again later."
+
+    message_payload = {}
+    throttle_classes = (AliasRateThrottle, IPRateThrottle, ResendCooldownThrottle)
+    token_type = CallbackToken.TOKEN_TYPE_AUTH
+
+    @property
+    def serializer_class(self):
+        # Our serializer depending on type
+        raise NotImplementedError
+
+    @property
+    def alias_type(self):
+        # Alias Type
+        raise NotImplementedError
+
+    async def handle(self, request):
+        if self.alias_type.upper() not in api_settings.PASSWORDLESS_AUTH_TYPES:
+            # Only allow auth types allowed in settings.
+            return JsonResponse({}, status=status.HTTP_404_NOT_FOUND)
+
+        # Checks the alias' format. Looking up the user is left to us.
+        attrs = self.serializer_class().to_internal_value(request.data)
+
+        user = await aget_alias_user(self.alias_type, attrs[self.alias_type])
+        if user is None:
+            raise invalid(_('No account is associated with this alias.'))
+        if not user.is_active:
+            raise invalid(_('User account is disabled.'))
+
+        success = await TokenService.asend_token(user, self.alias_type, self.token_type, **self.message_payload)
+        if success:
+            return JsonResponse({"detail": self.success_response}, status=status.HTTP_200_OK)
+        return JsonResponse({"detail": self.failure_response}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncObtainEmailCallbackToken(AsyncAbstractBaseObtainCallbackToken):
+    serializer_class = EmailAuthSerializer
+    success_response = "A login token has been sent to your email."
+    failure_response = "Unable to email you a login code. Try again later."
+
+    alias_type = "email"
+
+    email_subject = api_settings.PASSWORDLESS_EMAIL_SUBJECT
+    email_plaintext = api_settings.PASSWORDLESS_EMAIL_PLAINTEXT_MESSAGE
+    email_html = api_settings.PASSWORDLESS_EMAIL_TOKEN_HTML_TEMPLATE_NAME
+    message_payload = {"email_subject": email_subject,
+                       "email_plaintext": email_plaintext,
+                       "email_html": email_html}
+
+
+class AsyncObtainMobileCallbackToken(AsyncAbstractBaseObtainCallbackToken):
+    serializer_class = MobileAuthSerializer
+    success_response = "We texted you a login code."
+    failure_response = "Unable to send you a login code. Try again later."
+
+    alias_type = "mobile"
+
+    mobile_message = api_settings.PASSWORDLESS_MOBILE_MESSAGE
+    message_payload = {"mobile_message": mobile_message}
+
+
+class AsyncObtainAuthTokenFromCallbackToken(AsyncAPIView):
+    """
+    Async version of ObtainAuthTokenFromCallbackToken.
+    """
+    serializer_class = CallbackTokenAuthSerializer
+
+    async def handle(self, request):
+        serializer = self.serializer_class()
+        attrs = serializer.to_internal_value(request.data)
+        try:
+            alias_type, alias = serializer.validate_alias(attrs)
+        except ValidationError:
+            raise invalid(_('Invalid alias parameters provided.'))
+
+        token = await aconsume_callback_token(attrs['token'], CallbackToken.TOKEN_TYPE_AUTH, alias_type, alias)
+        if token is None or not token.user.is_active:
+            raise invalid(_('Invalid alias parameters provided.'))
+
+        user = token.user
+        if api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED \
+                or api_settings.PASSWORDLESS_USER_MARK_MOBILE_VERIFIED:
+            # Mark this alias as verified
+            if await sync_to_async(verify_user_alias)(user, token) is False:
+                raise invalid(_('Invalid alias parameters provided.'))
+
+        (auth_token, _created) = await sync_to_async(resolved_settings.PASSWORDLESS_AUTH_TOKEN_CREATOR)(user)
+        if auth_token:
+            TokenSerializer = resolved_settings.PASSWORDLESS_AUTH_TOKEN_SERIALIZER
+            token_serializer = TokenSerializer(data=auth_token.__dict__, partial=True, context={"request": request})
+            if token_serializer.is_valid():
+                # Return our key for consumption.
+                return JsonResponse(token_serializer.data, status=status.HTTP_200_OK)
+        return JsonResponse({"detail": "Couldn't log you in. Try again later."}, status=status.HTTP_400_BAD_REQUEST)
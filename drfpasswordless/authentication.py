@@ -0,0 +1,62 @@
+import logging
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from drfpasswordless.settings import api_settings
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+SIGNED_AUTH_TOKEN_SALT = 'drfpasswordless.authentication.SignedTokenAuthentication'
+
+
+class SignedAuthToken(object):
+    """
+    An auth token that carries the user's primary key, signed with SECRET_KEY,
+    instead of being stored.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.key = signing.dumps(str(user.pk), salt=SIGNED_AUTH_TOKEN_SALT, compress=False)
+        self.expires_at = timezone.now() + timedelta(seconds=api_settings.PASSWORDLESS_SIGNED_AUTH_TOKEN_MAX_AGE)
+
+
+def unsign_auth_token(key):
+    """
+    Returns the primary key of the user a signed auth token was issued to,
+    or None if it's been tampered with or is older than PASSWORDLESS_SIGNED_AUTH_TOKEN_MAX_AGE.
+    Checking the token makes no queries.
+    """
+    try:
+        user_pk = signing.loads(key, salt=SIGNED_AUTH_TOKEN_SALT,
+                                max_age=api_settings.PASSWORDLESS_SIGNED_AUTH_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return User._meta.pk.to_python(user_pk)
+
+
+class SignedTokenAuthentication(TokenAuthentication):
+    """
+    Authenticates requests with a signed auth token from create_signed_authentication_token,
+    passed in the Authorization header as "Bearer <token>".
+
+    The token is checked without touching the database. The only query is the
+    one loading the user, who must still be active. Signed tokens can't be
+    revoked before they expire, other than by changing SECRET_KEY.
+    """
+    keyword = 'Bearer'
+
+    def authenticate_credentials(self, key):
+        user_pk = unsign_auth_token(key)
+        if user_pk is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        user = User.objects.filter(pk=user_pk).first()
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return (user, key)
@@ -0,0 +1,331 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from drfpasswordless.metrics import increment, timer
+from drfpasswordless.settings import api_settings, resolved_settings, DEFAULTS
+from drfpasswordless.utils import build_callback_token_email, send_emails_with_callback_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class Delivery(object):
+    """
+    A callback token waiting to be sent to one of a user's aliases.
+    """
+
+    def __init__(self, user, token, alias_type, message_payload=None):
+        self.user = user
+        self.token = token
+        self.alias_type = alias_type
+        self.message_payload = message_payload or {}
+        self.attempts = 0
+
+
+def get_send_action(alias_type):
+    """
+    Returns the configured callback that sends a token to the given alias type.
+    """
+    if alias_type == 'email':
+        return resolved_settings.PASSWORDLESS_EMAIL_CALLBACK
+    elif alias_type == 'mobile':
+        return resolved_settings.PASSWORDLESS_SMS_CALLBACK
+    return None
+
+
+def send_delivery(delivery):
+    """
+    Sends a single delivery through its callback. Returns True on success.
+    """
+    send_action = get_send_action(delivery.alias_type)
+    delivery.attempts += 1
+    with timer('delivery', alias_type=delivery.alias_type) as t:
+        success = send_action(delivery.user, delivery.token, **delivery.message_payload)
+        t.outcome = 'success' if success else 'failure'
+    return success
+
+
+def uses_default_email_callback():
+    return api_settings.PASSWORDLESS_EMAIL_CALLBACK == DEFAULTS['PASSWORDLESS_EMAIL_CALLBACK']
+
+
+def send_deliveries(deliveries):
+    """
+    Sends a list of deliveries and returns their results in the same order.
+
+    While the default email callback is in use, emails are rendered one by one
+    but handed to the email connection in a single send_messages call.
+    """
+    results = [False] * len(deliveries)
+    batch_emails = uses_default_email_callback()
+    emails = []
+    for i, delivery in enumerate(deliveries):
+        if batch_emails and delivery.alias_type == 'email':
+            emails.append(i)
+            continue
+        try:
+            results[i] = send_delivery(delivery)
+        except Exception as e:
+            logger.debug("drfpasswordless: Delivery to user %s raised an error." % delivery.user.pk)
+            logger.debug(e)
+
+    if emails:
+        for i in emails:
+            deliveries[i].attempts += 1
+        # A batch is timed as a single delivery.
+        with timer('delivery', alias_type='email') as t:
+            sent = send_emails_with_callback_tokens([(deliveries[i].user, deliveries[i].token,
+                                                      deliveries[i].message_payload) for i in emails])
+            t.outcome = 'success' if all(sent) else 'failure'
+        for i, success in zip(emails, sent):
+            results[i] = success
+    return results
+
+
+class BaseDeliveryBackend(object):
+    """
+    Hands callback tokens over to the email and SMS callbacks.
+    Subclasses decide when and where the callbacks actually run.
+    """
+
+    def send(self, user, token, alias_type, **message_payload):
+        return self.send_many([Delivery(user, token, alias_type, message_payload)])
+
+    def send_many(self, deliveries):
+        """
+        Sends or schedules a list of deliveries. Returns True if they were accepted.
+        """
+        raise NotImplementedError
+
+    async def asend(self, user, token, alias_type, **message_payload):
+        return await self.asend_many([Delivery(user, token, alias_type, message_payload)])
+
+    async def asend_many(self, deliveries):
+        """
+        Async version of send_many, used by the async views. Unless a backend
+        overrides it, send_many runs in a worker thread so the event loop isn't
+        blocked while it waits on SMTP or Twilio.
+        """
+        return await sync_to_async(self.send_many, thread_sensitive=False)(deliveries)
+
+
+class SyncDeliveryBackend(BaseDeliveryBackend):
+    """
+    Sends tokens inline, so the request waits for SMTP or Twilio and
+    reports a failed send back to the client. This is the default.
+    """
+
+    def send_many(self, deliveries):
+        return all(send_deliveries(deliveries))
+
+
+class AsyncSMTPDeliveryBackend(SyncDeliveryBackend):
+    """
+    For ASGI deployments. Async views send emails with aiosmtplib, so waiting
+    on the SMTP server doesn't hold up a thread. It uses Django's EMAIL_HOST,
+    EMAIL_PORT, EMAIL_HOST_USER, EMAIL_HOST_PASSWORD, EMAIL_USE_TLS, EMAIL_USE_SSL
+    and EMAIL_TIMEOUT settings.
+
+    Texts and custom email callbacks still run in a worker thread, and sync views
+    send like SyncDeliveryBackend. Requires the aiosmtplib package.
+    """
+
+    async def asend_many(self, deliveries):
+        results = [False] * len(deliveries)
+        if uses_default_email_callback():
+            emails = [i for i, delivery in enumerate(deliveries) if delivery.alias_type == 'email']
+        else:
+            emails = []
+
+        others = [i for i in range(len(deliveries)) if i not in emails]
+        if others:
+            sent = await sync_to_async(send_deliveries, thread_sensitive=False)([deliveries[i] for i in others])
+            for i, success in zip(others, sent):
+                results[i] = success
+
+        if emails:
+            with timer('delivery', alias_type='email') as t:
+                sent = await self.send_emails([deliveries[i] for i in emails])
+                t.outcome = 'success' if all(sent) else 'failure'
+            for i, success in zip(emails, sent):
+                results[i] = success
+        return all(results)
+
+    async def send_emails(self, deliveries):
+        """
+        Sends token emails over one aiosmtplib connection. Returns a list of results.
+        """
+        results = [False] * len(deliveries)
+        if not api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS:
+            logger.debug("Failed to send token email. Missing PASSWORDLESS_EMAIL_NOREPLY_ADDRESS.")
+            return results
+
+        try:
+            import aiosmtplib
+        except ImportError:
+            logger.debug("Couldn't import aiosmtplib. Is it installed?")
+            return results
+
+        messages = []
+        for i, delivery in enumerate(deliveries):
+            delivery.attempts += 1
+            try:
+                messages.append((i, build_callback_token_email(delivery.user, delivery.token,
+                                                               **delivery.message_payload)))
+            except Exception as e:
+                logger.debug("Failed to build token email to user: %s." % delivery.user.pk)
+                logger.debug(e)
+
+        try:
+            async with aiosmtplib.SMTP(hostname=settings.EMAIL_HOST,
+                                       port=settings.EMAIL_PORT,
+                                       username=settings.EMAIL_HOST_USER or None,
+                                       password=settings.EMAIL_HOST_PASSWORD or None,
+                                       use_tls=settings.EMAIL_USE_SSL,
+                                       start_tls=settings.EMAIL_USE_TLS,
+                                       timeout=settings.EMAIL_TIMEOUT) as smtp:
+                for i, message in messages:
+                    await smtp.send_message(message.message(), sender=message.from_email,
+                                            recipients=message.recipients())
+                    results[i] = True
+        except Exception as e:
+            logger.debug("Failed to send a batch of %d token emails." % len(messages))
+            logger.debug(e)
+        return results
+
+
+class LocmemDeliveryBackend(BaseDeliveryBackend):
+    """
+    Keeps deliveries in memory instead of sending them. Meant for tests.
+    """
+
+    def __init__(self):
+        self.outbox = []
+
+    def send_many(self, deliveries):
+        self.outbox.extend(deliveries)
+        return True
+
+    async def asend_many(self, deliveries):
+        return self.send_many(deliveries)
+
+
+class QueuedDeliveryBackend(BaseDeliveryBackend):
+    """
+    Puts deliveries on an in-process outbox and returns as soon as the token is persisted.
+
+    The outbox is drained in batches by PASSWORDLESS_DELIVERY_WORKERS background
+    threads, or by calling drain() yourself when that is set to 0. Failed sends
+    are retried up to PASSWORDLESS_DELIVERY_MAX_RETRIES times, doubling
+    PASSWORDLESS_DELIVERY_RETRY_DELAY between attempts.
+
+    The outbox lives in memory, so anything still queued is lost if the process exits.
+    """
+
+    def __init__(self):
+        self._outbox = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._workers = []
+
+    def __len__(self):
+        with self._condition:
+            return len(self._outbox)
+
+    def send_many(self, deliveries):
+        with self._condition:
+            for delivery in deliveries:
+                self._push(delivery, time.monotonic())
+            self._condition.notify(len(deliveries))
+        self.start_workers()
+        return True
+
+    async def asend_many(self, deliveries):
+        # Queueing doesn't block, so there's no need for a thread.
+        return self.send_many(deliveries)
+
+    def _push(self, delivery, due):
+        heapq.heappush(self._outbox, (due, next(self._sequence), delivery))
+
+    def _pop_due(self, block):
+        """
+        Pops the next delivery that is due, optionally waiting for one.
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self._outbox and self._outbox[0][0] <= now:
+                    return heapq.heappop(self._outbox)[2]
+                if not block:
+                    return None
+                timeout = self._outbox[0][0] - now if self._outbox else None
+                self._condition.wait(timeout)
+
+    def drain(self, batch_size=None, block=False):
+        """
+        Sends up to batch_size deliveries that are due and returns how many succeeded.
+        With block=True waits for the first delivery to become available.
+        """
+        batch_size = batch_size or api_settings.PASSWORDLESS_DELIVERY_BATCH_SIZE
+        processed = sent = 0
+        while processed < batch_size:
+            batch = []
+            while processed + len(batch) < batch_size:
+                delivery = self._pop_due(block=block and processed + len(batch) == 0)
+                if delivery is None:
+                    break
+                batch.append(delivery)
+            if not batch:
+                break
+
+            # Retries that are already due are picked up by the next round.
+            results = send_deliveries(batch)
+            for delivery, success in zip(batch, results):
+                if not success:
+                    self._retry(delivery)
+            processed += len(batch)
+            sent += sum(results)
+        return sent
+
+    def _retry(self, delivery):
+        if delivery.attempts <= api_settings.PASSWORDLESS_DELIVERY_MAX_RETRIES:
+            delay = api_settings.PASSWORDLESS_DELIVERY_RETRY_DELAY * 2 ** (delivery.attempts - 1)
+            with self._condition:
+                self._push(delivery, time.monotonic() + delay)
+                self._condition.notify()
+            increment('delivery_retries', alias_type=delivery.alias_type)
+        else:
+            increment('delivery_dropped', alias_type=delivery.alias_type)
+            logger.warning("drfpasswordless: Giving up sending a %s token to user %s after %d attempts."
+                           % (delivery.alias_type, delivery.user.pk, delivery.attempts))
+
+    def start_workers(self):
+        """
+        Starts the background worker threads if they aren't running yet.
+        """
+        with self._condition:
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            for i in range(api_settings.PASSWORDLESS_DELIVERY_WORKERS - len(self._workers)):
+                worker = threading.Thread(target=self._work, name='drfpasswordless-delivery', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            try:
+                self.drain(block=True)
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                close_old_connections()
+
+
+def get_delivery_backend():
+    """
+    Returns the process-wide instance of the configured delivery backend.
+    """
+    return resolved_settings.instance('PASSWORDLESS_DELIVERY_BACKEND')
@@ -0,0 +1,87 @@
+import threading
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from drfpasswordless.aliases import alias_lookup
+from drfpasswordless.models import CallbackToken
+from drfpasswordless.settings import api_settings
+
+User = get_user_model()
+
+
+class DemoTokens(object):
+    """
+    Issues and checks the static pins of PASSWORDLESS_DEMO_USERS in memory.
+
+    Demo tokens are never stored, so issuing one makes no queries and redeeming
+    one only looks up the user, and the token signals never run for them. They
+    don't expire and can be used any number of times.
+
+    The setting is copied into a dict and a frozenset of pins the first time
+    it's needed, and again whenever PASSWORDLESS_DEMO_USERS is replaced.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._source = None
+        self._pins_by_user = {}
+        self._pins = frozenset()
+
+    def _load(self):
+        source = api_settings.PASSWORDLESS_DEMO_USERS
+        if source is not self._source:
+            with self._lock:
+                self._pins_by_user = dict(source)
+                self._pins = frozenset(source.values())
+                self._source = source
+        return self._pins_by_user
+
+    def is_demo_user(self, user_pk):
+        return user_pk in self._load()
+
+    def is_demo_pin(self, key):
+        self._load()
+        return key in self._pins
+
+    def create_token(self, user, alias_type, token_type):
+        """
+        Returns an unsaved token carrying the user's pin.
+        """
+        alias_type_u = alias_type.upper()
+        to_alias_field = getattr(api_settings, f'PASSWORDLESS_USER_{alias_type_u}_FIELD_NAME')
+        return CallbackToken(user=user,
+                             key=self._load()[user.pk],
+                             type=token_type,
+                             to_alias=getattr(user, to_alias_field),
+                             to_alias_type=alias_type_u,
+                             created_at=timezone.now())
+
+    def check_token(self, user, callback_token, token_type, alias_type, user_id=None):
+        pin = self._load().get(user.pk) if user is not None else None
+        if pin is None or (user_id is not None and user.pk != user_id):
+            return None
+        if not constant_time_compare(pin, callback_token):
+            return None
+        return self.create_token(user, alias_type, token_type)
+
+    def consume_token(self, callback_token, token_type, alias_type, alias, user_id=None):
+        """
+        Returns a token if callback_token is the pin of the demo user with the given alias.
+        Anything that isn't a demo pin is turned away without a query.
+        """
+        if not self.is_demo_pin(callback_token):
+            return None
+        user = User.objects.filter(**alias_lookup(alias_type, alias)).first()
+        return self.check_token(user, callback_token, token_type, alias_type, user_id)
+
+    async def aconsume_token(self, callback_token, token_type, alias_type, alias, user_id=None):
+        """
+        Async version of consume_token.
+        """
+        if not self.is_demo_pin(callback_token):
+            return None
+        user = await User.objects.filter(**alias_lookup(alias_type, alias)).afirst()
+        return self.check_token(user, callback_token, token_type, alias_type, user_id)
+
+
+demo_tokens = DemoTokens()
@@ -0,0 +1,80 @@
+import logging
+import smtplib
+import threading
+import time
+from django.conf import settings
+from django.core.mail import get_connection
+from drfpasswordless.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def connection_is_usable(connection):
+    """
+    Checks an SMTP connection with a NOOP. Backends without a network connection are always usable.
+    """
+    if not hasattr(connection, 'connection'):
+        return True
+    if connection.connection is None:
+        return False
+    try:
+        return connection.connection.noop()[0] == 250
+    except (smtplib.SMTPException, OSError):
+        return False
+
+
+def get_email_connection():
+    """
+    Returns this thread's open email connection, so tokens sent from the same
+    worker share one SMTP session. A connection that has been idle for longer
+    than PASSWORDLESS_EMAIL_CONNECTION_MAX_IDLE seconds is health checked, and
+    replaced if the server has dropped it.
+    """
+    connection = getattr(_local, 'connection', None)
+    if connection is not None and _local.backend != settings.EMAIL_BACKEND:
+        # The email settings were changed, e.g. by a test.
+        close_email_connection()
+        connection = None
+
+    if connection is not None:
+        idle = time.monotonic() - _local.last_used
+        if idle > api_settings.PASSWORDLESS_EMAIL_CONNECTION_MAX_IDLE and not connection_is_usable(connection):
+            close_email_connection()
+            connection = None
+
+    if connection is None:
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        _local.connection = connection
+        _local.backend = settings.EMAIL_BACKEND
+
+    _local.last_used = time.monotonic()
+    return connection
+
+
+def close_email_connection():
+    """
+    Closes this thread's email connection, if it has one.
+    """
+    connection = getattr(_local, 'connection', None)
+    _local.connection = None
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def send_email_messages(messages):
+    """
+    Sends a list of EmailMessages in one go over this thread's email connection,
+    reconnecting once if the server hung up. Returns the number of messages sent.
+    """
+    try:
+        return get_email_connection().send_messages(messages)
+    except (smtplib.SMTPServerDisconnected, ConnectionError):
+        logger.debug("drfpasswordless: Email connection was dropped, reconnecting.")
+        close_email_connection()
+        return get_email_connection().send_messages(messages)
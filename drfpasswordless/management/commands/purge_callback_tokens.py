@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from drfpasswordless.utils import purge_callback_tokens
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired and used callback tokens in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows deleted per statement. Defaults to PASSWORDLESS_PURGE_BATCH_SIZE.')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches. Run again to resume.')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between batches.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the tokens that would be deleted.')
+
+    def handle(self, *args, **options):
+        stats = purge_callback_tokens(batch_size=options['batch_size'],
+                                      dry_run=options['dry_run'],
+                                      max_batches=options['max_batches'],
+                                      pause=options['pause'])
+        if stats['dry_run']:
+            self.stdout.write('%d callback tokens would be deleted.' % stats['deleted'])
+        else:
+            self.stdout.write('Deleted %d callback tokens in %d batches (%.2fs, %.0f rows/s, '
+                              'longest batch %.3fs).' % (stats['deleted'], stats['batches'], stats['elapsed'],
+                                                         stats['rate'], stats['max_batch_time']))
@@ -0,0 +1,198 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from drfpasswordless.settings import resolved_settings
+
+logger = logging.getLogger(__name__)
+
+
+class BaseMetricsBackend(object):
+    """
+    Receives timings and counters from each stage of the token lifecycle.
+
+    Every metric comes with a dict of tags, and the same metric always has the
+    same tag names, e.g. send_token is tagged with alias_type, token_type and
+    outcome. See the README for the full list.
+    """
+
+    def timing(self, name, seconds, tags):
+        """
+        Records how long one run of the named stage took.
+        """
+        raise NotImplementedError
+
+    def increment(self, name, value, tags):
+        """
+        Adds value to the named counter.
+        """
+        raise NotImplementedError
+
+
+class NullMetricsBackend(BaseMetricsBackend):
+    """
+    Discards everything. This is the default.
+    """
+
+    def timing(self, name, seconds, tags):
+        pass
+
+    def increment(self, name, value, tags):
+        pass
+
+
+class LocmemMetricsBackend(BaseMetricsBackend):
+    """
+    Keeps metrics in memory. Meant for tests.
+    """
+
+    def __init__(self):
+        self.timings = []
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self.timings = []
+            self.counters = {}
+
+    def timing(self, name, seconds, tags):
+        with self._lock:
+            self.timings.append((name, seconds, tags))
+
+    def increment(self, name, value, tags):
+        key = (name,) + tuple(sorted(tags.items()))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def count(self, name, **tags):
+        """
+        Counts the timings recorded for name and the counter increments under name
+        whose tags include the given ones.
+        """
+        with self._lock:
+            total = sum(1 for timing in self.timings
+                        if timing[0] == name and tags.items() <= timing[2].items())
+            for key, value in self.counters.items():
+                if key[0] == name and set(tags.items()) <= set(key[1:]):
+                    total += value
+        return total
+
+
+class StatsdMetricsBackend(BaseMetricsBackend):
+    """
+    Sends metrics to StatsD using the statsd package, configured with the
+    STATSD_HOST, STATSD_PORT and STATSD_PREFIX Django settings. Tag values are
+    appended to the metric name in order of their tag names, so send_token is
+    sent as e.g. drfpasswordless.send_token.email.AUTH.success.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self.build_client()
+        return self._client
+
+    def build_client(self):
+        from statsd import StatsClient
+        return StatsClient(getattr(settings, 'STATSD_HOST', 'localhost'),
+                           getattr(settings, 'STATSD_PORT', 8125),
+                           prefix=getattr(settings, 'STATSD_PREFIX', None))
+
+    def metric_name(self, name, tags):
+        return '.'.join(['drfpasswordless', name] + [str(tags[tag]) for tag in sorted(tags)])
+
+    def timing(self, name, seconds, tags):
+        self.client.timing(self.metric_name(name, tags), seconds * 1000)
+
+    def increment(self, name, value, tags):
+        self.client.incr(self.metric_name(name, tags), value)
+
+
+class PrometheusMetricsBackend(BaseMetricsBackend):
+    """
+    Records metrics with prometheus_client in its default registry. Timings
+    become histograms named drfpasswordless_<name>_seconds and counters become
+    drfpasswordless_<name>_total, with the tags as labels. Expose them with
+    prometheus_client's own view or exporter.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def get_metric(self, kind, name, tags):
+        metric = self._metrics.get((kind, name))
+        if metric is None:
+            import prometheus_client
+            with self._lock:
+                metric = self._metrics.get((kind, name))
+                if metric is None:
+                    if kind == 'timing':
+                        metric = prometheus_client.Histogram('drfpasswordless_%s_seconds' % name, name,
+                                                             sorted(tags))
+                    else:
+                        metric = prometheus_client.Counter('drfpasswordless_%s' % name, name, sorted(tags))
+                    self._metrics[(kind, name)] = metric
+        return metric.labels(**tags) if tags else metric
+
+    def timing(self, name, seconds, tags):
+        self.get_metric('timing', name, tags).observe(seconds)
+
+    def increment(self, name, value, tags):
+        self.get_metric('counter', name, tags).inc(value)
+
+
+def get_metrics_backend():
+    """
+    Returns the process-wide instance of the configured metrics backend.
+    """
+    return resolved_settings.instance('PASSWORDLESS_METRICS_BACKEND')
+
+
+def increment(name, value=1, **tags):
+    """
+    Adds value to a counter. Errors in the metrics backend are logged and otherwise ignored.
+    """
+    try:
+        get_metrics_backend().increment(name, value, tags)
+    except Exception as e:
+        logger.debug("drfpasswordless: Couldn't record metric %s." % name)
+        logger.debug(e)
+
+
+class timer(object):
+    """
+    Times the block it wraps and records it under name. Set ``outcome`` on the
+    timer inside the block to say how it went. It's "success" if left unset,
+    or "error" if the block raises.
+
+        with timer('send_token', alias_type='email') as t:
+            t.outcome = 'success' if send() else 'failure'
+    """
+
+    def __init__(self, name, **tags):
+        self.name = name
+        self.tags = tags
+        self.outcome = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        if self.outcome is None:
+            self.outcome = 'error' if exc_type is not None else 'success'
+        try:
+            get_metrics_backend().timing(self.name, elapsed, dict(self.tags, outcome=self.outcome))
+        except Exception as e:
+            logger.debug("drfpasswordless: Couldn't record metric %s." % self.name)
+            logger.debug(e)
+        return False
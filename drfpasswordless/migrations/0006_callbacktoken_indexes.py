@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drfpasswordless', '0005_auto_20201117_0410'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='callbacktoken',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['key'], name='drfpasswordless_active_key'),
+        ),
+        migrations.AddIndex(
+            model_name='callbacktoken',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', 'type'], name='drfpasswordless_active_user'),
+        ),
+        migrations.AddIndex(
+            model_name='callbacktoken',
+            index=models.Index(fields=['created_at'], name='drfpasswordless_created_at'),
+        ),
+    ]
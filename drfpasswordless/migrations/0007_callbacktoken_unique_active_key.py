@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:13
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def deactivate_duplicate_active_keys(apps, schema_editor):
+    """
+    Only the newest active token of each key survives, so the constraint can be added.
+    """
+    CallbackToken = apps.get_model('drfpasswordless', 'CallbackToken')
+    duplicate_keys = (CallbackToken.objects.filter(is_active=True)
+                      .values('key').order_by().annotate(count=Count('id')).filter(count__gt=1)
+                      .values_list('key', flat=True))
+    for key in list(duplicate_keys):
+        tokens = CallbackToken.objects.filter(key=key, is_active=True)
+        newest = tokens.latest('created_at')
+        tokens.exclude(pk=newest.pk).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drfpasswordless', '0006_callbacktoken_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(deactivate_duplicate_active_keys, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='callbacktoken',
+            name='drfpasswordless_active_key',
+        ),
+        migrations.AddConstraint(
+            model_name='callbacktoken',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('key',), name='drfpasswordless_unique_key'),
+        ),
+    ]
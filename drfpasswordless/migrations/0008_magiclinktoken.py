@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:37
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drfpasswordless', '0007_callbacktoken_unique_active_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MagicLinkToken',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('to_alias', models.CharField(blank=True, max_length=254)),
+                ('to_alias_type', models.CharField(blank=True, max_length=20)),
+                ('key_hash', models.CharField(editable=False, max_length=64, unique=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Magic Link Token',
+                'ordering': ['-id'],
+                'get_latest_by': 'created_at',
+                'abstract': False,
+                'indexes': [models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='drfpasswordless_active_link')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:41
+
+import drfpasswordless.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drfpasswordless', '0008_magiclinktoken'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='callbacktoken',
+            options={'get_latest_by': 'created_at', 'ordering': ['-created_at'], 'verbose_name': 'Callback Token'},
+        ),
+        migrations.AlterModelOptions(
+            name='magiclinktoken',
+            options={'get_latest_by': 'created_at', 'ordering': ['-created_at'], 'verbose_name': 'Magic Link Token'},
+        ),
+        migrations.AlterField(
+            model_name='callbacktoken',
+            name='id',
+            field=models.UUIDField(default=drfpasswordless.models.generate_uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='magiclinktoken',
+            name='id',
+            field=models.UUIDField(default=drfpasswordless.models.generate_uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drfpasswordless', '0009_callbacktoken_uuid7'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='magiclinktoken',
+            index=models.Index(fields=['created_at'], name='drfpasswordless_link_created'),
+        ),
+    ]
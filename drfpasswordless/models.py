@@ -1,3 +1,7 @@
+import hashlib
+import os
+import secrets
+import time
 import uuid
 from django.db import models
 from django.conf import settings
@@ -16,6 +20,35 @@ def generate_numeric_token():
     return get_random_string(length=6, allowed_chars=string.digits)
 
 
+def generate_uuid7():
+    """
+    Generate a version 7 UUID, which starts with the current time so that new
+    ids sort after older ones and are inserted at the end of the primary key
+    index. The 12 bits after the millisecond timestamp hold the fraction of
+    the millisecond, the remaining 62 are random.
+    """
+    milliseconds, nanoseconds = divmod(time.time_ns(), 1000000)
+    fraction = nanoseconds * 4096 // 1000000
+    random = int.from_bytes(os.urandom(8), 'big') & 0x3fffffffffffffff
+    return uuid.UUID(int=milliseconds << 80 | 0x7 << 76 | fraction << 64 | 0x2 << 62 | random)
+
+
+def generate_magic_link_key():
+    """
+    Generate a random URL-safe key with 256 bits of entropy.
+    Unlike generate_hex_token's uuid1 these can't be predicted.
+    """
+    return secrets.token_urlsafe(32)
+
+
+def hash_magic_link_key(key):
+    """
+    The SHA-256 hex digest of a magic link key, which is what gets stored.
+    Keys are random enough that they need no salt.
+    """
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
 class CallbackTokenManger(models.Manager):
     def active(self):
         return self.get_queryset().filter(is_active=True)
@@ -34,7 +67,7 @@ class AbstractBaseCallbackToken(models.Model):
     via the pre_save signal in signals.py.
     """
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
+    id = models.UUIDField(primary_key=True, default=generate_uuid7, editable=False, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name=None, on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
@@ -46,7 +79,7 @@ class AbstractBaseCallbackToken(models.Model):
     class Meta:
         abstract = True
         get_latest_by = 'created_at'
-        ordering = ['-id']
+        ordering = ['-created_at']
 
     def __str__(self):
         return str(self.key)
@@ -65,3 +98,41 @@ class CallbackToken(AbstractBaseCallbackToken):
 
     class Meta(AbstractBaseCallbackToken.Meta):
         verbose_name = 'Callback Token'
+        constraints = [
+            # Active keys are unique, which also indexes redemption lookups by key.
+            # New tokens retry with a fresh key when they hit this constraint.
+            models.UniqueConstraint(fields=['key'], condition=models.Q(is_active=True),
+                                    name='drfpasswordless_unique_key'),
+        ]
+        indexes = [
+            # Invalidation of previously issued tokens filters on user and type.
+            models.Index(fields=['user', 'type'], condition=models.Q(is_active=True),
+                         name='drfpasswordless_active_user'),
+            # Expiry checks and purging scan by age.
+            models.Index(fields=['created_at'], name='drfpasswordless_created_at'),
+        ]
+
+
+class MagicLinkToken(AbstractBaseCallbackToken):
+    """
+    A long random key sent to a user's email as a link.
+
+    Only the key's hash is stored, in a unique column, so a link is redeemed
+    with a single indexed lookup. Keys are too long to collide or be guessed,
+    so they're never checked for uniqueness or locked out.
+    """
+    TOKEN_TYPE = 'MAGIC_LINK'
+
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+
+    class Meta(AbstractBaseCallbackToken.Meta):
+        verbose_name = 'Magic Link Token'
+        indexes = [
+            # Invalidation of previously issued links filters on user.
+            models.Index(fields=['user'], condition=models.Q(is_active=True), name='drfpasswordless_active_link'),
+            # Purging scans by age.
+            models.Index(fields=['created_at'], name='drfpasswordless_link_created'),
+        ]
+
+    def __str__(self):
+        return self.key_hash[:12]
@@ -0,0 +1,115 @@
+import threading
+import time
+import uuid
+from django.template import loader
+from django.template.base import Template, Variable, VariableNode
+from django.utils import translation
+from django.utils.html import escape
+from drfpasswordless.settings import api_settings
+
+
+class TemplateRenderCache(object):
+    """
+    Renders token email templates without redoing the same work for every token.
+
+    A template is rendered once with a placeholder in place of the token and
+    the output is kept split around it, so each message only costs joining the
+    pieces with its token. The output is reused for as long as the context
+    processors return the same context. Their output can itself be kept for
+    PASSWORDLESS_CONTEXT_PROCESSORS_CACHE_TTL seconds instead of calling them
+    for every message.
+
+    Templates that alter the token, e.g. with a filter, are detected and
+    rendered in full for every message, as are tokens that would need escaping,
+    such as magic links.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._renders = {}
+            self._context = None
+            self.hits = 0
+            self.misses = 0
+
+    def get_context(self):
+        """
+        The context processors' output, memoized for PASSWORDLESS_CONTEXT_PROCESSORS_CACHE_TTL seconds.
+        """
+        processors = tuple(api_settings.PASSWORDLESS_CONTEXT_PROCESSORS)
+        ttl = api_settings.PASSWORDLESS_CONTEXT_PROCESSORS_CACHE_TTL
+        cached = self._context
+        if ttl and cached is not None and cached[0] == processors and cached[1] > time.monotonic():
+            return cached[2]
+
+        context = {}
+        for processor in processors:
+            context.update(processor())
+        self._context = (processors, time.monotonic() + ttl, context)
+        return context
+
+    def render(self, template_name, token):
+        context = self.get_context()
+        # Templates may be translated, so each language gets its own render.
+        cache_key = (template_name, translation.get_language())
+        entry = self._renders.get(cache_key)
+        if entry is not None and entry[0] == context:
+            with self._lock:
+                self.hits += 1
+            parts = entry[1]
+        else:
+            with self._lock:
+                self.misses += 1
+            parts = self._split(template_name, context)
+            self._renders[cache_key] = (context, parts)
+
+        # The pieces are joined without escaping, which only suits tokens that escaping leaves alone.
+        if parts is None or escape(token) != token:
+            return loader.render_to_string(template_name, dict({'callback_token': token}, **context))
+        return token.join(parts)
+
+    def _split(self, template_name, context):
+        """
+        Renders the template around a placeholder token. Returns None if the
+        template doesn't output the token as it is given.
+        """
+        template = loader.get_template(template_name)
+        if not uses_token_unchanged(template):
+            return None
+        # The placeholders differ in length and characters, so filters such
+        # as length or first can't render them the same way.
+        placeholder, check = uuid.uuid4().hex, 'TOKEN-%d' % uuid.uuid4().int
+        output = template.render(dict({'callback_token': placeholder}, **context))
+        if output.replace(placeholder, check) != template.render(dict({'callback_token': check}, **context)):
+            return None
+        return output.split(placeholder)
+
+
+def uses_token_unchanged(template):
+    """
+    Whether a Django template only outputs callback_token as a bare variable,
+    without filters or lookups on it. Templates from other engines can't be
+    inspected and are only checked by rendering them.
+    """
+    compiled = getattr(template, 'template', None)
+    if not isinstance(compiled, Template):
+        return True
+    for node in compiled.nodelist.get_nodes_by_type(VariableNode):
+        var = node.filter_expression.var
+        if isinstance(var, Variable) and var.lookups and var.lookups[0] == 'callback_token' \
+                and (len(var.lookups) > 1 or node.filter_expression.filters):
+            return False
+    return True
+
+
+template_cache = TemplateRenderCache()
+
+
+def render_token_template(template_name, token):
+    """
+    Renders a token email template for the given token key through the shared render cache.
+    """
+    return template_cache.render(template_name, token)
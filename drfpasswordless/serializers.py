@@ -5,9 +5,17 @@ from django.core.exceptions import PermissionDenied
 from django.core.validators import RegexValidator
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from drfpasswordless.aliases import alias_lookup, normalize_alias
+from drfpasswordless.metrics import timer
 from drfpasswordless.models import CallbackToken
 from drfpasswordless.settings import api_settings
-from drfpasswordless.utils import verify_user_alias, validate_token_age
+from drfpasswordless.utils import (
+    consume_callback_token,
+    consume_magic_link_token,
+    get_or_register_user,
+    verify_user_alias,
+    validate_token_age,
+)
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -36,25 +44,26 @@ class AbstractBaseAliasAuthenticationSerializer(serializers.Serializer):
 
     def validate(self, attrs):
         alias = attrs.get(self.alias_type)
+        if api_settings.PASSWORDLESS_NORMALIZE_ALIASES is True:
+            alias = normalize_alias(self.alias_type, alias)
 
         if alias:
             # Create or authenticate a user
             # Return THem
 
-            if api_settings.PASSWORDLESS_REGISTER_NEW_USERS is True:
-                # If new aliases should register new users.
-                try:
-                    user = User.objects.get(**{self.alias_type+'__iexact': alias})
-                except User.DoesNotExist:
-                    user = User.objects.create(**{self.alias_type: alias})
-                    user.set_unusable_password()
-                    user.save()
-            else:
-                # If new aliases should not register new users.
-                try:
-                    user = User.objects.get(**{self.alias_type+'__iexact': alias})
-                except User.DoesNotExist:
-                    user = None
+            with timer('user_lookup', alias_type=self.alias_type) as t:
+                if api_settings.PASSWORDLESS_REGISTER_NEW_USERS is True:
+                    # If new aliases should register new users.
+                    user, created = get_or_register_user(self.alias_type, alias)
+                    t.outcome = 'registered' if created else 'found'
+                else:
+                    # If new aliases should not register new users.
+                    try:
+                        user = User.objects.get(**alias_lookup(self.alias_type, alias))
+                        t.outcome = 'found'
+                    except User.DoesNotExist:
+                        user = None
+                        t.outcome = 'missing'
 
             if user:
                 if not user.is_active:
@@ -175,7 +184,7 @@ class AbstractBaseCallbackTokenSerializer(serializers.Serializer):
 
     email = serializers.EmailField(required=False)  # Needs to be required=false to require both.
     mobile = serializers.CharField(required=False, validators=[phone_regex], max_length=17)
-    token = TokenField(min_length=6, max_length=6, validators=[token_age_validator])
+    token = TokenField(min_length=6, max_length=6)
 
     def validate_alias(self, attrs):
         email = attrs.get('email', None)
@@ -202,41 +211,30 @@ class CallbackTokenAuthSerializer(AbstractBaseCallbackTokenSerializer):
         try:
             alias_type, alias = self.validate_alias(attrs)
             callback_token = attrs.get('token', None)
-            user = User.objects.get(**{alias_type+'__iexact': alias})
-            token = CallbackToken.objects.get(**{'user': user,
-                                                 'key': callback_token,
-                                                 'type': CallbackToken.TOKEN_TYPE_AUTH,
-                                                 'is_active': True})
-
-            if token.user == user:
-                # Check the token type for our uni-auth method.
-                # authenticates and checks the expiry of the callback token.
-                if not user.is_active:
-                    msg = _('User account is disabled.')
-                    raise serializers.ValidationError(msg)
 
-                if api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED \
-                        or api_settings.PASSWORDLESS_USER_MARK_MOBILE_VERIFIED:
-                    # Mark this alias as verified
-                    user = User.objects.get(pk=token.user.pk)
-                    success = verify_user_alias(user, token)
+            # Fetches the user with the token, checks the expiry and uses it up.
+            token = consume_callback_token(callback_token, CallbackToken.TOKEN_TYPE_AUTH, alias_type, alias)
+            if token is None:
+                msg = _('Invalid Token')
+                raise serializers.ValidationError(msg)
 
-                    if success is False:
-                        msg = _('Error validating user alias.')
-                        raise serializers.ValidationError(msg)
+            user = token.user
+            if not user.is_active:
+                msg = _('User account is disabled.')
+                raise serializers.ValidationError(msg)
 
-                attrs['user'] = user
-                return attrs
+            if api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED \
+                    or api_settings.PASSWORDLESS_USER_MARK_MOBILE_VERIFIED:
+                # Mark this alias as verified
+                success = verify_user_alias(user, token)
+
+                if success is False:
+                    msg = _('Error validating user alias.')
+                    raise serializers.ValidationError(msg)
+
+            attrs['user'] = user
+            return attrs
 
-            else:
-                msg = _('Invalid Token')
-                raise serializers.ValidationError(msg)
-        except CallbackToken.DoesNotExist:
-            msg = _('Invalid alias parameters provided.')
-            raise serializers.ValidationError(msg)
-        except User.DoesNotExist:
-            msg = _('Invalid user alias parameters provided.')
-            raise serializers.ValidationError(msg)
         except ValidationError:
             msg = _('Invalid alias parameters provided.')
             raise serializers.ValidationError(msg)
@@ -252,16 +250,16 @@ class CallbackTokenVerificationSerializer(AbstractBaseCallbackTokenSerializer):
         try:
             alias_type, alias = self.validate_alias(attrs)
             user_id = self.context.get("user_id")
-            user = User.objects.get(**{'id': user_id, alias_type+'__iexact': alias})
             callback_token = attrs.get('token', None)
 
-            token = CallbackToken.objects.get(**{'user': user,
-                                                 'key': callback_token,
-                                                 'type': CallbackToken.TOKEN_TYPE_VERIFY,
-                                                 'is_active': True})
+            token = None
+            if user_id is not None:
+                token = consume_callback_token(callback_token, CallbackToken.TOKEN_TYPE_VERIFY, alias_type, alias,
+                                               user_id=user_id)
 
-            if token.user == user:
+            if token is not None:
                 # Mark this alias as verified
+                user = token.user
                 success = verify_user_alias(user, token)
                 if success is False:
                     logger.debug("drfpasswordless: Error verifying alias.")
@@ -269,17 +267,9 @@ class CallbackTokenVerificationSerializer(AbstractBaseCallbackTokenSerializer):
                 attrs['user'] = user
                 return attrs
             else:
-                msg = _('This token is invalid. Try again later.')
-                logger.debug("drfpasswordless: User token mismatch when verifying alias.")
+                msg = _('We could not verify this alias.')
+                logger.debug("drfpasswordless: Tried to validate alias with bad token or user.")
 
-        except CallbackToken.DoesNotExist:
-            msg = _('We could not verify this alias.')
-            logger.debug("drfpasswordless: Tried to validate alias with bad token.")
-            pass
-        except User.DoesNotExist:
-            msg = _('We could not verify this alias.')
-            logger.debug("drfpasswordless: Tried to validate alias with bad user.")
-            pass
         except PermissionDenied:
             msg = _('Insufficient permissions.')
             logger.debug("drfpasswordless: Permission denied while validating alias.")
@@ -288,6 +278,31 @@ class CallbackTokenVerificationSerializer(AbstractBaseCallbackTokenSerializer):
         raise serializers.ValidationError(msg)
 
 
+class MagicLinkAuthSerializer(serializers.Serializer):
+    """
+    Redeems a magic link token by its key alone.
+    """
+    token = serializers.CharField(max_length=64)
+
+    def validate(self, attrs):
+        msg = _('Invalid or expired link.')
+        token = consume_magic_link_token(attrs['token'])
+        if token is None:
+            raise serializers.ValidationError(msg)
+
+        user = token.user
+        if not user.is_active:
+            raise serializers.ValidationError(_('User account is disabled.'))
+
+        if api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED:
+            # Following the link proves the email is theirs.
+            if verify_user_alias(user, token) is False:
+                raise serializers.ValidationError(msg)
+
+        attrs['user'] = user
+        return attrs
+
+
 """
 Responses
 """
@@ -301,3 +316,10 @@ class TokenResponseSerializer(serializers.Serializer):
     key = serializers.CharField(write_only=True)
 
 
+class SignedTokenResponseSerializer(TokenResponseSerializer):
+    """
+    Response serializer for create_signed_authentication_token, which also says when the token expires.
+    """
+    expires_at = serializers.DateTimeField()
+
+
@@ -1,22 +1,95 @@
-from django.utils.module_loading import import_string
+import logging
+from asgiref.sync import sync_to_async
+from itertools import islice
+from django.db.models import QuerySet
+from drfpasswordless.delivery import Delivery, get_delivery_backend
+from drfpasswordless.demo import demo_tokens
+from drfpasswordless.metrics import timer
+from drfpasswordless.models import MagicLinkToken
 from drfpasswordless.settings import api_settings
 from drfpasswordless.utils import (
+    MagicLink,
     create_callback_token_for_user,
+    create_callback_tokens_for_users,
+    create_magic_link_token_for_user,
 )
 
+logger = logging.getLogger(__name__)
+
 
 class TokenService(object):
     @staticmethod
     def send_token(user, alias_type, token_type, **message_payload):
-        token = create_callback_token_for_user(user, alias_type, token_type)
-        send_action = None
-
-        if user.pk in api_settings.PASSWORDLESS_DEMO_USERS.keys():
-            return True
-        if alias_type == 'email':
-            send_action = import_string(api_settings.PASSWORDLESS_EMAIL_CALLBACK)
-        elif alias_type == 'mobile':
-            send_action = import_string(api_settings.PASSWORDLESS_SMS_CALLBACK)
-        # Send to alias
-        success = send_action(user, token, **message_payload)
-        return success
+        with timer('send_token', alias_type=alias_type, token_type=token_type) as t:
+            if demo_tokens.is_demo_user(user.pk):
+                # Demo users already know their pin.
+                t.outcome = 'demo'
+                return True
+
+            token = create_callback_token_for_user(user, alias_type, token_type)
+            # Send to alias
+            success = get_delivery_backend().send(user, token, alias_type, **message_payload)
+            t.outcome = 'success' if success else 'failure'
+            return success
+
+    @staticmethod
+    async def asend_token(user, alias_type, token_type, **message_payload):
+        """
+        Async version of send_token. Creating the token needs a transaction,
+        which the async ORM doesn't offer, so that part runs in a thread.
+        """
+        with timer('send_token', alias_type=alias_type, token_type=token_type) as t:
+            if demo_tokens.is_demo_user(user.pk):
+                t.outcome = 'demo'
+                return True
+
+            token = await sync_to_async(create_callback_token_for_user)(user, alias_type, token_type)
+            success = await get_delivery_backend().asend(user, token, alias_type, **message_payload)
+            t.outcome = 'success' if success else 'failure'
+            return success
+
+    @staticmethod
+    def send_magic_link(user, **message_payload):
+        """
+        Issues a magic link token and emails its link, built from PASSWORDLESS_MAGIC_LINK_URL.
+        """
+        with timer('send_token', alias_type='email', token_type=MagicLinkToken.TOKEN_TYPE) as t:
+            if not api_settings.PASSWORDLESS_MAGIC_LINK_URL:
+                logger.debug("Failed to send magic link. Missing PASSWORDLESS_MAGIC_LINK_URL.")
+                t.outcome = 'failure'
+                return False
+
+            token, key = create_magic_link_token_for_user(user)
+            link = MagicLink(token, api_settings.PASSWORDLESS_MAGIC_LINK_URL % key)
+            success = get_delivery_backend().send(user, link, 'email', **message_payload)
+            t.outcome = 'success' if success else 'failure'
+            return success
+
+    @staticmethod
+    def send_bulk_tokens(users, alias_type, token_type, batch_size=None, **message_payload):
+        """
+        Issues and sends tokens to many users at once, e.g. for verification campaigns.
+        Users are handled batch_size at a time with a fixed number of queries per batch.
+
+        Returns a dictionary with the number of tokens issued, the number of
+        batches the delivery backend failed to send and the tokens in them.
+        """
+        batch_size = batch_size or api_settings.PASSWORDLESS_BULK_BATCH_SIZE
+        if isinstance(users, QuerySet):
+            users = users.iterator(chunk_size=batch_size)
+        users = iter(users)
+
+        stats = {'issued': 0, 'failed_batches': 0, 'undelivered': 0}
+        backend = get_delivery_backend()
+        while True:
+            batch = list(islice(users, batch_size))
+            if not batch:
+                break
+            tokens = create_callback_tokens_for_users(batch, alias_type, token_type)
+            stats['issued'] += len(tokens)
+            if tokens and not backend.send_many([Delivery(token.user, token, alias_type, message_payload)
+                                                 for token in tokens]):
+                logger.warning("drfpasswordless: Failed to deliver a batch of %d tokens." % len(tokens))
+                stats['failed_batches'] += 1
+                stats['undelivered'] += len(tokens)
+        return stats
@@ -1,4 +1,8 @@
+import threading
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
 from rest_framework.settings import APISettings
 
 USER_SETTINGS = getattr(settings, 'PASSWORDLESS_AUTH', None)
@@ -17,6 +21,10 @@ DEFAULTS = {
     # Amount of time that tokens last, in seconds
     'PASSWORDLESS_TOKEN_EXPIRE_TIME': 15 * 60,
 
+    # Requesting a token again within this many seconds of the last one resends
+    # that token instead of issuing a new one. 0 always issues a new token.
+    'PASSWORDLESS_TOKEN_REUSE_WINDOW': 0,
+
     # The user's email field name
     'PASSWORDLESS_USER_EMAIL_FIELD_NAME': 'email',
 
@@ -33,6 +41,10 @@ DEFAULTS = {
     'PASSWORDLESS_USER_MARK_MOBILE_VERIFIED': False,
     'PASSWORDLESS_USER_MOBILE_VERIFIED_FIELD_NAME': 'mobile_verified',
 
+    # Stores and looks up aliases in a canonical form (lowercase emails, E.164 mobile numbers)
+    # so lookups are exact matches that can use the alias column's index.
+    'PASSWORDLESS_NORMALIZE_ALIASES': False,
+
     # The email the callback token is sent from
     'PASSWORDLESS_EMAIL_NOREPLY_ADDRESS': None,
 
@@ -60,6 +72,10 @@ DEFAULTS = {
     # Context Processors for Email Template
     'PASSWORDLESS_CONTEXT_PROCESSORS': [],
 
+    # Seconds to reuse the context processors' output for instead of calling them for every
+    # email. 0 calls them every time.
+    'PASSWORDLESS_CONTEXT_PROCESSORS_CACHE_TTL': 0,
+
     # The verification email subject
     'PASSWORDLESS_EMAIL_VERIFICATION_SUBJECT': "Your Verification Token",
 
@@ -75,6 +91,16 @@ DEFAULTS = {
     # Automatically send verification email or sms when a user changes their alias.
     'PASSWORDLESS_AUTO_SEND_VERIFICATION_TOKEN': False,
 
+    # The link magic link emails point to, with %s standing in for the key, e.g.
+    # 'https://example.com/login/?token=%s'. Magic links can't be sent until it's set.
+    'PASSWORDLESS_MAGIC_LINK_URL': None,
+
+    # Subject, plaintext message and HTML template of magic link emails. %s and
+    # {{ callback_token }} stand in for the link.
+    'PASSWORDLESS_MAGIC_LINK_EMAIL_SUBJECT': "Your Login Link",
+    'PASSWORDLESS_MAGIC_LINK_EMAIL_PLAINTEXT_MESSAGE': "Follow this link to sign in: %s",
+    'PASSWORDLESS_MAGIC_LINK_EMAIL_HTML_TEMPLATE_NAME': "passwordless_default_magic_link_email.html",
+
     # What function is called to construct an authentication tokens when
     # exchanging a passwordless token for a real user auth token.
     'PASSWORDLESS_AUTH_TOKEN_CREATOR': 'drfpasswordless.utils.create_authentication_token',
@@ -83,13 +109,70 @@ DEFAULTS = {
     # exchanging a passwordless token for a real user auth token.
     'PASSWORDLESS_AUTH_TOKEN_SERIALIZER': 'drfpasswordless.serializers.TokenResponseSerializer',
 
-    # A dictionary of demo user's primary key mapped to their static pin
+    # How long in seconds the signed auth tokens of
+    # drfpasswordless.utils.create_signed_authentication_token are accepted for.
+    'PASSWORDLESS_SIGNED_AUTH_TOKEN_MAX_AGE': 60 * 60 * 24 * 14,
+
+    # A dictionary of demo user's primary key mapped to their static pin.
+    # Demo pins are checked in memory, never stored, and never expire.
     'PASSWORDLESS_DEMO_USERS': {},
     'PASSWORDLESS_EMAIL_CALLBACK': 'drfpasswordless.utils.send_email_with_callback_token',
     'PASSWORDLESS_SMS_CALLBACK': 'drfpasswordless.utils.send_sms_with_callback_token',
 
+    # Token emails are sent over a connection kept open per thread. A connection that has
+    # been idle for longer than this many seconds is checked before it's reused.
+    'PASSWORDLESS_EMAIL_CONNECTION_MAX_IDLE': 30,
+
+    # The provider the default SMS callback sends texts through.
+    'PASSWORDLESS_SMS_PROVIDER': 'drfpasswordless.sms.TwilioSMSProvider',
+
+    # Rates for the token request throttles, keyed by scope: requests per alias, per
+    # IP address and per authenticated user. Set a scope to None to turn it off.
+    'PASSWORDLESS_THROTTLE_RATES': {
+        'alias': '10/hour',
+        'ip': '100/hour',
+        'user': '10/hour',
+    },
+
+    # Number of wrong tokens that may be tried for an alias before its token is
+    # invalidated and further attempts are refused until a new one is issued.
+    # None turns the lockout off.
+    'PASSWORDLESS_TOKEN_MAX_ATTEMPTS': 5,
+
+    # Minimum number of seconds between two tokens sent to the same alias. 0 turns it off.
+    'PASSWORDLESS_RESEND_COOLDOWN': 0,
+
+    # The cache the throttles keep their counters in.
+    'PASSWORDLESS_THROTTLE_CACHE_ALIAS': 'default',
+
     # Token Generation Retry Count
-    'PASSWORDLESS_TOKEN_GENERATION_ATTEMPTS': 3
+    'PASSWORDLESS_TOKEN_GENERATION_ATTEMPTS': 3,
+
+    # Number of expired or used tokens deleted per statement when purging.
+    'PASSWORDLESS_PURGE_BATCH_SIZE': 1000,
+
+    # Number of users handled per batch by TokenService.send_bulk_tokens.
+    'PASSWORDLESS_BULK_BATCH_SIZE': 500,
+
+    # Where callback tokens are kept. ModelTokenStore uses the CallbackToken table,
+    # CacheTokenStore uses the cache named by PASSWORDLESS_TOKEN_CACHE_ALIAS.
+    'PASSWORDLESS_TOKEN_STORE': 'drfpasswordless.stores.ModelTokenStore',
+    'PASSWORDLESS_TOKEN_CACHE_ALIAS': 'default',
+
+    # Backend that hands tokens to the email and sms callbacks. SyncDeliveryBackend
+    # sends inline, QueuedDeliveryBackend sends from background threads.
+    'PASSWORDLESS_DELIVERY_BACKEND': 'drfpasswordless.delivery.SyncDeliveryBackend',
+
+    # Worker threads draining the QueuedDeliveryBackend outbox, and how many sends each takes at a time.
+    'PASSWORDLESS_DELIVERY_WORKERS': 2,
+    'PASSWORDLESS_DELIVERY_BATCH_SIZE': 100,
+
+    # Failed queued sends are retried, doubling the delay (in seconds) each time.
+    'PASSWORDLESS_DELIVERY_MAX_RETRIES': 3,
+    'PASSWORDLESS_DELIVERY_RETRY_DELAY': 1,
+
+    # Where timings and counters from each stage of the token lifecycle are sent.
+    'PASSWORDLESS_METRICS_BACKEND': 'drfpasswordless.metrics.NullMetricsBackend',
 }
 
 # List of settings that may be in string import notation.
@@ -99,3 +182,90 @@ IMPORT_STRINGS = (
 )
 
 api_settings = APISettings(USER_SETTINGS, DEFAULTS, IMPORT_STRINGS)
+
+# Settings naming an object by dotted path that resolved_settings imports.
+RESOLVED_SETTINGS = (
+    'PASSWORDLESS_EMAIL_CALLBACK',
+    'PASSWORDLESS_SMS_CALLBACK',
+    'PASSWORDLESS_AUTH_TOKEN_CREATOR',
+    'PASSWORDLESS_AUTH_TOKEN_SERIALIZER',
+    'PASSWORDLESS_TOKEN_STORE',
+    'PASSWORDLESS_DELIVERY_BACKEND',
+    'PASSWORDLESS_SMS_PROVIDER',
+    'PASSWORDLESS_METRICS_BACKEND',
+)
+
+
+class ResolvedSettings(object):
+    """
+    The objects that dotted path settings point to, imported once.
+
+    Look them up as attributes, e.g. resolved_settings.PASSWORDLESS_EMAIL_CALLBACK.
+    Imports are cached by path, so a setting changed at runtime resolves to
+    its new object. All of them are imported when the app is ready, so a
+    typo in a path fails at startup rather than on the first login.
+    """
+
+    def __init__(self):
+        self._resolved = {}
+        self._instances = {}
+        self._instances_lock = threading.Lock()
+
+    def __getattr__(self, setting):
+        if setting not in RESOLVED_SETTINGS:
+            raise AttributeError("Invalid resolved setting: '%s'" % setting)
+
+        path = getattr(api_settings, setting)
+        if not isinstance(path, str):
+            return path
+        try:
+            return self._resolved[path]
+        except KeyError:
+            pass
+
+        try:
+            resolved = import_string(path)
+        except ImportError as e:
+            raise ImproperlyConfigured("Could not import '%s' for PASSWORDLESS_AUTH setting '%s'. %s"
+                                       % (path, setting, e))
+        if not callable(resolved):
+            raise ImproperlyConfigured("PASSWORDLESS_AUTH setting '%s' should point to a callable or class, "
+                                       "'%s' isn't one." % (setting, path))
+        self._resolved[path] = resolved
+        return resolved
+
+    def instance(self, setting):
+        """
+        Returns the process-wide instance of the class a setting points to,
+        creating it on first use. Instances are kept by path, so switching a
+        setting back returns the instance it had before.
+        """
+        path = getattr(api_settings, setting)
+        instance = self._instances.get(path)
+        if instance is None:
+            with self._instances_lock:
+                instance = self._instances.get(path)
+                if instance is None:
+                    instance = self._instances[path] = getattr(self, setting)()
+        return instance
+
+    def validate(self):
+        for setting in RESOLVED_SETTINGS:
+            getattr(self, setting)
+
+    def clear(self):
+        # Instances are kept, as they may hold state such as queued deliveries.
+        self._resolved = {}
+
+
+resolved_settings = ResolvedSettings()
+
+
+def reload_api_settings(*args, **kwargs):
+    if kwargs['setting'] == 'PASSWORDLESS_AUTH':
+        api_settings.reload()
+        api_settings._user_settings = kwargs['value'] or {}
+        resolved_settings.clear()
+
+
+setting_changed.connect(reload_api_settings)
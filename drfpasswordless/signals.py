@@ -1,8 +1,10 @@
 import logging
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.db import connections
 from django.dispatch import receiver
 from django.db.models import signals
+from drfpasswordless.aliases import normalize_alias
 from drfpasswordless.models import CallbackToken
 from drfpasswordless.models import generate_numeric_token
 from drfpasswordless.settings import api_settings
@@ -17,20 +19,24 @@ def invalidate_previous_tokens(sender, instance, created, **kwargs):
     Invalidates all previously issued tokens of that type when a new one is created, used, or anything like that.
     """
 
-    if instance.user.pk in api_settings.PASSWORDLESS_DEMO_USERS.keys():
-        return
-
     if isinstance(instance, CallbackToken):
         CallbackToken.objects.active().filter(user=instance.user, type=instance.type).exclude(id=instance.id).update(is_active=False)
 
 
 @receiver(signals.pre_save, sender=CallbackToken)
-def check_unique_tokens(sender, instance, **kwargs):
+def check_unique_tokens(sender, instance, using=None, **kwargs):
     """
     Ensures that mobile and email tokens are unique or tries once more to generate.
     Note that here we've decided keys are unique even across auth and validation.
     We could consider relaxing this in the future as well by filtering on the instance.type.
+
+    Databases with partial index support enforce this with a unique constraint on
+    active keys instead, and save_with_unique_key retries on conflict, so the
+    check only runs elsewhere.
     """
+    if connections[using or 'default'].features.supports_partial_indexes:
+        return
+
     if instance._state.adding:
         # save is called on a token to create it in the db
         # before creating check whether a token with the same key exists
@@ -69,30 +75,95 @@ def check_unique_tokens(sender, instance, **kwargs):
 User = get_user_model()
 
 
+def snapshot_aliases(instance, update_fields=None):
+    """
+    Records the alias values a user instance currently holds.
+    Deferred fields are left out so taking the snapshot never queries.
+    """
+    snapshot = getattr(instance, '_passwordless_aliases', {})
+    for field in (api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME, api_settings.PASSWORDLESS_USER_MOBILE_FIELD_NAME):
+        if field in instance.__dict__ and (update_fields is None or field in update_fields):
+            snapshot[field] = instance.__dict__[field]
+    instance._passwordless_aliases = snapshot
+
+
+def get_saved_alias(instance, field):
+    """
+    Returns the value of an alias field as it is stored in the database.
+    Raises User.DoesNotExist for unsaved users.
+
+    The snapshot taken when the instance was loaded or last saved only proves
+    that the alias is unchanged, without a query. It can be stale after
+    refresh_from_db() or an UPDATE made elsewhere, so an alias that differs
+    from it is checked against the database.
+    """
+    snapshot = getattr(instance, '_passwordless_aliases', {})
+    if not instance._state.adding and field in snapshot and snapshot[field] == instance.__dict__.get(field):
+        return snapshot[field]
+    return getattr(User.objects.get(id=instance.id), field)
+
+
+@receiver(signals.post_init, sender=User)
+def track_aliases_on_load(sender, instance, **kwargs):
+    snapshot_aliases(instance)
+
+
+@receiver(signals.post_save, sender=User)
+def track_aliases_on_save(sender, instance, update_fields=None, **kwargs):
+    snapshot_aliases(instance, update_fields)
+
+
+@receiver(signals.pre_save, sender=User)
+def normalize_user_aliases(sender, instance, update_fields=None, **kwargs):
+    """
+    Stores aliases in their canonical form so they can be looked up with an exact match.
+    """
+    if api_settings.PASSWORDLESS_NORMALIZE_ALIASES is True:
+        for alias_type, field in (('email', api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME),
+                                  ('mobile', api_settings.PASSWORDLESS_USER_MOBILE_FIELD_NAME)):
+            if field in instance.__dict__ and (update_fields is None or field in update_fields):
+                setattr(instance, field, normalize_alias(alias_type, instance.__dict__[field]))
+
+
+def alias_changed(alias_type, alias, saved_alias):
+    """
+    Whether an alias differs from the saved one. With PASSWORDLESS_NORMALIZE_ALIASES,
+    aliases that only differ in formatting, such as a saved alias that predates
+    the setting, count as unchanged.
+    """
+    if api_settings.PASSWORDLESS_NORMALIZE_ALIASES is True:
+        return normalize_alias(alias_type, alias) != normalize_alias(alias_type, saved_alias)
+    return alias != saved_alias
+
+
 @receiver(signals.pre_save, sender=User)
-def update_alias_verification(sender, instance, **kwargs):
+def update_alias_verification(sender, instance, update_fields=None, **kwargs):
     """
     Flags a user's email as unverified if they change it.
     Optionally sends a verification token to the new endpoint.
+
+    Compares against the alias values the user was loaded with, so saving a
+    user whose aliases didn't change costs no extra queries.
     """
     if isinstance(instance, User):
 
         if instance.id:
 
-            if api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED is True:
+            email_field = api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME
+            if api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED is True \
+                    and (update_fields is None or email_field in update_fields):
                 """
                 For marking email aliases as not verified when a user changes it.
                 """
-                email_field = api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME
                 email_verified_field = api_settings.PASSWORDLESS_USER_EMAIL_VERIFIED_FIELD_NAME
 
                 # Verify that this is an existing instance and not a new one.
                 try:
-                    user_old = User.objects.get(id=instance.id)  # Pre-save object
                     instance_email = getattr(instance, email_field)  # Incoming Email
-                    old_email = getattr(user_old, email_field)  # Pre-save object email
+                    old_email = get_saved_alias(instance, email_field)  # Pre-save object email
 
-                    if instance_email != old_email and instance_email != "" and instance_email is not None:
+                    if alias_changed('email', instance_email, old_email) \
+                            and instance_email != "" and instance_email is not None:
                         # Email changed, verification should be flagged
                         setattr(instance, email_verified_field, False)
                         if api_settings.PASSWORDLESS_AUTO_SEND_VERIFICATION_TOKEN is True:
@@ -115,20 +186,21 @@ def update_alias_verification(sender, instance, **kwargs):
                     # User probably is just initially being created
                     return
 
-            if api_settings.PASSWORDLESS_USER_MARK_MOBILE_VERIFIED is True:
+            mobile_field = api_settings.PASSWORDLESS_USER_MOBILE_FIELD_NAME
+            if api_settings.PASSWORDLESS_USER_MARK_MOBILE_VERIFIED is True \
+                    and (update_fields is None or mobile_field in update_fields):
                 """
                 For marking mobile aliases as not verified when a user changes it.
                 """
-                mobile_field = api_settings.PASSWORDLESS_USER_MOBILE_FIELD_NAME
                 mobile_verified_field = api_settings.PASSWORDLESS_USER_MOBILE_VERIFIED_FIELD_NAME
 
                 # Verify that this is an existing instance and not a new one.
                 try:
-                    user_old = User.objects.get(id=instance.id)  # Pre-save object
                     instance_mobile = getattr(instance, mobile_field)  # Incoming mobile
-                    old_mobile = getattr(user_old, mobile_field)  # Pre-save object mobile
+                    old_mobile = get_saved_alias(instance, mobile_field)  # Pre-save object mobile
 
-                    if instance_mobile != old_mobile and instance_mobile != "" and instance_mobile is not None:
+                    if alias_changed('mobile', instance_mobile, old_mobile) \
+                            and instance_mobile != "" and instance_mobile is not None:
                         # Mobile changed, verification should be flagged
                         setattr(instance, mobile_verified_field, False)
                         if api_settings.PASSWORDLESS_AUTO_SEND_VERIFICATION_TOKEN is True:
@@ -0,0 +1,77 @@
+import logging
+import os
+import threading
+from drfpasswordless.settings import api_settings, resolved_settings
+
+logger = logging.getLogger(__name__)
+
+
+class BaseSMSProvider(object):
+    """
+    Sends text messages from PASSWORDLESS_MOBILE_NOREPLY_NUMBER.
+    """
+
+    def send(self, to, body):
+        """
+        Sends a single message. Returns True on success.
+        """
+        raise NotImplementedError
+
+    def send_many(self, messages):
+        """
+        Sends a list of (to, body) pairs. Returns a list of results in the same order.
+        """
+        return [self.send(to, body) for to, body in messages]
+
+
+class TwilioSMSProvider(BaseSMSProvider):
+    """
+    Sends messages through Twilio using the TWILIO_ACCOUNT_SID and
+    TWILIO_AUTH_TOKEN environment variables.
+
+    The client is built on first use and then shared by every thread, so
+    messages go out over its pooled keep-alive connections instead of a new
+    TLS connection each.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self.build_client()
+        return self._client
+
+    def build_client(self):
+        from twilio.http.http_client import TwilioHttpClient
+        from twilio.rest import Client
+        return Client(os.environ['TWILIO_ACCOUNT_SID'], os.environ['TWILIO_AUTH_TOKEN'],
+                      http_client=TwilioHttpClient(pool_connections=True))
+
+    def send(self, to, body):
+        self.client.messages.create(body=body, to=to, from_=api_settings.PASSWORDLESS_MOBILE_NOREPLY_NUMBER)
+        return True
+
+
+class LocmemSMSProvider(BaseSMSProvider):
+    """
+    Keeps messages in memory instead of sending them. Meant for tests.
+    """
+
+    def __init__(self):
+        self.outbox = []
+
+    def send(self, to, body):
+        self.outbox.append((to, body))
+        return True
+
+
+def get_sms_provider():
+    """
+    Returns the process-wide instance of the configured SMS provider.
+    """
+    return resolved_settings.instance('PASSWORDLESS_SMS_PROVIDER')
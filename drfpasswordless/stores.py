@@ -0,0 +1,524 @@
+import logging
+import time
+from asgiref.sync import sync_to_async
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from drfpasswordless.aliases import alias_lookup
+from drfpasswordless.metrics import increment
+from drfpasswordless.models import CallbackToken, generate_numeric_token
+from drfpasswordless.settings import api_settings, resolved_settings
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+def save_with_unique_key(token):
+    """
+    Inserts a new token, drawing a fresh key whenever its key is already taken
+    by another active token. The database's unique constraint on active keys
+    does the checking, so an insert that doesn't collide is the only query.
+    Other integrity errors, such as a user deleted in the meantime, are raised.
+    """
+    for tries in range(api_settings.PASSWORDLESS_TOKEN_GENERATION_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                token.save(force_insert=True)
+            return token
+        except IntegrityError:
+            # Backends word the error differently, so check that the key is what clashed.
+            if not CallbackToken.objects.filter(key=token.key, is_active=True).exists():
+                raise
+            increment('token_key_retries')
+            token.key = generate_numeric_token()
+    raise ValidationError("Couldn't create a unique token even after retrying.")
+
+
+def generate_unique_keys(count):
+    """
+    Generates count distinct keys that no active token is using.
+    Each round checks all of its candidates against the database in one query and
+    only the collisions are regenerated. Gives up after
+    PASSWORDLESS_TOKEN_GENERATION_ATTEMPTS rounds that find no free key.
+    """
+    keys = set()
+    tries = 0
+    while len(keys) < count:
+        candidates = {generate_numeric_token() for _ in range(count - len(keys))} - keys
+        taken = CallbackToken.objects.filter(key__in=candidates, is_active=True).values_list('key', flat=True)
+        free = candidates.difference(taken)
+        if len(free) < len(candidates):
+            increment('token_key_retries', len(candidates) - len(free))
+        if not free:
+            tries += 1
+            if tries >= api_settings.PASSWORDLESS_TOKEN_GENERATION_ATTEMPTS:
+                raise ValidationError("Couldn't create unique tokens even after retrying.")
+        keys |= free
+    return list(keys)
+
+
+class BaseTokenStore(object):
+    """
+    Where callback tokens are kept between being issued and being redeemed.
+    """
+
+    def create_token(self, user, alias_type, token_type):
+        """
+        Issues a new token to the user, invalidating their previous ones of the same type.
+        """
+        raise NotImplementedError
+
+    def create_tokens(self, users, alias_type, token_type):
+        """
+        Issues a new token to each of the given users.
+        """
+        return [self.create_token(user, alias_type, token_type) for user in users]
+
+    def reusable_token(self, user, alias_type, token_type, max_age):
+        """
+        Returns the user's active token of this type sent to their current alias
+        if it was issued at most max_age seconds ago, otherwise None. Stores that
+        can't find it cheaply needn't override this.
+        """
+        return None
+
+    def consume_token(self, callback_token, token_type, alias_type, alias, user_id=None):
+        """
+        Redeems an unexpired token sent to the given alias, optionally also requiring
+        it to belong to user_id. Returns the token with its user attached, or None.
+        """
+        raise NotImplementedError
+
+    async def aconsume_token(self, callback_token, token_type, alias_type, alias, user_id=None):
+        """
+        Async version of consume_token. Runs it in a thread unless a store overrides it.
+        """
+        return await sync_to_async(self.consume_token)(callback_token, token_type, alias_type, alias, user_id=user_id)
+
+    def invalidate_tokens(self, token_type, alias_type, alias):
+        """
+        Invalidates the active tokens of this type held by the user with the given alias.
+        """
+        raise NotImplementedError
+
+    def validate_token_age(self, callback_token):
+        """
+        Returns True if a given token is within the age expiration limit.
+        """
+        raise NotImplementedError
+
+    def authenticate_by_token(self, callback_token):
+        """
+        Redeems an auth token by its key alone and returns its user, or None.
+        """
+        raise NotImplementedError
+
+
+class ModelTokenStore(BaseTokenStore):
+    """
+    Keeps tokens in the CallbackToken table. This is the default.
+    """
+
+    def create_token(self, user, alias_type, token_type):
+        alias_type_u = alias_type.upper()
+        to_alias_field = getattr(api_settings, f'PASSWORDLESS_USER_{alias_type_u}_FIELD_NAME')
+        token = save_with_unique_key(CallbackToken(user=user,
+                                                   to_alias_type=alias_type_u,
+                                                   to_alias=getattr(user, to_alias_field),
+                                                   type=token_type))
+
+        if token is not None:
+            return token
+
+        return None
+
+    def reusable_token(self, user, alias_type, token_type, max_age):
+        alias_type_u = alias_type.upper()
+        to_alias_field = getattr(api_settings, f'PASSWORDLESS_USER_{alias_type_u}_FIELD_NAME')
+        return CallbackToken.objects.active().filter(
+            user=user, type=token_type, to_alias_type=alias_type_u, to_alias=getattr(user, to_alias_field),
+            created_at__gte=timezone.now() - timedelta(seconds=max_age)).first()
+
+    def create_tokens(self, users, alias_type, token_type):
+        """
+        Issues the tokens in a fixed number of queries.
+
+        Previous tokens of the same type are invalidated with a single UPDATE and
+        the new ones are inserted with bulk_create, so the per-token signals are
+        not sent.
+        """
+        alias_type_u = alias_type.upper()
+        to_alias_field = getattr(api_settings, f'PASSWORDLESS_USER_{alias_type_u}_FIELD_NAME')
+        if not users:
+            return []
+
+        for tries in range(api_settings.PASSWORDLESS_TOKEN_GENERATION_ATTEMPTS + 1):
+            tokens = [CallbackToken(user=user,
+                                    key=key,
+                                    to_alias_type=alias_type_u,
+                                    to_alias=getattr(user, to_alias_field),
+                                    type=token_type)
+                      for user, key in zip(users, generate_unique_keys(len(users)))]
+            try:
+                with transaction.atomic():
+                    CallbackToken.objects.active().filter(user__in=users, type=token_type).update(is_active=False)
+                    CallbackToken.objects.bulk_create(tokens)
+                return tokens
+            except IntegrityError:
+                # Another process took one of the keys since we checked them.
+                if not CallbackToken.objects.filter(key__in=[token.key for token in tokens], is_active=True).exists():
+                    raise
+                increment('token_key_retries')
+                continue
+        raise ValidationError("Couldn't create unique tokens even after retrying.")
+
+    def consumable_tokens(self, callback_token, token_type, alias_type, alias, user_id=None):
+        """
+        The unexpired, active tokens matching a redemption attempt, with their users.
+        """
+        expiry_cutoff = timezone.now() - timedelta(seconds=api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME)
+        lookup = {'created_at__gte': expiry_cutoff,
+                  'key': callback_token,
+                  'type': token_type,
+                  'is_active': True,
+                  **alias_lookup(alias_type, alias, prefix='user__')}
+        if user_id is not None:
+            lookup['user'] = user_id
+
+        return CallbackToken.objects.select_related('user').filter(**lookup)
+
+    def consume_token(self, callback_token, token_type, alias_type, alias, user_id=None):
+        """
+        The token and its user are fetched together, with the expiry checked in
+        the query, and the token is then marked as used with a conditional UPDATE
+        so that two concurrent requests can't both redeem it.
+        """
+        token = self.consumable_tokens(callback_token, token_type, alias_type, alias, user_id).first()
+        if token is None:
+            logger.debug("drfpasswordless: Challenged with a callback token that doesn't exist or has expired.")
+            return None
+
+        consumed = CallbackToken.objects.filter(pk=token.pk, is_active=True).update(is_active=False)
+        if not consumed:
+            logger.debug("drfpasswordless: Callback token was used by a concurrent request.")
+            return None
+        token.is_active = False
+        return token
+
+    async def aconsume_token(self, callback_token, token_type, alias_type, alias, user_id=None):
+        token = await self.consumable_tokens(callback_token, token_type, alias_type, alias, user_id).afirst()
+        if token is None:
+            logger.debug("drfpasswordless: Challenged with a callback token that doesn't exist or has expired.")
+            return None
+
+        consumed = await CallbackToken.objects.filter(pk=token.pk, is_active=True).aupdate(is_active=False)
+        if not consumed:
+            logger.debug("drfpasswordless: Callback token was used by a concurrent request.")
+            return None
+        token.is_active = False
+        return token
+
+    def invalidate_tokens(self, token_type, alias_type, alias):
+        CallbackToken.objects.active().filter(type=token_type, **alias_lookup(alias_type, alias, prefix='user__')) \
+            .update(is_active=False)
+
+    def validate_token_age(self, callback_token):
+        try:
+            token = CallbackToken.objects.get(key=callback_token, is_active=True)
+            seconds = (timezone.now() - token.created_at).total_seconds()
+            token_expiry_time = api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME
+            if seconds <= token_expiry_time:
+                return True
+            else:
+                # Invalidate our token.
+                token.is_active = False
+                token.save()
+                return False
+
+        except CallbackToken.DoesNotExist:
+            # No valid token.
+            return False
+
+    def authenticate_by_token(self, callback_token):
+        try:
+            token = CallbackToken.objects.get(key=callback_token, is_active=True, type=CallbackToken.TOKEN_TYPE_AUTH)
+
+            # Returning a user designates a successful authentication.
+            token.user = User.objects.get(pk=token.user.pk)
+            token.is_active = False  # Mark this token as used.
+            token.save()
+
+            return token.user
+
+        except CallbackToken.DoesNotExist:
+            logger.debug("drfpasswordless: Challenged with a callback token that doesn't exist.")
+        except User.DoesNotExist:
+            logger.debug("drfpasswordless: Authenticated user somehow doesn't exist.")
+        except PermissionDenied:
+            logger.debug("drfpasswordless: Permission denied while authenticating.")
+
+        return None
+
+
+class CacheTokenStore(BaseTokenStore):
+    """
+    Keeps tokens in the Django cache named by PASSWORDLESS_TOKEN_CACHE_ALIAS
+    instead of the database. Tokens expire through the cache's own timeouts and
+    are used up by deleting them, which only one request can do.
+
+    Use a shared cache such as Redis or memcached in production. The tokens
+    handed out are unsaved CallbackToken instances.
+    """
+    key_prefix = 'drfpasswordless:token:'
+    user_prefix = 'drfpasswordless:user:'
+
+    @property
+    def cache(self):
+        return caches[api_settings.PASSWORDLESS_TOKEN_CACHE_ALIAS]
+
+    def token_cache_key(self, key):
+        return self.key_prefix + key
+
+    def user_cache_key(self, user_pk, token_type):
+        return '%s%s:%s' % (self.user_prefix, user_pk, token_type)
+
+    def create_token(self, user, alias_type, token_type):
+        alias_type_u = alias_type.upper()
+        to_alias_field = getattr(api_settings, f'PASSWORDLESS_USER_{alias_type_u}_FIELD_NAME')
+        data = {'user_id': user.pk,
+                'type': token_type,
+                'to_alias': getattr(user, to_alias_field),
+                'to_alias_type': alias_type_u,
+                'created_at': time.time()}
+
+        timeout = api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME
+        for tries in range(api_settings.PASSWORDLESS_TOKEN_GENERATION_ATTEMPTS + 1):
+            data['key'] = generate_numeric_token()
+            # add() only succeeds if no active token holds this key.
+            if self.cache.add(self.token_cache_key(data['key']), data, timeout=timeout):
+                break
+            increment('token_key_retries')
+        else:
+            raise ValidationError("Couldn't create a unique token even after retrying.")
+
+        # Invalidate the user's previous token of this type.
+        user_cache_key = self.user_cache_key(user.pk, token_type)
+        previous_key = self.cache.get(user_cache_key)
+        self.cache.set(user_cache_key, data['key'], timeout=timeout)
+        if previous_key is not None:
+            # The old key may have been used up and reissued to someone else since.
+            previous = self.cache.get(self.token_cache_key(previous_key))
+            if previous is not None and previous['user_id'] == user.pk and previous['type'] == token_type:
+                self.cache.delete(self.token_cache_key(previous_key))
+
+        return self.build_token(data, user)
+
+    def reusable_token(self, user, alias_type, token_type, max_age):
+        key = self.cache.get(self.user_cache_key(user.pk, token_type))
+        if key is None:
+            return None
+        data = self.cache.get(self.token_cache_key(key))
+        alias_type_u = alias_type.upper()
+        to_alias = getattr(user, getattr(api_settings, f'PASSWORDLESS_USER_{alias_type_u}_FIELD_NAME'))
+        if data is None or data['user_id'] != user.pk or data['type'] != token_type \
+                or data['to_alias_type'] != alias_type_u or data['to_alias'] != to_alias \
+                or time.time() - data['created_at'] > max_age:
+            return None
+        return self.build_token(data, user)
+
+    def consume_token(self, callback_token, token_type, alias_type, alias, user_id=None):
+        cache_key = self.token_cache_key(callback_token)
+        data = self.cache.get(cache_key)
+        if data is None or data['type'] != token_type:
+            logger.debug("drfpasswordless: Challenged with a callback token that doesn't exist or has expired.")
+            return None
+        if user_id is not None and data['user_id'] != user_id:
+            return None
+
+        user = User.objects.filter(pk=data['user_id'], **alias_lookup(alias_type, alias)).first()
+        if user is None:
+            return None
+
+        if not self.cache.delete(cache_key):
+            logger.debug("drfpasswordless: Callback token was used by a concurrent request.")
+            return None
+
+        return self.build_token(data, user, is_active=False)
+
+    def invalidate_tokens(self, token_type, alias_type, alias):
+        user_pk = User.objects.filter(**alias_lookup(alias_type, alias)).values_list('pk', flat=True).first()
+        if user_pk is None:
+            return
+
+        key = self.cache.get(self.user_cache_key(user_pk, token_type))
+        if key is not None:
+            data = self.cache.get(self.token_cache_key(key))
+            if data is not None and data['user_id'] == user_pk and data['type'] == token_type:
+                self.cache.delete(self.token_cache_key(key))
+
+    def validate_token_age(self, callback_token):
+        return self.cache.get(self.token_cache_key(callback_token)) is not None
+
+    def authenticate_by_token(self, callback_token):
+        cache_key = self.token_cache_key(callback_token)
+        data = self.cache.get(cache_key)
+        if data is None or data['type'] != CallbackToken.TOKEN_TYPE_AUTH:
+            logger.debug("drfpasswordless: Challenged with a callback token that doesn't exist.")
+            return None
+
+        try:
+            user = User.objects.get(pk=data['user_id'])
+        except User.DoesNotExist:
+            logger.debug("drfpasswordless: Authenticated user somehow doesn't exist.")
+            return None
+
+        if not self.cache.delete(cache_key):
+            return None
+        return user
+
+    def build_token(self, data, user, is_active=True):
+        return CallbackToken(user=user,
+                             key=data['key'],
+                             type=data['type'],
+                             to_alias=data['to_alias'],
+                             to_alias_type=data['to_alias_type'],
+                             is_active=is_active,
+                             created_at=datetime.fromtimestamp(data['created_at'], tz=dt_timezone.utc))
+
+
+class SignedTokenStore(BaseTokenStore):
+    """
+    Derives each token from an HMAC, keyed with SECRET_KEY, of the user, the
+    alias it's sent to, its type, the time window it's issued in and a counter
+    kept per user. Nothing is written to the database. Issuing a token only
+    stores the user's counter and window in the cache named by
+    PASSWORDLESS_TOKEN_CACHE_ALIAS, which also invalidates their previous token.
+    Redemption recomputes the token and compares it in constant time, and used
+    tokens are remembered in the cache until they expire so they can't be
+    replayed.
+
+    Expiry is checked against the start of the window, so tokens may expire up
+    to ``window`` seconds early. Tokens can't be found from their key alone, so
+    validate_token_age and authenticate_by_token always fail with this store.
+    Use a shared cache such as Redis or memcached in production.
+    """
+    key_salt = 'drfpasswordless.stores.SignedTokenStore'
+    state_prefix = 'drfpasswordless:signed:'
+    used_prefix = 'drfpasswordless:signed-used:'
+    window = 30
+
+    @property
+    def cache(self):
+        return caches[api_settings.PASSWORDLESS_TOKEN_CACHE_ALIAS]
+
+    def state_cache_key(self, user_pk, token_type):
+        return '%s%s:%s' % (self.state_prefix, user_pk, token_type)
+
+    def used_cache_key(self, user_pk, token_type, window, counter):
+        return '%s%s:%s:%d:%d' % (self.used_prefix, user_pk, token_type, window, counter)
+
+    def sign(self, user_pk, alias, token_type, window, counter):
+        """
+        Truncates the HMAC to a six digit key the way HOTP does.
+        """
+        value = '%s:%s:%s:%d:%d' % (user_pk, alias, token_type, window, counter)
+        digest = salted_hmac(self.key_salt, value, algorithm='sha256').digest()
+        offset = digest[-1] & 0x0f
+        return '%06d' % ((int.from_bytes(digest[offset:offset + 4], 'big') & 0x7fffffff) % 1000000)
+
+    def create_token(self, user, alias_type, token_type):
+        alias_type_u = alias_type.upper()
+        to_alias = getattr(user, getattr(api_settings, f'PASSWORDLESS_USER_{alias_type_u}_FIELD_NAME'))
+        state_key = self.state_cache_key(user.pk, token_type)
+        state = self.cache.get(state_key)
+        counter = state[0] + 1 if state is not None else 1
+        window = int(time.time()) // self.window
+        self.cache.set(state_key, (counter, window),
+                       timeout=api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME + self.window)
+
+        key = self.sign(user.pk, to_alias, token_type, window, counter)
+        return self.build_token(user, key, token_type, alias_type_u, to_alias, window * self.window)
+
+    def reusable_token(self, user, alias_type, token_type, max_age):
+        """
+        The token is recomputed from the user's counter and window. Its age is
+        taken from the start of the window, so it may be reused for up to
+        ``window`` seconds less than max_age.
+        """
+        state = self.cache.get(self.state_cache_key(user.pk, token_type))
+        if state is None or state[1] is None:
+            return None
+        counter, window = state
+        issued_at = window * self.window
+        if time.time() - issued_at > max_age \
+                or self.cache.get(self.used_cache_key(user.pk, token_type, window, counter)) is not None:
+            return None
+        alias_type_u = alias_type.upper()
+        to_alias = getattr(user, getattr(api_settings, f'PASSWORDLESS_USER_{alias_type_u}_FIELD_NAME'))
+        key = self.sign(user.pk, to_alias, token_type, window, counter)
+        return self.build_token(user, key, token_type, alias_type_u, to_alias, issued_at)
+
+    def consume_token(self, callback_token, token_type, alias_type, alias, user_id=None):
+        user = User.objects.filter(**alias_lookup(alias_type, alias)).first()
+        if user is None or (user_id is not None and user.pk != user_id):
+            return None
+
+        alias_type_u = alias_type.upper()
+        to_alias = getattr(user, getattr(api_settings, f'PASSWORDLESS_USER_{alias_type_u}_FIELD_NAME'))
+        state = self.cache.get(self.state_cache_key(user.pk, token_type))
+        if state is None or state[1] is None:
+            logger.debug("drfpasswordless: Challenged with a callback token that doesn't exist or has expired.")
+            return None
+        counter, window = state
+        issued_at = window * self.window
+        if time.time() - issued_at > api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME:
+            logger.debug("drfpasswordless: Challenged with a callback token that has expired.")
+            return None
+        if not constant_time_compare(self.sign(user.pk, to_alias, token_type, window, counter), callback_token):
+            logger.debug("drfpasswordless: Challenged with a callback token that doesn't exist.")
+            return None
+
+        # add() only succeeds for the first request to use the token.
+        if not self.cache.add(self.used_cache_key(user.pk, token_type, window, counter), True,
+                              timeout=api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME + self.window):
+            logger.debug("drfpasswordless: Callback token was already used.")
+            return None
+        return self.build_token(user, callback_token, token_type, alias_type_u, to_alias, issued_at, is_active=False)
+
+    def invalidate_tokens(self, token_type, alias_type, alias):
+        user_pk = User.objects.filter(**alias_lookup(alias_type, alias)).values_list('pk', flat=True).first()
+        if user_pk is None:
+            return
+        # The counter is kept and the window cleared, so a token issued again
+        # within the same window gets a new key.
+        state_key = self.state_cache_key(user_pk, token_type)
+        state = self.cache.get(state_key)
+        if state is not None:
+            self.cache.set(state_key, (state[0], None),
+                           timeout=api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME + self.window)
+
+    def validate_token_age(self, callback_token):
+        return False
+
+    def authenticate_by_token(self, callback_token):
+        return None
+
+    def build_token(self, user, key, token_type, to_alias_type, to_alias, issued_at, is_active=True):
+        return CallbackToken(user=user,
+                             key=key,
+                             type=token_type,
+                             to_alias=to_alias,
+                             to_alias_type=to_alias_type,
+                             is_active=is_active,
+                             created_at=datetime.fromtimestamp(issued_at, tz=dt_timezone.utc))
+
+
+def get_token_store():
+    """
+    Returns the process-wide instance of the configured token store.
+    """
+    return resolved_settings.instance('PASSWORDLESS_TOKEN_STORE')
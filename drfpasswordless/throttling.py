@@ -0,0 +1,215 @@
+import time
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+from drfpasswordless.aliases import normalize_alias
+from drfpasswordless.models import CallbackToken
+from drfpasswordless.settings import api_settings
+
+
+def get_throttle_cache():
+    return caches[api_settings.PASSWORDLESS_THROTTLE_CACHE_ALIAS]
+
+
+def get_requested_alias(request, view):
+    """
+    The alias a token is being requested for: the one posted for auth tokens,
+    or the requesting user's own for verification tokens.
+    """
+    alias = request.data.get(view.alias_type) if hasattr(request.data, 'get') else None
+    if not alias and view.token_type == CallbackToken.TOKEN_TYPE_VERIFY and request.user.is_authenticated:
+        field = getattr(api_settings, 'PASSWORDLESS_USER_%s_FIELD_NAME' % view.alias_type.upper())
+        alias = getattr(request.user, field, None)
+    if not alias or not isinstance(alias, str):
+        return None
+    return normalize_alias(view.alias_type, alias)
+
+
+def get_attempts_cache_key(token_type, alias_type, alias):
+    return 'drfpasswordless:attempts:%s:%s:%s' % (token_type, alias_type, normalize_alias(alias_type, alias))
+
+
+def is_locked_out(token_type, alias_type, alias):
+    """
+    True once an alias has had PASSWORDLESS_TOKEN_MAX_ATTEMPTS wrong guesses at its token.
+    """
+    max_attempts = api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS
+    if not max_attempts:
+        return False
+    return get_throttle_cache().get(get_attempts_cache_key(token_type, alias_type, alias), 0) >= max_attempts
+
+
+def record_failed_attempt(token_type, alias_type, alias):
+    """
+    Counts a wrong guess at an alias' token and returns the number of wrong guesses so far.
+    The count is forgotten once a token could have expired anyway.
+    """
+    cache = get_throttle_cache()
+    key = get_attempts_cache_key(token_type, alias_type, alias)
+    timeout = api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout)
+        return 1
+
+
+def reset_attempts(token_type, alias_type, alias):
+    get_throttle_cache().delete(get_attempts_cache_key(token_type, alias_type, alias))
+
+
+async def ais_locked_out(token_type, alias_type, alias):
+    """
+    Async version of is_locked_out, using the cache's async API.
+    """
+    max_attempts = api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS
+    if not max_attempts:
+        return False
+    return await get_throttle_cache().aget(get_attempts_cache_key(token_type, alias_type, alias), 0) >= max_attempts
+
+
+async def arecord_failed_attempt(token_type, alias_type, alias):
+    """
+    Async version of record_failed_attempt, using the cache's async API.
+    """
+    cache = get_throttle_cache()
+    key = get_attempts_cache_key(token_type, alias_type, alias)
+    timeout = api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME
+    await cache.aadd(key, 0, timeout)
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, 1, timeout)
+        return 1
+
+
+async def areset_attempts(token_type, alias_type, alias):
+    await get_throttle_cache().adelete(get_attempts_cache_key(token_type, alias_type, alias))
+
+
+def reset_attempts_many(token_type, alias_type, aliases):
+    """
+    Forgets the wrong guesses of many aliases at once, with a single cache call.
+    """
+    get_throttle_cache().delete_many([get_attempts_cache_key(token_type, alias_type, alias) for alias in aliases])
+
+
+class PasswordlessRateThrottle(SimpleRateThrottle):
+    """
+    Throttles using PASSWORDLESS_THROTTLE_RATES[scope] over an approximate sliding window.
+
+    Rather than keeping a list of request times, requests are counted in fixed
+    windows with an atomic cache increment. The estimate is the count for the
+    current window plus the previous window's count, weighted by how much of it
+    still overlaps the sliding window. Since every request sees its own
+    increment, concurrent requests can't all slip under the limit, and a burst
+    at a window boundary can't double the rate.
+    """
+    cache_format = 'drfpasswordless:throttle:%(scope)s:%(ident)s'
+
+    @property
+    def cache(self):
+        return get_throttle_cache()
+
+    def get_rate(self):
+        return api_settings.PASSWORDLESS_THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = time.time()
+        window = int(self.now // self.duration)
+        current_key = '%s:%d' % (self.key, window)
+
+        cache = self.cache
+        cache.add(current_key, 0, self.duration * 2)
+        try:
+            current = cache.incr(current_key)
+        except ValueError:
+            # The counter was evicted between add and incr.
+            current = 1
+            cache.set(current_key, current, self.duration * 2)
+        previous = cache.get('%s:%d' % (self.key, window - 1), 0)
+
+        overlap = 1 - (self.now % self.duration) / self.duration
+        if current + previous * overlap > self.num_requests:
+            # Refused requests don't count towards the limit.
+            try:
+                cache.decr(current_key)
+            except ValueError:
+                pass
+            return False
+        return True
+
+    def wait(self):
+        return self.duration - (self.now % self.duration)
+
+
+class AliasRateThrottle(PasswordlessRateThrottle):
+    """
+    Limits the tokens sent to a single email address or mobile number.
+    """
+    scope = 'alias'
+
+    def get_cache_key(self, request, view):
+        alias = get_requested_alias(request, view)
+        if alias is None:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': '%s:%s' % (view.alias_type, alias)}
+
+
+class IPRateThrottle(PasswordlessRateThrottle):
+    """
+    Limits the tokens requested from a single IP address.
+    """
+    scope = 'ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class UserRateThrottle(PasswordlessRateThrottle):
+    """
+    Limits the tokens requested by a single authenticated user.
+    """
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': request.user.pk}
+
+
+class ResendCooldownThrottle(BaseThrottle):
+    """
+    Allows one token per alias every PASSWORDLESS_RESEND_COOLDOWN seconds.
+    """
+    cache_format = 'drfpasswordless:cooldown:%(alias_type)s:%(alias)s'
+
+    def allow_request(self, request, view):
+        self.cooldown = api_settings.PASSWORDLESS_RESEND_COOLDOWN
+        if not self.cooldown:
+            return True
+
+        alias = get_requested_alias(request, view)
+        if alias is None:
+            return True
+
+        cache = get_throttle_cache()
+        key = self.cache_format % {'alias_type': view.alias_type, 'alias': alias}
+        self.now = time.time()
+        if cache.add(key, self.now, self.cooldown):
+            return True
+        self.last_sent = cache.get(key, self.now)
+        return False
+
+    def wait(self):
+        return max(self.cooldown - (self.now - self.last_sent), 0)
+
+
+DEFAULT_THROTTLE_CLASSES = (AliasRateThrottle, IPRateThrottle, UserRateThrottle, ResendCooldownThrottle)
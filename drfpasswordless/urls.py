@@ -7,6 +7,8 @@ from drfpasswordless.views import (
      VerifyAliasFromCallbackToken,
      ObtainEmailVerificationCallbackToken,
      ObtainMobileVerificationCallbackToken,
+     ObtainEmailMagicLink,
+     ObtainAuthTokenFromMagicLink,
 )
 
 app_name = 'drfpasswordless'
@@ -15,6 +17,8 @@ urlpatterns = [
      path(api_settings.PASSWORDLESS_AUTH_PREFIX + 'email/', ObtainEmailCallbackToken.as_view(), name='auth_email'),
      path(api_settings.PASSWORDLESS_AUTH_PREFIX + 'mobile/', ObtainMobileCallbackToken.as_view(), name='auth_mobile'),
      path(api_settings.PASSWORDLESS_AUTH_PREFIX + 'token/', ObtainAuthTokenFromCallbackToken.as_view(), name='auth_token'),
+     path(api_settings.PASSWORDLESS_AUTH_PREFIX + 'email/magic/', ObtainEmailMagicLink.as_view(), name='auth_email_magic_link'),
+     path(api_settings.PASSWORDLESS_AUTH_PREFIX + 'magic/', ObtainAuthTokenFromMagicLink.as_view(), name='auth_magic_link'),
      path(api_settings.PASSWORDLESS_VERIFY_PREFIX + 'email/', ObtainEmailVerificationCallbackToken.as_view(), name='verify_email'),
      path(api_settings.PASSWORDLESS_VERIFY_PREFIX + 'mobile/', ObtainMobileVerificationCallbackToken.as_view(), name='verify_mobile'),
      path(api_settings.PASSWORDLESS_VERIFY_PREFIX, VerifyAliasFromCallbackToken.as_view(), name='verify_token'),
@@ -1,13 +1,31 @@
 import logging
-import os
+import time
+from asgiref.sync import sync_to_async
+from datetime import timedelta
 from django.contrib.auth import get_user_model
-from django.core.exceptions import PermissionDenied
-from django.core.mail import send_mail
-from django.template import loader
+from django.core.mail import EmailMultiAlternatives
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.utils import timezone
-from rest_framework.authtoken.models import Token
-from drfpasswordless.models import CallbackToken
+from drfpasswordless.aliases import alias_lookup
+from drfpasswordless.authentication import SignedAuthToken
+from drfpasswordless.demo import demo_tokens
+from drfpasswordless.models import CallbackToken, MagicLinkToken, generate_magic_link_key, hash_magic_link_key
+from drfpasswordless.mail import send_email_messages
+from drfpasswordless.metrics import increment, timer
+from drfpasswordless.rendering import render_token_template, template_cache
 from drfpasswordless.settings import api_settings
+from drfpasswordless.sms import get_sms_provider
+from drfpasswordless.stores import get_token_store
+from drfpasswordless.throttling import (
+    ais_locked_out,
+    arecord_failed_attempt,
+    areset_attempts,
+    is_locked_out,
+    record_failed_attempt,
+    reset_attempts,
+    reset_attempts_many,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -15,78 +33,259 @@ User = get_user_model()
 
 
 def authenticate_by_token(callback_token):
-    try:
-        token = CallbackToken.objects.get(key=callback_token, is_active=True, type=CallbackToken.TOKEN_TYPE_AUTH)
+    return get_token_store().authenticate_by_token(callback_token)
 
-        # Returning a user designates a successful authentication.
-        token.user = User.objects.get(pk=token.user.pk)
-        token.is_active = False  # Mark this token as used.
-        token.save()
 
-        return token.user
+def consume_callback_token(callback_token, token_type, alias_type, alias, user_id=None):
+    """
+    Redeems a callback token sent to the given alias, marking it as used.
+    Returns the token with its user attached, or None if there's no such token.
 
-    except CallbackToken.DoesNotExist:
-        logger.debug("drfpasswordless: Challenged with a callback token that doesn't exist.")
-    except User.DoesNotExist:
-        logger.debug("drfpasswordless: Authenticated user somehow doesn't exist.")
-    except PermissionDenied:
-        logger.debug("drfpasswordless: Permission denied while authenticating.")
+    After PASSWORDLESS_TOKEN_MAX_ATTEMPTS wrong guesses the alias' token is
+    invalidated, and further guesses are turned away without touching the
+    database until a new token is issued.
 
-    return None
+    Demo user pins are checked first and never stored, used up or locked out.
+    """
+    with timer('redeem', alias_type=alias_type, token_type=token_type) as t:
+        token = demo_tokens.consume_token(callback_token, token_type, alias_type, alias, user_id=user_id)
+        if token is not None:
+            t.outcome = 'demo'
+            return token
 
+        max_attempts = api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS
+        if max_attempts and is_locked_out(token_type, alias_type, alias):
+            logger.debug("drfpasswordless: Challenged with a callback token for a locked out alias.")
+            t.outcome = 'locked_out'
+            return None
+
+        store = get_token_store()
+        token = store.consume_token(callback_token, token_type, alias_type, alias, user_id=user_id)
+        t.outcome = 'success' if token is not None else 'invalid'
+        if max_attempts:
+            if token is not None:
+                reset_attempts(token_type, alias_type, alias)
+            elif record_failed_attempt(token_type, alias_type, alias) == max_attempts:
+                logger.warning("drfpasswordless: Too many wrong callback tokens for an alias, invalidating its token.")
+                increment('lockouts', alias_type=alias_type, token_type=token_type)
+                store.invalidate_tokens(token_type, alias_type, alias)
+        return token
 
-def create_callback_token_for_user(user, alias_type, token_type):
-    token = None
-    alias_type_u = alias_type.upper()
-    to_alias_field = getattr(api_settings, f'PASSWORDLESS_USER_{alias_type_u}_FIELD_NAME')
-    if user.pk in api_settings.PASSWORDLESS_DEMO_USERS.keys():
-        token = CallbackToken.objects.filter(user=user).first()
-        if token:
+
+async def aconsume_callback_token(callback_token, token_type, alias_type, alias, user_id=None):
+    """
+    Async version of consume_callback_token.
+    """
+    with timer('redeem', alias_type=alias_type, token_type=token_type) as t:
+        token = await demo_tokens.aconsume_token(callback_token, token_type, alias_type, alias, user_id=user_id)
+        if token is not None:
+            t.outcome = 'demo'
             return token
-        else:
-            return CallbackToken.objects.create(
-                user=user,
-                key=api_settings.PASSWORDLESS_DEMO_USERS[user.pk],
-                to_alias_type=alias_type_u,
-                to_alias=getattr(user, to_alias_field),
-                type=token_type
-            )
-    
-    token = CallbackToken.objects.create(user=user,
-                                            to_alias_type=alias_type_u,
-                                            to_alias=getattr(user, to_alias_field),
-                                            type=token_type)
 
+        max_attempts = api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS
+        if max_attempts and await ais_locked_out(token_type, alias_type, alias):
+            logger.debug("drfpasswordless: Challenged with a callback token for a locked out alias.")
+            t.outcome = 'locked_out'
+            return None
+
+        store = get_token_store()
+        token = await store.aconsume_token(callback_token, token_type, alias_type, alias, user_id=user_id)
+        t.outcome = 'success' if token is not None else 'invalid'
+        if max_attempts:
+            if token is not None:
+                await areset_attempts(token_type, alias_type, alias)
+            elif await arecord_failed_attempt(token_type, alias_type, alias) == max_attempts:
+                logger.warning("drfpasswordless: Too many wrong callback tokens for an alias, invalidating its token.")
+                increment('lockouts', alias_type=alias_type, token_type=token_type)
+                await sync_to_async(store.invalidate_tokens)(token_type, alias_type, alias)
+        return token
 
 
-    if token is not None:
-        return token
+def create_callback_token_for_user(user, alias_type, token_type):
+    if demo_tokens.is_demo_user(user.pk):
+        # Demo users always get their pin, without touching the database.
+        return demo_tokens.create_token(user, alias_type, token_type)
+
+    store = get_token_store()
+    with timer('create_token', alias_type=alias_type, token_type=token_type) as t:
+        reuse_window = min(api_settings.PASSWORDLESS_TOKEN_REUSE_WINDOW, api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME)
+        if reuse_window > 0:
+            token = store.reusable_token(user, alias_type, token_type, reuse_window)
+            if token is not None:
+                # Guesses at the reused token keep counting towards its lockout.
+                t.outcome = 'reused'
+                return token
+        token = store.create_token(user, alias_type, token_type)
+    if api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS and token.to_alias:
+        # A new token comes with a fresh set of attempts.
+        reset_attempts(token_type, alias_type, token.to_alias)
+    return token
+
+
+def create_callback_tokens_for_users(users, alias_type, token_type):
+    """
+    Issues a new callback token to each of the given users and clears their
+    aliases' wrong guesses. Demo users are skipped.
+    """
+    users = [user for user in users if not demo_tokens.is_demo_user(user.pk)]
+    tokens = get_token_store().create_tokens(users, alias_type, token_type)
+    if api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS:
+        # New tokens come with a fresh set of attempts.
+        reset_attempts_many(token_type, alias_type, [token.to_alias for token in tokens if token.to_alias])
+    return tokens
+
 
-    return None
+class MagicLink(object):
+    """
+    What's handed to the email callback for a magic link token.
+    The link stands in for a callback token's key.
+    """
+
+    def __init__(self, token, link):
+        self.token = token
+        self.user = token.user
+        self.key = link
+
+
+def create_magic_link_token_for_user(user):
+    """
+    Issues a magic link token to the user, invalidating their previous ones.
+    Returns the token and its key, which isn't stored and can't be recovered later.
+    """
+    key = generate_magic_link_key()
+    with timer('create_token', alias_type='email', token_type=MagicLinkToken.TOKEN_TYPE):
+        with transaction.atomic():
+            MagicLinkToken.objects.active().filter(user=user).update(is_active=False)
+            token = MagicLinkToken.objects.create(
+                user=user,
+                key_hash=hash_magic_link_key(key),
+                to_alias_type='EMAIL',
+                to_alias=getattr(user, api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME))
+    return token, key
+
+
+def consume_magic_link_token(key):
+    """
+    Redeems an unexpired magic link token by its key, marking it as used.
+    Returns the token with its user attached, or None.
+    """
+    with timer('redeem', alias_type='email', token_type=MagicLinkToken.TOKEN_TYPE) as t:
+        expiry_cutoff = timezone.now() - timedelta(seconds=api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME)
+        token = MagicLinkToken.objects.select_related('user').filter(
+            key_hash=hash_magic_link_key(key), is_active=True, created_at__gte=expiry_cutoff).first()
+        if token is None:
+            logger.debug("drfpasswordless: Challenged with a magic link that doesn't exist or has expired.")
+            t.outcome = 'invalid'
+            return None
+
+        # Conditional, so that two concurrent requests can't both redeem it.
+        if not MagicLinkToken.objects.filter(pk=token.pk, is_active=True).update(is_active=False):
+            logger.debug("drfpasswordless: Magic link was used by a concurrent request.")
+            t.outcome = 'invalid'
+            return None
+        token.is_active = False
+        return token
 
 
 def validate_token_age(callback_token):
     """
     Returns True if a given token is within the age expiration limit.
     """
+    with timer('validate_token_age') as t:
+        # Demo pins never expire.
+        valid = demo_tokens.is_demo_pin(callback_token) or get_token_store().validate_token_age(callback_token)
+        t.outcome = 'valid' if valid else 'expired'
+        return valid
+
+
+def purge_callback_tokens(batch_size=None, dry_run=False, max_batches=None, pause=0):
+    """
+    Deletes callback and magic link tokens that are expired or no longer active.
+
+    Tokens are removed oldest first in batches of ``batch_size`` rows, each in
+    its own short DELETE, so an interrupted purge can simply be run again and
+    picks up where it left off.
+
+    Returns a dictionary of statistics about the run.
+    """
+    batch_size = batch_size or api_settings.PASSWORDLESS_PURGE_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(seconds=api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME)
+
+    stats = {'dry_run': dry_run, 'batches': 0, 'deleted': 0, 'elapsed': 0.0, 'max_batch_time': 0.0}
+    started = time.monotonic()
+
+    for model in (CallbackToken, MagicLinkToken):
+        purgeable = model.objects.filter(Q(is_active=False) | Q(created_at__lt=cutoff))
+
+        if dry_run:
+            stats['deleted'] += purgeable.count()
+            continue
 
+        while max_batches is None or stats['batches'] < max_batches:
+            batch_started = time.monotonic()
+            pks = list(purgeable.order_by('created_at').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            deleted, _ = model.objects.filter(pk__in=pks).delete()
+            batch_time = time.monotonic() - batch_started
+
+            stats['batches'] += 1
+            stats['deleted'] += deleted
+            stats['max_batch_time'] = max(stats['max_batch_time'], batch_time)
+            logger.debug("drfpasswordless: Purged %d %s rows in %.3fs." % (deleted, model.__name__, batch_time))
+
+            if len(pks) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+
+    stats['elapsed'] = time.monotonic() - started
+    stats['rate'] = stats['deleted'] / stats['elapsed'] if stats['elapsed'] else 0.0
+    return stats
+
+
+def get_or_register_user(alias_type, alias):
+    """
+    Returns the user with the given alias and whether they were just
+    registered, registering them if there's no such user yet.
+    """
     try:
-        token = CallbackToken.objects.get(key=callback_token, is_active=True)
-        seconds = (timezone.now() - token.created_at).total_seconds()
-        token_expiry_time = api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME
-        if token.user.pk in api_settings.PASSWORDLESS_DEMO_USERS.keys():
-            return True
-        if seconds <= token_expiry_time:
-            return True
-        else:
-            # Invalidate our token.
-            token.is_active = False
-            token.save()
-            return False
+        return User.objects.get(**alias_lookup(alias_type, alias)), False
+    except User.DoesNotExist:
+        return register_user(alias_type, alias)
 
-    except CallbackToken.DoesNotExist:
-        # No valid token.
-        return False
+
+async def aget_or_register_user(alias_type, alias):
+    """
+    Async version of get_or_register_user.
+    """
+    try:
+        return await User.objects.aget(**alias_lookup(alias_type, alias)), False
+    except User.DoesNotExist:
+        return await sync_to_async(register_user)(alias_type, alias)
+
+
+def register_user(alias_type, alias):
+    """
+    Registers a user with the given alias and an unusable password in a single
+    insert. If a concurrent request registered the alias first, the alias field's
+    unique constraint turns the insert away and that user is returned instead.
+    """
+    alias_field = getattr(api_settings, f'PASSWORDLESS_USER_{alias_type.upper()}_FIELD_NAME')
+    user = User(**{alias_field: alias})
+    user.set_unusable_password()
+    try:
+        with transaction.atomic():
+            user.save(force_insert=True)
+    except IntegrityError as e:
+        try:
+            existing = User.objects.get(**alias_lookup(alias_type, alias))
+        except User.DoesNotExist:
+            # Another constraint turned the insert away, not the alias field's.
+            raise e from None
+        logger.debug("drfpasswordless: Alias was registered by a concurrent request.")
+        return existing, False
+    return user, True
 
 
 def verify_user_alias(user, token):
@@ -108,12 +307,36 @@ def verify_user_alias(user, token):
 def inject_template_context(context):
     """
     Injects additional context into email template.
+    Token emails get it from the render cache, which memoizes the context processors.
     """
-    for processor in api_settings.PASSWORDLESS_CONTEXT_PROCESSORS:
-        context.update(processor())
+    context.update(template_cache.get_context())
     return context
 
 
+def build_callback_token_email(user, email_token, **kwargs):
+    """
+    Builds the email that carries a callback token to user.email.
+    """
+    # Get email subject and message
+    email_subject = kwargs.get('email_subject',
+                               api_settings.PASSWORDLESS_EMAIL_SUBJECT)
+    email_plaintext = kwargs.get('email_plaintext',
+                                 api_settings.PASSWORDLESS_EMAIL_PLAINTEXT_MESSAGE)
+    email_html = kwargs.get('email_html',
+                            api_settings.PASSWORDLESS_EMAIL_TOKEN_HTML_TEMPLATE_NAME)
+
+    # Rendered with any context the user specifies, through the render cache.
+    with timer('render_email'):
+        html_message = render_token_template(email_html, email_token.key)
+    message = EmailMultiAlternatives(
+        email_subject,
+        email_plaintext % email_token.key,
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS,
+        [getattr(user, api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME)])
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+
 def send_email_with_callback_token(user, email_token, **kwargs):
     """
     Sends a Email to user.email.
@@ -124,25 +347,7 @@ def send_email_with_callback_token(user, email_token, **kwargs):
     try:
         if api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS:
             # Make sure we have a sending address before sending.
-
-            # Get email subject and message
-            email_subject = kwargs.get('email_subject',
-                                       api_settings.PASSWORDLESS_EMAIL_SUBJECT)
-            email_plaintext = kwargs.get('email_plaintext',
-                                         api_settings.PASSWORDLESS_EMAIL_PLAINTEXT_MESSAGE)
-            email_html = kwargs.get('email_html',
-                                    api_settings.PASSWORDLESS_EMAIL_TOKEN_HTML_TEMPLATE_NAME)
-
-            # Inject context if user specifies.
-            context = inject_template_context({'callback_token': email_token.key, })
-            html_message = loader.render_to_string(email_html, context,)
-            send_mail(
-                email_subject,
-                email_plaintext % email_token.key,
-                api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS,
-                [getattr(user, api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME)],
-                fail_silently=False,
-                html_message=html_message,)
+            send_email_messages([build_callback_token_email(user, email_token, **kwargs)])
 
         else:
             logger.debug("Failed to send token email. Missing PASSWORDLESS_EMAIL_NOREPLY_ADDRESS.")
@@ -157,9 +362,42 @@ def send_email_with_callback_token(user, email_token, **kwargs):
         return False
 
 
+def send_emails_with_callback_tokens(messages):
+    """
+    Sends many token emails in a single send_messages call.
+    Takes a list of (user, email_token, kwargs) and returns a list of results in the same order.
+
+    If the batch fails part way through, the whole batch is reported as failed,
+    so some of its emails may be sent again on retry.
+    """
+    if not api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS:
+        logger.debug("Failed to send token email. Missing PASSWORDLESS_EMAIL_NOREPLY_ADDRESS.")
+        return [False] * len(messages)
+
+    results = []
+    emails = []
+    for user, email_token, kwargs in messages:
+        try:
+            emails.append(build_callback_token_email(user, email_token, **kwargs))
+            results.append(True)
+        except Exception as e:
+            logger.debug("Failed to build token email to user: %s." % user.pk)
+            logger.debug(e)
+            results.append(False)
+
+    try:
+        if emails:
+            send_email_messages(emails)
+    except Exception as e:
+        logger.debug("Failed to send a batch of %d token emails." % len(emails))
+        logger.debug(e)
+        return [False] * len(messages)
+    return results
+
+
 def send_sms_with_callback_token(user, mobile_token, **kwargs):
     """
-    Sends a SMS to user.mobile via Twilio.
+    Sends a SMS to user.mobile via the PASSWORDLESS_SMS_PROVIDER, Twilio by default.
 
     Passes silently without sending in test environment.
     """
@@ -178,19 +416,11 @@ def send_sms_with_callback_token(user, mobile_token, **kwargs):
         if api_settings.PASSWORDLESS_MOBILE_NOREPLY_NUMBER:
             # We need a sending number to send properly
 
-            from twilio.rest import Client
-            twilio_client = Client(os.environ['TWILIO_ACCOUNT_SID'], os.environ['TWILIO_AUTH_TOKEN'])
-
             to_number = getattr(user, api_settings.PASSWORDLESS_USER_MOBILE_FIELD_NAME)
             if to_number.__class__.__name__ == 'PhoneNumber':
                 to_number = to_number.__str__()
 
-            twilio_client.messages.create(
-                body=base_string % mobile_token.key,
-                to=to_number,
-                from_=api_settings.PASSWORDLESS_MOBILE_NOREPLY_NUMBER
-            )
-            return True
+            return get_sms_provider().send(to_number, base_string % mobile_token.key)
         else:
             logger.debug("Failed to send token sms. Missing PASSWORDLESS_MOBILE_NOREPLY_NUMBER.")
             return False
@@ -210,4 +440,13 @@ def send_sms_with_callback_token(user, mobile_token, **kwargs):
 
 def create_authentication_token(user):
     """ Default way to create an authentication token"""
+    # Imported here so projects using signed tokens can leave rest_framework.authtoken out of INSTALLED_APPS.
+    from rest_framework.authtoken.models import Token
     return Token.objects.get_or_create(user=user)
+
+
+def create_signed_authentication_token(user):
+    """
+    Creates a signed auth token for SignedTokenAuthentication without writing to the database.
+    """
+    return SignedAuthToken(user), True
@@ -1,20 +1,21 @@
 import logging
-from django.utils.module_loading import import_string
 from rest_framework import parsers, renderers, status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated 
 from rest_framework.views import APIView
 from drfpasswordless.models import CallbackToken
-from drfpasswordless.settings import api_settings
+from drfpasswordless.settings import api_settings, resolved_settings
 from drfpasswordless.serializers import (
     EmailAuthSerializer,
     MobileAuthSerializer,
     CallbackTokenAuthSerializer,
     CallbackTokenVerificationSerializer,
+    MagicLinkAuthSerializer,
     EmailVerificationSerializer,
     MobileVerificationSerializer,
 )
 from drfpasswordless.services import TokenService
+from drfpasswordless.throttling import DEFAULT_THROTTLE_CLASSES
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +29,9 @@ class AbstractBaseObtainCallbackToken(APIView):
 
     message_payload = {}
 
+    # Applied on top of the project's DEFAULT_THROTTLE_CLASSES.
+    passwordless_throttle_classes = DEFAULT_THROTTLE_CLASSES
+
     @property
     def serializer_class(self):
         # Our serializer depending on type
@@ -43,6 +47,9 @@ class AbstractBaseObtainCallbackToken(APIView):
         # Token Type
         raise NotImplementedError
 
+    def get_throttles(self):
+        return super().get_throttles() + [throttle() for throttle in self.passwordless_throttle_classes]
+
     def post(self, request, *args, **kwargs):
         if self.alias_type.upper() not in api_settings.PASSWORDLESS_AUTH_TYPES:
             # Only allow auth types allowed in settings.
@@ -53,7 +60,7 @@ class AbstractBaseObtainCallbackToken(APIView):
             # Validate -
             user = serializer.validated_data['user']
             # Create and send callback token
-            success = TokenService.send_token(user, self.alias_type, self.token_type, **self.message_payload)
+            success = self.send_token(user)
 
             # Respond With Success Or Failure of Sent
             if success:
@@ -66,6 +73,9 @@ class AbstractBaseObtainCallbackToken(APIView):
         else:
             return Response(serializer.error_messages, status=status.HTTP_400_BAD_REQUEST)
 
+    def send_token(self, user):
+        return TokenService.send_token(user, self.alias_type, self.token_type, **self.message_payload)
+
 
 class ObtainEmailCallbackToken(AbstractBaseObtainCallbackToken):
     permission_classes = (AllowAny,)
@@ -84,6 +94,24 @@ class ObtainEmailCallbackToken(AbstractBaseObtainCallbackToken):
                        "email_html": email_html}
 
 
+class ObtainEmailMagicLink(ObtainEmailCallbackToken):
+    """
+    Emails the user a link to sign in with instead of a 6-digit token.
+    """
+    success_response = "A login link has been sent to your email."
+    failure_response = "Unable to email you a login link. Try again later."
+
+    email_subject = api_settings.PASSWORDLESS_MAGIC_LINK_EMAIL_SUBJECT
+    email_plaintext = api_settings.PASSWORDLESS_MAGIC_LINK_EMAIL_PLAINTEXT_MESSAGE
+    email_html = api_settings.PASSWORDLESS_MAGIC_LINK_EMAIL_HTML_TEMPLATE_NAME
+    message_payload = {"email_subject": email_subject,
+                       "email_plaintext": email_plaintext,
+                       "email_html": email_html}
+
+    def send_token(self, user):
+        return TokenService.send_magic_link(user, **self.message_payload)
+
+
 class ObtainMobileCallbackToken(AbstractBaseObtainCallbackToken):
     permission_classes = (AllowAny,)
     serializer_class = MobileAuthSerializer
@@ -140,11 +168,11 @@ class AbstractBaseObtainAuthToken(APIView):
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid(raise_exception=True):
             user = serializer.validated_data["user"]
-            token_creator = import_string(api_settings.PASSWORDLESS_AUTH_TOKEN_CREATOR)
+            token_creator = resolved_settings.PASSWORDLESS_AUTH_TOKEN_CREATOR
             (token, _) = token_creator(user)
 
             if token:
-                TokenSerializer = import_string(api_settings.PASSWORDLESS_AUTH_TOKEN_SERIALIZER)
+                TokenSerializer = resolved_settings.PASSWORDLESS_AUTH_TOKEN_SERIALIZER
                 token_serializer = TokenSerializer(data=token.__dict__, partial=True, context={"request": request})
                 if token_serializer.is_valid():
                     # Return our key for consumption.
@@ -178,3 +206,11 @@ class VerifyAliasFromCallbackToken(APIView):
             logger.error("Couldn't verify unknown user. Errors on serializer: {}".format(serializer.error_messages))
 
         return Response({"detail": "We couldn't verify this alias. Try again later."}, status.HTTP_400_BAD_REQUEST)
+
+
+class ObtainAuthTokenFromMagicLink(AbstractBaseObtainAuthToken):
+    """
+    Returns an Auth Token for the key of a magic link.
+    """
+    permission_classes = (AllowAny,)
+    serializer_class = MagicLinkAuthSerializer
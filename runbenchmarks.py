@@ -0,0 +1,163 @@
+#! /usr/bin/env python
+"""
+Benchmarks every passwordless endpoint against an in-memory SQLite database.
+
+    python runbenchmarks.py
+    python runbenchmarks.py --iterations 500 --token-rows 0,100000,1000000
+    python runbenchmarks.py auth_token verify_token --max-p99 20
+    python runbenchmarks.py --inserts 1000000
+    python runbenchmarks.py --bulk 10000,100000
+    python runbenchmarks.py --stores 5000
+    python runbenchmarks.py --alias-lookups 1000000
+    python runbenchmarks.py --smtp 1000
+    python runbenchmarks.py --concurrency 200
+
+Prints the queries, p50/p99 latency and throughput of each endpoint and
+exits with a non-zero status if any endpoint makes more queries than its
+budget in tests/benchmarks.py, or is slower than --max-p99 milliseconds.
+The throughput options only run their own benchmark: --inserts compares
+token inserts with time-ordered and random ids, --bulk compares bulk token
+issuance with issuing tokens one user at a time, --stores compares issuing
+and redeeming tokens with each token store, --alias-lookups compares
+case-insensitive and normalized user lookups by alias, --smtp compares ways
+of sending token emails to a local SMTP server, and --concurrency compares
+sending them from async views and worker threads.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+
+
+sys.path.append(os.path.dirname(__file__))
+
+
+def setup_django():
+    from tests.conftest import pytest_configure
+    pytest_configure()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, serialize=False)
+
+
+def run(names, iterations, token_rows):
+    from django.db import transaction
+    from tests.benchmarks import EndpointBenchmark
+
+    benchmark = EndpointBenchmark(iterations=iterations, token_rows=token_rows)
+    # Every table size starts from an empty database.
+    with transaction.atomic():
+        benchmark.setUp()
+        try:
+            results = benchmark.run(names)
+        finally:
+            benchmark.tearDown()
+        transaction.set_rollback(True)
+    return results
+
+
+def run_rolled_back(benchmark):
+    from django.db import transaction
+
+    with transaction.atomic():
+        results = benchmark.run()
+        transaction.set_rollback(True)
+    return results
+
+
+def print_throughput(heading, unit, results, precision=0):
+    print('%-20s %12s' % (heading, unit))
+    for name, throughput in results.items():
+        print('%-20s %12.*f' % (name, precision, throughput))
+    print()
+
+
+def main(argv):
+    from tests.benchmarks import QUERY_BUDGETS
+
+    parser = argparse.ArgumentParser(description='Benchmark the passwordless endpoints.')
+    parser.add_argument('endpoints', nargs='*', metavar='endpoint',
+                        help='URL names to benchmark, all of them by default: %s.' % ', '.join(QUERY_BUDGETS))
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='Requests made to each endpoint.')
+    parser.add_argument('--token-rows', default='0,10000',
+                        help='Comma separated sizes of the token table to benchmark with.')
+    parser.add_argument('--max-p99', type=float, default=None,
+                        help='Fail if any endpoint has a p99 latency above this many milliseconds.')
+    parser.add_argument('--inserts', type=int, nargs='?', const=100000, default=None, metavar='ROWS',
+                        help='Compare inserting this many tokens with time-ordered and random ids instead.')
+    parser.add_argument('--bulk', nargs='?', const='10000,100000', default=None, metavar='USERS',
+                        help='Compare bulk and one at a time token issuance for these comma separated '
+                             'numbers of users instead.')
+    parser.add_argument('--stores', type=int, nargs='?', const=1000, default=None, metavar='USERS',
+                        help='Compare issuing and redeeming tokens for this many users with each token store instead.')
+    parser.add_argument('--alias-lookups', type=int, nargs='?', const=1000000, default=None, metavar='USERS',
+                        help='Compare case-insensitive and normalized alias lookups in a table of this many '
+                             'users instead.')
+    parser.add_argument('--smtp', type=int, nargs='?', const=1000, default=None, metavar='MESSAGES',
+                        help='Compare ways of sending this many token emails to a local SMTP server instead. '
+                             'Requires aiosmtpd.')
+    parser.add_argument('--concurrency', type=int, nargs='?', const=200, default=None, metavar='SENDS',
+                        help='Compare sending this many token emails at once from async views and from worker '
+                             'threads, to a local SMTP server that takes 50ms per email, instead. Requires '
+                             'aiosmtpd and aiosmtplib.')
+    args = parser.parse_args(argv)
+
+    if args.inserts is not None:
+        from tests.benchmarks import InsertBenchmark
+        print_throughput('ids', 'inserts/s', run_rolled_back(InsertBenchmark(rows=args.inserts)))
+        return 0
+
+    if args.bulk is not None:
+        from tests.benchmarks import BulkIssueBenchmark
+        for users in [int(users) for users in args.bulk.split(',')]:
+            print_throughput('%d users' % users, 'tokens/s', run_rolled_back(BulkIssueBenchmark(users=users)))
+        return 0
+
+    if args.stores is not None:
+        from tests.benchmarks import TokenStoreBenchmark
+        print_throughput('store', 'tokens/s', run_rolled_back(TokenStoreBenchmark(users=args.stores)))
+        return 0
+
+    if args.alias_lookups is not None:
+        from tests.benchmarks import AliasLookupBenchmark
+        print_throughput('lookup', 'lookups/s', run_rolled_back(AliasLookupBenchmark(users=args.alias_lookups)))
+        return 0
+
+    if args.smtp is not None:
+        from tests.benchmarks import SMTPBenchmark
+        print_throughput('email', 'ms/msg', SMTPBenchmark(messages=args.smtp).run(), precision=2)
+        return 0
+
+    if args.concurrency is not None:
+        from tests.benchmarks import ConcurrentDeliveryBenchmark
+        print_throughput('backend', 'emails/s', ConcurrentDeliveryBenchmark(sends=args.concurrency).run())
+        return 0
+
+    for name in args.endpoints:
+        if name not in QUERY_BUDGETS:
+            parser.error('unknown endpoint %r' % name)
+
+    failed = False
+    for token_rows in [int(rows) for rows in args.token_rows.split(',')]:
+        print('Token table: %d rows' % token_rows)
+        print('%-22s %9s %9s %9s %11s' % ('endpoint', 'queries', 'p50 ms', 'p99 ms', 'requests/s'))
+        for result in run(args.endpoints, args.iterations, token_rows):
+            p99 = result.percentile(99) * 1000
+            slow = args.max_p99 is not None and p99 > args.max_p99
+            print('%-22s %4d / %-2d %9.2f %9.2f %11.0f%s' % (
+                result.name, result.queries, result.budget, result.percentile(50) * 1000, p99,
+                result.throughput, '  OVER BUDGET' if result.over_budget or slow else ''))
+            failed = failed or result.over_budget or slow
+        print()
+
+    print('Benchmarks failed' if failed else 'Benchmarks passed')
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    setup_django()
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,7 @@
+from django.urls import path, include
+
+app_name = 'drfpasswordless'
+
+urlpatterns = [
+    path('', include('drfpasswordless.async_urls')),
+]
@@ -0,0 +1,479 @@
+"""
+Benchmarks for every passwordless endpoint.
+
+Each endpoint is requested over and over against a token table holding a
+given number of used tokens, recording the queries and time each request
+takes. Run them with ``python runbenchmarks.py``. The query budgets below are
+also checked by the test suite in test_benchmarks.py.
+
+The other benchmarks measure throughput, each with a runbenchmarks.py option:
+
+- InsertBenchmark compares how fast tokens are inserted with time-ordered
+  and random ids, with ``--inserts``.
+- BulkIssueBenchmark compares bulk issuance with issuing tokens one user at
+  a time, with ``--bulk``.
+- TokenStoreBenchmark compares issuing and redeeming tokens with each token
+  store, with ``--stores``.
+- AliasLookupBenchmark compares case-insensitive and normalized user
+  lookups by alias, with ``--alias-lookups``.
+- SMTPBenchmark compares sending token emails to a local SMTP server with a
+  connection per email, a persistent connection and batches, with ``--smtp``.
+  It requires aiosmtpd.
+- ConcurrentDeliveryBenchmark compares sending emails from async views with
+  aiosmtplib and from worker threads, against a slow SMTP server, with
+  ``--concurrency``. It requires aiosmtpd and aiosmtplib.
+"""
+import asyncio
+import math
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+
+from rest_framework.test import APIClient
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from drfpasswordless.aliases import alias_lookup
+from drfpasswordless.delivery import AsyncSMTPDeliveryBackend, SyncDeliveryBackend
+from drfpasswordless.mail import close_email_connection
+from drfpasswordless.models import CallbackToken, generate_uuid7
+from drfpasswordless.services import TokenService
+from drfpasswordless.settings import api_settings
+from drfpasswordless.utils import (
+    build_callback_token_email,
+    consume_callback_token,
+    create_callback_token_for_user,
+    create_magic_link_token_for_user,
+    send_email_with_callback_token,
+    send_emails_with_callback_tokens,
+)
+
+User = get_user_model()
+
+# The most queries a single request to each endpoint may make.
+QUERY_BUDGETS = {
+    'auth_email': 3,
+    'auth_mobile': 3,
+    'auth_token': 4,
+    'auth_email_magic_link': 3,
+    'auth_magic_link': 4,
+    'verify_email': 2,
+    'verify_mobile': 2,
+    'verify_token': 3,
+}
+
+# Settings the endpoints need to be able to send tokens without leaving the process.
+BENCHMARK_SETTINGS = {
+    'PASSWORDLESS_AUTH_TYPES': ['EMAIL', 'MOBILE'],
+    'PASSWORDLESS_EMAIL_NOREPLY_ADDRESS': 'noreply@example.com',
+    'PASSWORDLESS_MOBILE_NOREPLY_NUMBER': '+15550000000',
+    'PASSWORDLESS_SMS_PROVIDER': 'drfpasswordless.sms.LocmemSMSProvider',
+    'PASSWORDLESS_MAGIC_LINK_URL': 'https://example.com/login/?token=%s',
+}
+
+
+def count_queries(context):
+    """
+    Counts captured queries, leaving out savepoints. They depend on whether the
+    request runs inside another transaction, as it does in the test suite.
+    """
+    return len([query for query in context.captured_queries if 'SAVEPOINT' not in query['sql']])
+
+
+class Result(object):
+    """
+    Queries and timings of one endpoint.
+    """
+
+    def __init__(self, name, queries, timings):
+        self.name = name
+        self.queries = queries
+        self.timings = sorted(timings)
+        self.budget = QUERY_BUDGETS[name]
+
+    @property
+    def over_budget(self):
+        return self.queries > self.budget
+
+    def percentile(self, percent):
+        return self.timings[max(int(math.ceil(len(self.timings) * percent / 100.0)) - 1, 0)]
+
+    @property
+    def throughput(self):
+        return len(self.timings) / sum(self.timings)
+
+
+class EndpointBenchmark(object):
+    """
+    Requests each endpoint ``iterations`` times with a token table holding
+    ``token_rows`` used tokens. Every request is made for a different user.
+
+    Requests are made through DRF's test client, so timings include the URL
+    resolver and middleware but no network.
+    """
+
+    def __init__(self, iterations=100, token_rows=0):
+        self.iterations = iterations
+        self.token_rows = token_rows
+
+    def setUp(self):
+        self._saved_settings = {name: getattr(api_settings, name) for name in BENCHMARK_SETTINGS}
+        for name, value in BENCHMARK_SETTINGS.items():
+            setattr(api_settings, name, value)
+
+        # One extra user for the request that warms up each endpoint.
+        self.users = User.objects.bulk_create([
+            User(email='bench%d@example.com' % i, mobile='+1555%07d' % i) for i in range(self.iterations + 1)
+        ])
+        self.fill_token_table()
+
+    def tearDown(self):
+        for name, value in self._saved_settings.items():
+            setattr(api_settings, name, value)
+
+    def fill_token_table(self):
+        filler = User.objects.create(email='filler@example.com')
+        batch_size = api_settings.PASSWORDLESS_BULK_BATCH_SIZE
+        for start in range(0, self.token_rows, batch_size):
+            CallbackToken.objects.bulk_create([
+                CallbackToken(user=filler, key='%06d' % (i % 1000000), type=CallbackToken.TOKEN_TYPE_AUTH,
+                              to_alias_type='EMAIL', to_alias=filler.email, is_active=False)
+                for i in range(start, min(start + batch_size, self.token_rows))
+            ])
+
+    def run(self, names=None):
+        results = []
+        for name in names or QUERY_BUDGETS:
+            results.append(self.run_endpoint(name))
+        return results
+
+    def run_endpoint(self, name):
+        prepare = getattr(self, 'prepare_%s' % name)
+        url = reverse('drfpasswordless:%s' % name)
+
+        queries, timings = 0, []
+        for i, user in enumerate(self.users):
+            # Throttle counters are kept out of the way, they'd refuse most of these requests.
+            cache.clear()
+            client, data = prepare(user)
+            # The query log only holds the last 9000 queries, which breaks counting once it's full.
+            reset_queries()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.post(url, data)
+                elapsed = time.perf_counter() - start
+            assert response.status_code == 200, (name, response.status_code, response.content)
+
+            if i > 0:
+                queries = max(queries, count_queries(context))
+                timings.append(elapsed)
+        return Result(name, queries, timings)
+
+    def authenticated_client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def prepare_auth_email(self, user):
+        return APIClient(), {'email': user.email}
+
+    def prepare_auth_mobile(self, user):
+        return APIClient(), {'mobile': user.mobile}
+
+    def prepare_auth_token(self, user):
+        token = create_callback_token_for_user(user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        return APIClient(), {'email': user.email, 'token': token.key}
+
+    def prepare_auth_email_magic_link(self, user):
+        return APIClient(), {'email': user.email}
+
+    def prepare_auth_magic_link(self, user):
+        token, key = create_magic_link_token_for_user(user)
+        return APIClient(), {'token': key}
+
+    def prepare_verify_email(self, user):
+        return self.authenticated_client(user), {}
+
+    def prepare_verify_mobile(self, user):
+        return self.authenticated_client(user), {}
+
+    def prepare_verify_token(self, user):
+        token = create_callback_token_for_user(user, 'email', CallbackToken.TOKEN_TYPE_VERIFY)
+        return self.authenticated_client(user), {'email': user.email, 'token': token.key}
+
+
+class InsertBenchmark(object):
+    """
+    Inserts ``rows`` used tokens, ``batch_size`` at a time, with ids from each
+    of the generators in ``ID_GENERATORS``. Returns the rows inserted per
+    second with each.
+    """
+    ID_GENERATORS = {'uuid7': generate_uuid7, 'uuid4': uuid.uuid4}
+
+    def __init__(self, rows=100000, batch_size=1000):
+        self.rows = rows
+        self.batch_size = batch_size
+
+    def run(self):
+        user = User.objects.create(email='inserts@example.com')
+        results = {}
+        for name, generate_id in self.ID_GENERATORS.items():
+            CallbackToken.objects.all().delete()
+            start = time.perf_counter()
+            for batch_start in range(0, self.rows, self.batch_size):
+                CallbackToken.objects.bulk_create([
+                    CallbackToken(id=generate_id(), user=user, key='%06d' % (i % 1000000),
+                                  type=CallbackToken.TOKEN_TYPE_AUTH, is_active=False)
+                    for i in range(batch_start, min(batch_start + self.batch_size, self.rows))
+                ])
+            results[name] = self.rows / (time.perf_counter() - start)
+        return results
+
+
+class BulkIssueBenchmark(object):
+    """
+    Issues verification tokens to ``sample`` users one at a time with
+    TokenService.send_token, then to all ``users`` users with
+    TokenService.send_bulk_tokens. Deliveries are kept in memory. Returns the tokens
+    issued per second with each.
+    """
+
+    def __init__(self, users=10000, sample=1000):
+        self.users = users
+        self.sample = sample
+
+    def run(self):
+        saved_backend = api_settings.PASSWORDLESS_DELIVERY_BACKEND
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.LocmemDeliveryBackend'
+        try:
+            batch_size = api_settings.PASSWORDLESS_BULK_BATCH_SIZE
+            for start in range(0, self.users, batch_size):
+                User.objects.bulk_create([User(email='bulk%d@example.com' % i)
+                                          for i in range(start, min(start + batch_size, self.users))])
+            users = User.objects.filter(email__startswith='bulk').order_by('pk')
+            results = {}
+
+            # The sample goes first, while there are few active keys for new ones to collide with.
+            sample = list(users[:self.sample])
+            start = time.perf_counter()
+            for user in sample:
+                TokenService.send_token(user, 'email', CallbackToken.TOKEN_TYPE_VERIFY)
+            results['send_token'] = len(sample) / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            stats = TokenService.send_bulk_tokens(users, 'email', CallbackToken.TOKEN_TYPE_VERIFY)
+            results['send_bulk_tokens'] = stats['issued'] / (time.perf_counter() - start)
+            return results
+        finally:
+            api_settings.PASSWORDLESS_DELIVERY_BACKEND = saved_backend
+
+
+class TokenStoreBenchmark(object):
+    """
+    Issues a token to each of ``users`` users and redeems it, with each of the
+    stores in ``STORES``. Returns the tokens issued and redeemed per second
+    with each. The cache stores use the default cache, so tokens are issued
+    and redeemed ``round_size`` at a time to stay below the locmem cache's
+    300 entry limit.
+    """
+    round_size = 100
+    STORES = ('drfpasswordless.stores.ModelTokenStore', 'drfpasswordless.stores.CacheTokenStore',
+              'drfpasswordless.stores.SignedTokenStore')
+
+    def __init__(self, users=1000):
+        self.users = users
+
+    def run(self):
+        saved_store = api_settings.PASSWORDLESS_TOKEN_STORE
+        users = User.objects.bulk_create([User(email='store%d@example.com' % i) for i in range(self.users)])
+        results = {}
+        try:
+            for store in self.STORES:
+                api_settings.PASSWORDLESS_TOKEN_STORE = store
+                name = store.rsplit('.', 1)[1]
+
+                issuing = redeeming = 0
+                for round_start in range(0, self.users, self.round_size):
+                    round_users = users[round_start:round_start + self.round_size]
+                    start = time.perf_counter()
+                    tokens = [create_callback_token_for_user(user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+                              for user in round_users]
+                    issuing += time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    for user, token in zip(round_users, tokens):
+                        redeemed = consume_callback_token(token.key, CallbackToken.TOKEN_TYPE_AUTH, 'email',
+                                                          user.email)
+                        assert redeemed is not None, (store, user.email)
+                    redeeming += time.perf_counter() - start
+                results['%s issue' % name] = self.users / issuing
+                results['%s redeem' % name] = self.users / redeeming
+        finally:
+            api_settings.PASSWORDLESS_TOKEN_STORE = saved_store
+        return results
+
+
+class AliasLookupBenchmark(object):
+    """
+    Looks up ``lookups`` users by email in a table of ``users`` users, both
+    case-insensitively and with PASSWORDLESS_NORMALIZE_ALIASES on. Returns
+    the lookups per second with each.
+    """
+
+    def __init__(self, users=1000000, lookups=200):
+        self.users = users
+        self.lookups = lookups
+
+    def run(self):
+        saved_normalize = api_settings.PASSWORDLESS_NORMALIZE_ALIASES
+        batch_size = 10000
+        for start in range(0, self.users, batch_size):
+            User.objects.bulk_create([User(email='alias%d@example.com' % i)
+                                      for i in range(start, min(start + batch_size, self.users))])
+        step = max(self.users // self.lookups, 1)
+        emails = ['Alias%d@Example.com' % i for i in range(0, self.users, step)][:self.lookups]
+
+        results = {}
+        try:
+            for name, normalize in (('iexact', False), ('normalized', True)):
+                api_settings.PASSWORDLESS_NORMALIZE_ALIASES = normalize
+                start = time.perf_counter()
+                for email in emails:
+                    assert User.objects.filter(**alias_lookup('email', email)).exists(), (name, email)
+                results[name] = len(emails) / (time.perf_counter() - start)
+        finally:
+            api_settings.PASSWORDLESS_NORMALIZE_ALIASES = saved_normalize
+        return results
+
+
+class CountingHandler(object):
+    """
+    An aiosmtpd handler that counts the emails it receives, taking ``delay``
+    seconds to accept each one.
+    """
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+        return '250 OK'
+
+
+@contextmanager
+def smtp_server(handler):
+    """
+    Runs an aiosmtpd server on a free local port, with Django's SMTP email
+    backend pointed at it.
+    """
+    from aiosmtpd.controller import Controller
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    controller = Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    close_email_connection()
+    try:
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                               EMAIL_HOST='127.0.0.1', EMAIL_PORT=port):
+            yield
+    finally:
+        close_email_connection()
+        controller.stop()
+
+
+class SMTPBenchmark(object):
+    """
+    Sends ``messages`` token emails to a local SMTP server: each over a new
+    connection, as send_mail does, each over the persistent connection, and
+    over the persistent connection in batches of PASSWORDLESS_DELIVERY_BATCH_SIZE.
+    Returns the milliseconds each email takes with each.
+    """
+
+    def __init__(self, messages=1000):
+        self.messages = messages
+
+    def run(self):
+        saved_noreply = api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = 'noreply@example.com'
+        users = [User(pk=i, email='smtp%d@example.com' % i) for i in range(self.messages)]
+        tokens = [CallbackToken(key='%06d' % i) for i in range(self.messages)]
+        batch_size = api_settings.PASSWORDLESS_DELIVERY_BATCH_SIZE
+        handler = CountingHandler()
+
+        def send_mail():
+            for user, token in zip(users, tokens):
+                build_callback_token_email(user, token).send()
+
+        def persistent():
+            for user, token in zip(users, tokens):
+                assert send_email_with_callback_token(user, token)
+
+        def batched():
+            for start in range(0, self.messages, batch_size):
+                assert all(send_emails_with_callback_tokens([(user, token, {}) for user, token in
+                                                             zip(users[start:start + batch_size],
+                                                                 tokens[start:start + batch_size])]))
+
+        results = {}
+        try:
+            with smtp_server(handler):
+                for name, send in (('send_mail', send_mail), ('persistent', persistent), ('batched', batched)):
+                    received = handler.received
+                    start = time.perf_counter()
+                    send()
+                    results[name] = (time.perf_counter() - start) * 1000 / self.messages
+                    assert handler.received - received == self.messages, name
+        finally:
+            api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = saved_noreply
+        return results
+
+
+class ConcurrentDeliveryBenchmark(object):
+    """
+    Sends ``sends`` token emails at once through a delivery backend's asend, as
+    the async views do, to a local SMTP server that takes ``delay`` seconds to
+    accept each one. SyncDeliveryBackend sends from worker threads and
+    AsyncSMTPDeliveryBackend with aiosmtplib on the event loop. Returns the
+    emails sent per second with each.
+    """
+    BACKENDS = (
+        ('threads', SyncDeliveryBackend),
+        ('aiosmtplib', AsyncSMTPDeliveryBackend),
+    )
+
+    def __init__(self, sends=200, delay=0.05):
+        self.sends = sends
+        self.delay = delay
+
+    def run(self):
+        saved_noreply = api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = 'noreply@example.com'
+        users = [User(pk=i, email='concurrent%d@example.com' % i) for i in range(self.sends)]
+        tokens = [CallbackToken(key='%06d' % i) for i in range(self.sends)]
+        handler = CountingHandler(delay=self.delay)
+
+        async def send_all(backend):
+            return await asyncio.gather(*[backend.asend(user, token, 'email') for user, token in zip(users, tokens)])
+
+        results = {}
+        try:
+            with smtp_server(handler):
+                for name, backend_class in self.BACKENDS:
+                    received = handler.received
+                    start = time.perf_counter()
+                    sent = asyncio.run(send_all(backend_class()))
+                    results[name] = self.sends / (time.perf_counter() - start)
+                    assert all(sent) and handler.received - received == self.sends, name
+        finally:
+            api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = saved_noreply
+        return results
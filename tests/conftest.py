@@ -1,3 +1,14 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Throttle counters and cached tokens mustn't leak between tests.
+    from django.core.cache import cache
+    cache.clear()
+    yield
+
+
 def pytest_configure():
     from django.conf import settings
 
@@ -0,0 +1,101 @@
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from drfpasswordless.aliases import normalize_alias
+from drfpasswordless.delivery import get_delivery_backend
+from drfpasswordless.settings import api_settings, DEFAULTS
+
+User = get_user_model()
+
+
+class NormalizeAliasTests(TestCase):
+
+    def test_email_is_lowercased(self):
+        self.assertEqual(normalize_alias('email', ' Aaron@Example.COM '), 'aaron@example.com')
+
+    def test_mobile_is_e164(self):
+        self.assertEqual(normalize_alias('mobile', '+1 (555) 123-4567'), '+15551234567')
+        self.assertEqual(normalize_alias('mobile', '0044 20 7946 0000'), '+442079460000')
+
+    def test_empty_aliases_untouched(self):
+        self.assertIsNone(normalize_alias('email', None))
+        self.assertEqual(normalize_alias('mobile', ''), '')
+
+
+class NormalizedAliasLookupTests(APITestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_NORMALIZE_ALIASES = True
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.LocmemDeliveryBackend'
+        self.outbox = get_delivery_backend().outbox
+        self.outbox.clear()
+
+        self.url = reverse('drfpasswordless:auth_email')
+        self.challenge_url = reverse('drfpasswordless:auth_token')
+        self.email_field_name = api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME
+
+    def test_aliases_normalized_on_save(self):
+        user = User.objects.create(**{self.email_field_name: 'Aaron@Example.com'})
+        user.refresh_from_db()
+        self.assertEqual(getattr(user, self.email_field_name), 'aaron@example.com')
+
+    def test_registration_stores_normalized_alias(self):
+        response = self.client.post(self.url, {'email': 'Aaron@Example.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(User.objects.filter(**{self.email_field_name: 'aaron@example.com'}).exists())
+
+    def test_mixed_case_alias_authenticates_with_exact_lookups(self):
+        User.objects.create(**{self.email_field_name: 'aaron@example.com'})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'email': 'AARON@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(User.objects.count(), 1)
+        key = self.outbox[-1].token.key
+
+        with CaptureQueriesContext(connection) as challenge_queries:
+            response = self.client.post(self.challenge_url, {'email': 'Aaron@EXAMPLE.com', 'token': key})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        for query in queries.captured_queries + challenge_queries.captured_queries:
+            self.assertNotIn('LIKE', query['sql'])
+            self.assertNotIn('UPPER', query['sql'])
+
+    def test_formatting_change_keeps_verification(self):
+        api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED = True
+        user = User.objects.create(**{self.email_field_name: 'aaron@example.com', 'email_verified': True})
+        setattr(user, self.email_field_name, 'AARON@example.com')
+        user.save()
+        self.assertTrue(user.email_verified)
+
+    def test_saving_unnormalized_alias_keeps_verification(self):
+        api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED = True
+        api_settings.PASSWORDLESS_AUTO_SEND_VERIFICATION_TOKEN = True
+        user = User.objects.create(**{self.email_field_name: 'aaron@example.com', 'email_verified': True})
+        # Saved before PASSWORDLESS_NORMALIZE_ALIASES was turned on.
+        User.objects.filter(pk=user.pk).update(**{self.email_field_name: 'Aaron@Example.com'})
+
+        user = User.objects.get(pk=user.pk)
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual(getattr(user, self.email_field_name), 'aaron@example.com')
+        self.assertTrue(user.email_verified)
+        self.assertEqual(self.outbox, [])
+
+    def test_new_alias_still_unverified(self):
+        api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED = True
+        user = User.objects.create(**{self.email_field_name: 'Aaron@Example.com', 'email_verified': True})
+        setattr(user, self.email_field_name, 'Bob@Example.com')
+        user.save()
+        self.assertFalse(user.email_verified)
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_NORMALIZE_ALIASES = DEFAULTS['PASSWORDLESS_NORMALIZE_ALIASES']
+        api_settings.PASSWORDLESS_AUTO_SEND_VERIFICATION_TOKEN = DEFAULTS['PASSWORDLESS_AUTO_SEND_VERIFICATION_TOKEN']
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = DEFAULTS['PASSWORDLESS_DELIVERY_BACKEND']
+        api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED = DEFAULTS['PASSWORDLESS_USER_MARK_EMAIL_VERIFIED']
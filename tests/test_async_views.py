@@ -0,0 +1,120 @@
+import socket
+from unittest import skipUnless
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.test import TestCase, override_settings
+from drfpasswordless.delivery import get_delivery_backend
+from drfpasswordless.settings import api_settings, DEFAULTS
+from drfpasswordless.utils import CallbackToken, create_callback_token_for_user
+
+try:
+    import aiosmtplib
+    from aiosmtpd.controller import Controller
+except ImportError:
+    aiosmtplib = None
+
+User = get_user_model()
+
+
+class RecordingHandler(object):
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return '250 OK'
+
+
+@override_settings(ROOT_URLCONF='tests.async_urls')
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.LocmemDeliveryBackend'
+        self.outbox = get_delivery_backend().outbox
+        self.outbox.clear()
+
+        self.email = 'aaron@example.com'
+        self.email_field_name = api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME
+
+    async def test_email_token_sent(self):
+        response = await self.async_client.post('/auth/email/', {'email': self.email},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.outbox), 1)
+
+        user = await User.objects.aget(**{self.email_field_name: self.email})
+        self.assertEqual(self.outbox[0].user, user)
+        self.assertFalse(user.has_usable_password())
+
+    async def test_invalid_alias_rejected(self):
+        response = await self.async_client.post('/auth/email/', {'email': 'not-an-email'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', response.json())
+
+    async def test_unknown_alias_rejected_without_registration(self):
+        api_settings.PASSWORDLESS_REGISTER_NEW_USERS = False
+        response = await self.async_client.post('/auth/email/', {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(await User.objects.aexists())
+
+    async def test_token_requests_throttled(self):
+        api_settings.PASSWORDLESS_THROTTLE_RATES = {'alias': '1/hour'}
+        response = await self.async_client.post('/auth/email/', {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = await self.async_client.post('/auth/email/', {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+    def test_token_redeemed(self):
+        user = User.objects.create(**{self.email_field_name: self.email})
+        token = create_callback_token_for_user(user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+
+        response = self.client.post('/auth/token/', {'email': self.email, 'token': token.key})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['token'], Token.objects.get(user=user).key)
+
+        # Tokens can only be used once.
+        response = self.client.post('/auth/token/', {'email': self.email, 'token': token.key})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {'non_field_errors': ['Invalid alias parameters provided.']})
+
+    def test_sync_backend_sends_from_thread(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = DEFAULTS['PASSWORDLESS_DELIVERY_BACKEND']
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = 'noreply@example.com'
+
+        response = self.client.post('/auth/email/', {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(mail.outbox), 1)
+
+    @skipUnless(aiosmtplib, 'Requires aiosmtplib and aiosmtpd.')
+    def test_async_smtp_backend(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.AsyncSMTPDeliveryBackend'
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = 'noreply@example.com'
+        handler = RecordingHandler()
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        controller = Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        try:
+            with self.settings(EMAIL_HOST='127.0.0.1', EMAIL_PORT=port):
+                response = self.client.post('/auth/email/', {'email': self.email})
+        finally:
+            controller.stop()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(handler.messages), 1)
+        self.assertEqual(handler.messages[0].rcpt_tos, [self.email])
+        token = CallbackToken.objects.get(user__email=self.email, is_active=True)
+        self.assertIn(token.key.encode(), handler.messages[0].content)
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = DEFAULTS['PASSWORDLESS_DELIVERY_BACKEND']
+        api_settings.PASSWORDLESS_REGISTER_NEW_USERS = DEFAULTS['PASSWORDLESS_REGISTER_NEW_USERS']
+        api_settings.PASSWORDLESS_THROTTLE_RATES = DEFAULTS['PASSWORDLESS_THROTTLE_RATES']
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = DEFAULTS['PASSWORDLESS_EMAIL_NOREPLY_ADDRESS']
@@ -1,11 +1,16 @@
+from datetime import timedelta
+
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from rest_framework.test import APITestCase
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory, APITestCase
 
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
+from drfpasswordless.authentication import SignedTokenAuthentication, unsign_auth_token
 from drfpasswordless.settings import api_settings, DEFAULTS
-from drfpasswordless.utils import CallbackToken
+from drfpasswordless.utils import CallbackToken, create_callback_token_for_user
 
 User = get_user_model()
 
@@ -365,3 +370,120 @@ class MobileLoginCallbackTokenTests(APITestCase):
         api_settings.PASSWORDLESS_AUTH_TYPES = DEFAULTS['PASSWORDLESS_AUTH_TYPES']
         api_settings.PASSWORDLESS_MOBILE_NOREPLY_NUMBER = DEFAULTS['PASSWORDLESS_MOBILE_NOREPLY_NUMBER']
         self.user.delete()
+
+
+class CallbackTokenRedemptionTests(APITestCase):
+    """
+    Exchanging a callback token is a single lookup plus a conditional update.
+    """
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_AUTH_TYPES = ['EMAIL']
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = 'noreply@example.com'
+
+        self.email = 'aaron@example.com'
+        self.url = reverse('drfpasswordless:auth_email')
+        self.challenge_url = reverse('drfpasswordless:auth_token')
+
+        self.email_field_name = api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME
+        self.user = User.objects.create(**{self.email_field_name: self.email})
+
+    def test_redemption_query_count(self):
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        callback_token = CallbackToken.objects.get(user=self.user, is_active=True)
+        challenge_data = {'email': self.email, 'token': callback_token.key}
+
+        # Token + user lookup, consume, auth token get_or_create (select, savepoint, insert, release)
+        with self.assertNumQueries(6):
+            challenge_response = self.client.post(self.challenge_url, challenge_data)
+        self.assertEqual(challenge_response.status_code, status.HTTP_200_OK)
+
+    def test_expired_token_rejected(self):
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        callback_token = CallbackToken.objects.get(user=self.user, is_active=True)
+        expired_at = timezone.now() - timedelta(seconds=api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME + 1)
+        CallbackToken.objects.filter(pk=callback_token.pk).update(created_at=expired_at)
+
+        challenge_response = self.client.post(self.challenge_url, {'email': self.email, 'token': callback_token.key})
+        self.assertEqual(challenge_response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_redeemed_token_cannot_be_reused(self):
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        callback_token = CallbackToken.objects.get(user=self.user, is_active=True)
+        challenge_data = {'email': self.email, 'token': callback_token.key}
+
+        challenge_response = self.client.post(self.challenge_url, challenge_data)
+        self.assertEqual(challenge_response.status_code, status.HTTP_200_OK)
+
+        challenge_response = self.client.post(self.challenge_url, challenge_data)
+        self.assertEqual(challenge_response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_AUTH_TYPES = DEFAULTS['PASSWORDLESS_AUTH_TYPES']
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = DEFAULTS['PASSWORDLESS_EMAIL_NOREPLY_ADDRESS']
+        self.user.delete()
+
+
+class SignedAuthTokenTests(APITestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = 'noreply@example.com'
+        api_settings.PASSWORDLESS_AUTH_TOKEN_CREATOR = 'drfpasswordless.utils.create_signed_authentication_token'
+        api_settings.PASSWORDLESS_AUTH_TOKEN_SERIALIZER = 'drfpasswordless.serializers.SignedTokenResponseSerializer'
+
+        self.email = 'aaron@example.com'
+        self.challenge_url = reverse('drfpasswordless:auth_token')
+        self.email_field_name = api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME
+        self.user = User.objects.create(**{self.email_field_name: self.email})
+        self.factory = APIRequestFactory()
+
+    def obtain_signed_token(self):
+        callback_token = create_callback_token_for_user(self.user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        # Token + user lookup and consume, nothing is written for the auth token.
+        with self.assertNumQueries(2):
+            response = self.client.post(self.challenge_url, {'email': self.email, 'token': callback_token.key})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('expires_at', response.data)
+        self.assertFalse(Token.objects.exists())
+        return response.data['token']
+
+    def authenticate(self, key):
+        request = self.factory.get('/', HTTP_AUTHORIZATION='Bearer %s' % key)
+        return SignedTokenAuthentication().authenticate(request)
+
+    def test_signed_token_authenticates(self):
+        key = self.obtain_signed_token()
+        # Loading the user is the only query.
+        with self.assertNumQueries(1):
+            user, auth = self.authenticate(key)
+        self.assertEqual(user, self.user)
+        self.assertEqual(unsign_auth_token(key), self.user.pk)
+
+    def test_tampered_token_rejected(self):
+        key = self.obtain_signed_token()
+        with self.assertNumQueries(0), self.assertRaises(AuthenticationFailed):
+            self.authenticate(key[:-1] + ('A' if key[-1] != 'A' else 'B'))
+
+    def test_expired_token_rejected(self):
+        key = self.obtain_signed_token()
+        api_settings.PASSWORDLESS_SIGNED_AUTH_TOKEN_MAX_AGE = -1
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(key)
+
+    def test_deleted_user_rejected(self):
+        key = self.obtain_signed_token()
+        User.objects.filter(pk=self.user.pk).delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(key)
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = DEFAULTS['PASSWORDLESS_EMAIL_NOREPLY_ADDRESS']
+        api_settings.PASSWORDLESS_AUTH_TOKEN_CREATOR = DEFAULTS['PASSWORDLESS_AUTH_TOKEN_CREATOR']
+        api_settings.PASSWORDLESS_AUTH_TOKEN_SERIALIZER = DEFAULTS['PASSWORDLESS_AUTH_TOKEN_SERIALIZER']
+        api_settings.PASSWORDLESS_SIGNED_AUTH_TOKEN_MAX_AGE = DEFAULTS['PASSWORDLESS_SIGNED_AUTH_TOKEN_MAX_AGE']
@@ -0,0 +1,88 @@
+from unittest import skipUnless
+
+from django.test import TestCase
+from tests.benchmarks import (
+    AliasLookupBenchmark,
+    BulkIssueBenchmark,
+    ConcurrentDeliveryBenchmark,
+    EndpointBenchmark,
+    InsertBenchmark,
+    QUERY_BUDGETS,
+    SMTPBenchmark,
+    TokenStoreBenchmark,
+)
+
+try:
+    import aiosmtpd
+except ImportError:
+    aiosmtpd = None
+
+try:
+    import aiosmtplib
+except ImportError:
+    aiosmtplib = None
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Fails when a request to an endpoint makes more queries than its budget.
+    Run ``python runbenchmarks.py`` for timings.
+    """
+
+    def setUp(self):
+        self.benchmark = EndpointBenchmark(iterations=3, token_rows=50)
+        self.benchmark.setUp()
+
+    def test_endpoints_within_query_budgets(self):
+        results = self.benchmark.run()
+        self.assertEqual([result.name for result in results], list(QUERY_BUDGETS))
+        for result in results:
+            with self.subTest(endpoint=result.name):
+                self.assertLessEqual(result.queries, result.budget)
+
+    def tearDown(self):
+        self.benchmark.tearDown()
+
+
+class InsertBenchmarkTests(TestCase):
+
+    def test_every_id_generator_measured(self):
+        results = InsertBenchmark(rows=10, batch_size=4).run()
+        self.assertEqual(set(results), set(InsertBenchmark.ID_GENERATORS))
+
+
+class BulkIssueBenchmarkTests(TestCase):
+
+    def test_both_paths_measured(self):
+        results = BulkIssueBenchmark(users=10, sample=3).run()
+        self.assertEqual(set(results), {'send_bulk_tokens', 'send_token'})
+
+
+class TokenStoreBenchmarkTests(TestCase):
+
+    def test_every_store_measured(self):
+        results = TokenStoreBenchmark(users=5).run()
+        self.assertEqual(len(results), 2 * len(TokenStoreBenchmark.STORES))
+
+
+class AliasLookupBenchmarkTests(TestCase):
+
+    def test_both_lookups_measured(self):
+        results = AliasLookupBenchmark(users=20, lookups=5).run()
+        self.assertEqual(set(results), {'iexact', 'normalized'})
+
+
+@skipUnless(aiosmtpd, 'Requires aiosmtpd.')
+class SMTPBenchmarkTests(TestCase):
+
+    def test_every_method_measured(self):
+        results = SMTPBenchmark(messages=3).run()
+        self.assertEqual(set(results), {'send_mail', 'persistent', 'batched'})
+
+
+@skipUnless(aiosmtpd and aiosmtplib, 'Requires aiosmtpd and aiosmtplib.')
+class ConcurrentDeliveryBenchmarkTests(TestCase):
+
+    def test_every_backend_measured(self):
+        results = ConcurrentDeliveryBenchmark(sends=3, delay=0).run()
+        self.assertEqual(len(results), len(ConcurrentDeliveryBenchmark.BACKENDS))
@@ -0,0 +1,90 @@
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from drfpasswordless.delivery import get_delivery_backend
+from drfpasswordless.settings import api_settings, DEFAULTS
+from drfpasswordless.utils import CallbackToken
+
+User = get_user_model()
+
+sent_tokens = []
+
+
+def flaky_email_callback(user, email_token, **kwargs):
+    # Fails on the first attempt only.
+    sent_tokens.append(email_token.key)
+    return len(sent_tokens) > 1
+
+
+class LocmemDeliveryBackendTests(APITestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.LocmemDeliveryBackend'
+        self.backend = get_delivery_backend()
+        self.backend.outbox.clear()
+
+        self.email = 'aaron@example.com'
+        self.url = reverse('drfpasswordless:auth_email')
+
+    def test_token_kept_in_outbox(self):
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(len(self.backend.outbox), 1)
+        delivery = self.backend.outbox[0]
+        token = CallbackToken.objects.get(user__email=self.email, is_active=True)
+        self.assertEqual(delivery.token.key, token.key)
+        self.assertEqual(delivery.alias_type, 'email')
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = DEFAULTS['PASSWORDLESS_DELIVERY_BACKEND']
+
+
+class QueuedDeliveryBackendTests(APITestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.QueuedDeliveryBackend'
+        api_settings.PASSWORDLESS_DELIVERY_WORKERS = 0
+        api_settings.PASSWORDLESS_DELIVERY_RETRY_DELAY = 0
+        api_settings.PASSWORDLESS_EMAIL_CALLBACK = 'tests.test_delivery.flaky_email_callback'
+        self.backend = get_delivery_backend()
+        sent_tokens.clear()
+
+        self.email = 'aaron@example.com'
+        self.url = reverse('drfpasswordless:auth_email')
+
+    def test_view_returns_before_sending(self):
+        # No sending address is set, which would fail an inline send.
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sent_tokens, [])
+        self.assertEqual(len(self.backend), 1)
+
+    def test_drain_retries_failed_sends(self):
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.backend.drain(), 1)
+        token = CallbackToken.objects.get(user__email=self.email, is_active=True)
+        self.assertEqual(sent_tokens, [token.key, token.key])
+        self.assertEqual(len(self.backend), 0)
+
+    def test_drain_gives_up_after_max_retries(self):
+        api_settings.PASSWORDLESS_DELIVERY_MAX_RETRIES = 0
+
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.backend.drain(), 0)
+        self.assertEqual(len(sent_tokens), 1)
+        self.assertEqual(len(self.backend), 0)
+
+    def tearDown(self):
+        self.backend.drain()
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = DEFAULTS['PASSWORDLESS_DELIVERY_BACKEND']
+        api_settings.PASSWORDLESS_DELIVERY_WORKERS = DEFAULTS['PASSWORDLESS_DELIVERY_WORKERS']
+        api_settings.PASSWORDLESS_DELIVERY_RETRY_DELAY = DEFAULTS['PASSWORDLESS_DELIVERY_RETRY_DELAY']
+        api_settings.PASSWORDLESS_DELIVERY_MAX_RETRIES = DEFAULTS['PASSWORDLESS_DELIVERY_MAX_RETRIES']
+        api_settings.PASSWORDLESS_EMAIL_CALLBACK = DEFAULTS['PASSWORDLESS_EMAIL_CALLBACK']
@@ -0,0 +1,76 @@
+from asgiref.sync import async_to_sync
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.urls import reverse
+from drfpasswordless.models import CallbackToken
+from drfpasswordless.settings import api_settings, DEFAULTS
+from drfpasswordless.utils import aconsume_callback_token, create_callback_token_for_user, validate_token_age
+
+User = get_user_model()
+
+
+class DemoUserTests(APITestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = 'noreply@example.com'
+
+        self.email = 'demo@example.com'
+        self.user = User.objects.create(email=self.email)
+        self.other = User.objects.create(email='aaron@example.com')
+        api_settings.PASSWORDLESS_DEMO_USERS = {self.user.pk: '123456'}
+
+        self.url = reverse('drfpasswordless:auth_email')
+        self.challenge_url = reverse('drfpasswordless:auth_token')
+
+    def challenge(self, email, token):
+        return self.client.post(self.challenge_url, {'email': email, 'token': token})
+
+    def test_issued_without_queries(self):
+        with self.assertNumQueries(0):
+            token = create_callback_token_for_user(self.user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        self.assertEqual(token.key, '123456')
+        self.assertTrue(validate_token_age(token.key))
+
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(CallbackToken.objects.exists())
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_pin_redeemed_repeatedly(self):
+        for i in range(3):
+            response = self.challenge(self.email, '123456')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(CallbackToken.objects.exists())
+
+    def test_wrong_pin_rejected(self):
+        self.assertEqual(self.challenge(self.email, '654321').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_pin_only_works_for_its_user(self):
+        self.assertEqual(self.challenge('aaron@example.com', '123456').status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Other users' tokens go through the token store as usual.
+        token = create_callback_token_for_user(self.other, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        self.assertEqual(self.challenge('aaron@example.com', token.key).status_code, status.HTTP_200_OK)
+
+    def test_setting_replaced(self):
+        api_settings.PASSWORDLESS_DEMO_USERS = {self.other.pk: '999999'}
+        self.assertEqual(self.challenge(self.email, '123456').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.challenge('aaron@example.com', '999999').status_code, status.HTTP_200_OK)
+
+    def test_every_store(self):
+        for store in ('drfpasswordless.stores.ModelTokenStore', 'drfpasswordless.stores.CacheTokenStore',
+                      'drfpasswordless.stores.SignedTokenStore'):
+            api_settings.PASSWORDLESS_TOKEN_STORE = store
+            self.assertEqual(self.challenge(self.email, '123456').status_code, status.HTTP_200_OK)
+
+    def test_async_redemption(self):
+        token = async_to_sync(aconsume_callback_token)('123456', CallbackToken.TOKEN_TYPE_AUTH, 'email', self.email)
+        self.assertEqual(token.user, self.user)
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = DEFAULTS['PASSWORDLESS_EMAIL_NOREPLY_ADDRESS']
+        api_settings.PASSWORDLESS_DEMO_USERS = DEFAULTS['PASSWORDLESS_DEMO_USERS']
+        api_settings.PASSWORDLESS_TOKEN_STORE = DEFAULTS['PASSWORDLESS_TOKEN_STORE']
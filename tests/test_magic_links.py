@@ -0,0 +1,94 @@
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.urls import reverse
+from drfpasswordless.models import MagicLinkToken, hash_magic_link_key
+from drfpasswordless.settings import api_settings, DEFAULTS
+from drfpasswordless.utils import create_magic_link_token_for_user
+
+User = get_user_model()
+
+
+class MagicLinkTests(APITestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = 'noreply@example.com'
+        api_settings.PASSWORDLESS_MAGIC_LINK_URL = 'https://example.com/login/?next=/&token=%s'
+
+        self.email = 'aaron@example.com'
+        self.url = reverse('drfpasswordless:auth_email_magic_link')
+        self.challenge_url = reverse('drfpasswordless:auth_magic_link')
+        self.email_field_name = api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME
+
+    def request_link(self):
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return mail.outbox[-1].body.rsplit('token=', 1)[1]
+
+    def test_link_emailed_and_redeemed(self):
+        key = self.request_link()
+        self.assertGreaterEqual(len(key), 43)
+        html = mail.outbox[-1].alternatives[0][0]
+        self.assertIn('href="https://example.com/login/?next=/&amp;token=%s"' % key, html)
+
+        # Only the key's hash is stored.
+        user = User.objects.get(**{self.email_field_name: self.email})
+        token = MagicLinkToken.objects.get(user=user)
+        self.assertEqual(token.key_hash, hash_magic_link_key(key))
+        self.assertNotIn(key, token.key_hash)
+
+        response = self.client.post(self.challenge_url, {'token': key})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['token'], Token.objects.get(user=user).key)
+
+        # Links can only be used once.
+        response = self.client.post(self.challenge_url, {'token': key})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_new_link_invalidates_previous(self):
+        first_key = self.request_link()
+        second_key = self.request_link()
+
+        response = self.client.post(self.challenge_url, {'token': first_key})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.challenge_url, {'token': second_key})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_expired_link_rejected(self):
+        api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME = -1
+        key = self.request_link()
+        response = self.client.post(self.challenge_url, {'token': key})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_redeemed_with_one_lookup(self):
+        user = User.objects.create(**{self.email_field_name: self.email})
+        Token.objects.create(user=user)
+        token, key = create_magic_link_token_for_user(user)
+
+        # The token lookup, marking it as used and fetching the auth token.
+        with self.assertNumQueries(3):
+            response = self.client.post(self.challenge_url, {'token': key})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_marks_email_verified(self):
+        api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED = True
+        key = self.request_link()
+        self.client.post(self.challenge_url, {'token': key})
+
+        user = User.objects.get(**{self.email_field_name: self.email})
+        self.assertTrue(getattr(user, api_settings.PASSWORDLESS_USER_EMAIL_VERIFIED_FIELD_NAME))
+
+    def test_not_sent_without_link_url(self):
+        api_settings.PASSWORDLESS_MAGIC_LINK_URL = None
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(MagicLinkToken.objects.exists())
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = DEFAULTS['PASSWORDLESS_EMAIL_NOREPLY_ADDRESS']
+        api_settings.PASSWORDLESS_MAGIC_LINK_URL = DEFAULTS['PASSWORDLESS_MAGIC_LINK_URL']
+        api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME = DEFAULTS['PASSWORDLESS_TOKEN_EXPIRE_TIME']
+        api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED = DEFAULTS['PASSWORDLESS_USER_MARK_EMAIL_VERIFIED']
@@ -0,0 +1,78 @@
+import smtplib
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from drfpasswordless.mail import close_email_connection, get_email_connection
+from drfpasswordless.services import TokenService
+from drfpasswordless.settings import api_settings, DEFAULTS
+from drfpasswordless.utils import CallbackToken
+
+User = get_user_model()
+
+
+class DroppingEmailBackend(EmailBackend):
+    """
+    Behaves like a connection the SMTP server has hung up on, once.
+    """
+    dropped = False
+
+    def send_messages(self, messages):
+        if not DroppingEmailBackend.dropped:
+            DroppingEmailBackend.dropped = True
+            raise smtplib.SMTPServerDisconnected()
+        return super().send_messages(messages)
+
+
+class EmailConnectionTests(TestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = 'noreply@example.com'
+        self.email_field_name = api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME
+        User.objects.bulk_create([User(**{self.email_field_name: 'user%d@example.com' % i}) for i in range(20)])
+        self.users = list(User.objects.order_by('pk'))
+        close_email_connection()
+
+    def test_connection_reused_between_sends(self):
+        with mock.patch('drfpasswordless.mail.get_connection', wraps=mail.get_connection) as get_connection:
+            for user in self.users[:3]:
+                self.assertTrue(TokenService.send_token(user, 'email', CallbackToken.TOKEN_TYPE_AUTH))
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+        message = mail.outbox[0]
+        token = CallbackToken.objects.get(user=self.users[0], is_active=True)
+        self.assertEqual(message.to, ['user0@example.com'])
+        self.assertIn(token.key, message.body)
+        self.assertEqual(message.alternatives[0][1], 'text/html')
+
+    def test_bulk_emails_sent_in_one_call(self):
+        with mock.patch.object(EmailBackend, 'send_messages', autospec=True,
+                               side_effect=EmailBackend.send_messages) as send_messages:
+            stats = TokenService.send_bulk_tokens(self.users, 'email', CallbackToken.TOKEN_TYPE_VERIFY)
+        self.assertEqual(stats['issued'], 20)
+        self.assertEqual(send_messages.call_count, 1)
+        self.assertEqual(len(mail.outbox), 20)
+
+    @override_settings(EMAIL_BACKEND='tests.test_mail.DroppingEmailBackend')
+    def test_reconnects_when_dropped(self):
+        DroppingEmailBackend.dropped = False
+        first_connection = get_email_connection()
+        self.assertTrue(TokenService.send_token(self.users[0], 'email', CallbackToken.TOKEN_TYPE_AUTH))
+        self.assertIsNot(get_email_connection(), first_connection)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_idle_connection_health_checked(self):
+        api_settings.PASSWORDLESS_EMAIL_CONNECTION_MAX_IDLE = 0
+        first_connection = get_email_connection()
+        with mock.patch('drfpasswordless.mail.connection_is_usable', return_value=True):
+            self.assertIs(get_email_connection(), first_connection)
+        with mock.patch('drfpasswordless.mail.connection_is_usable', return_value=False):
+            self.assertIsNot(get_email_connection(), first_connection)
+
+    def tearDown(self):
+        close_email_connection()
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = DEFAULTS['PASSWORDLESS_EMAIL_NOREPLY_ADDRESS']
+        api_settings.PASSWORDLESS_EMAIL_CONNECTION_MAX_IDLE = DEFAULTS['PASSWORDLESS_EMAIL_CONNECTION_MAX_IDLE']
@@ -0,0 +1,140 @@
+from unittest import mock, skipUnless
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from drfpasswordless.metrics import StatsdMetricsBackend, get_metrics_backend, timer
+from drfpasswordless.models import CallbackToken
+from drfpasswordless.settings import api_settings, DEFAULTS
+from drfpasswordless.utils import create_callback_token_for_user, validate_token_age
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+User = get_user_model()
+
+
+class BrokenMetricsBackend(object):
+
+    def timing(self, name, seconds, tags):
+        raise ConnectionError
+
+    def increment(self, name, value, tags):
+        raise ConnectionError
+
+
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_METRICS_BACKEND = 'drfpasswordless.metrics.LocmemMetricsBackend'
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = 'noreply@example.com'
+        self.metrics = get_metrics_backend()
+        self.metrics.clear()
+
+        self.email = 'aaron@example.com'
+        self.url = reverse('drfpasswordless:auth_email')
+        self.callback_url = reverse('drfpasswordless:auth_token')
+
+    def test_token_request_recorded(self):
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.metrics.count('user_lookup', alias_type='email', outcome='registered'), 1)
+        self.assertEqual(self.metrics.count('create_token', alias_type='email', token_type='AUTH'), 1)
+        self.assertEqual(self.metrics.count('render_email'), 1)
+        self.assertEqual(self.metrics.count('delivery', alias_type='email', outcome='success'), 1)
+        self.assertEqual(self.metrics.count('send_token', alias_type='email', token_type='AUTH',
+                                            outcome='success'), 1)
+
+        self.client.post(self.url, {'email': self.email})
+        self.assertEqual(self.metrics.count('user_lookup', outcome='found'), 1)
+
+    def test_failed_delivery_recorded(self):
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = None
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.metrics.count('delivery', outcome='failure'), 1)
+        self.assertEqual(self.metrics.count('send_token', outcome='failure'), 1)
+
+    def test_redemption_outcomes_recorded(self):
+        api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS = 2
+        user = User.objects.create(email=self.email)
+        token = create_callback_token_for_user(user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        wrong_key = '%06d' % ((int(token.key) + 1) % 1000000)
+
+        for i in range(3):
+            self.client.post(self.callback_url, {'email': self.email, 'token': wrong_key})
+        self.assertEqual(self.metrics.count('redeem', alias_type='email', token_type='AUTH', outcome='invalid'), 2)
+        self.assertEqual(self.metrics.count('redeem', outcome='locked_out'), 1)
+        self.assertEqual(self.metrics.count('lockouts', alias_type='email', token_type='AUTH'), 1)
+
+        token = create_callback_token_for_user(user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        self.client.post(self.callback_url, {'email': self.email, 'token': token.key})
+        self.assertEqual(self.metrics.count('redeem', outcome='success'), 1)
+
+    def test_token_age_recorded(self):
+        user = User.objects.create(email=self.email)
+        token = create_callback_token_for_user(user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        self.assertTrue(validate_token_age(token.key))
+        CallbackToken.objects.filter(pk=token.pk).update(is_active=False)
+        self.assertFalse(validate_token_age(token.key))
+
+        self.assertEqual(self.metrics.count('validate_token_age', outcome='valid'), 1)
+        self.assertEqual(self.metrics.count('validate_token_age', outcome='expired'), 1)
+
+    def test_key_retries_counted(self):
+        user = User.objects.create(email=self.email)
+        other = User.objects.create(email='other@example.com')
+        with mock.patch('drfpasswordless.models.get_random_string', side_effect=['111111', '111111', '222222']):
+            create_callback_token_for_user(user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+            create_callback_token_for_user(other, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        self.assertEqual(self.metrics.count('token_key_retries'), 1)
+
+    def test_timer_outcomes(self):
+        with timer('stage', step='one'):
+            pass
+        with self.assertRaises(ValueError):
+            with timer('stage', step='one'):
+                raise ValueError
+        self.assertEqual(self.metrics.count('stage', step='one', outcome='success'), 1)
+        self.assertEqual(self.metrics.count('stage', step='one', outcome='error'), 1)
+
+    def test_broken_backend_ignored(self):
+        api_settings.PASSWORDLESS_METRICS_BACKEND = 'tests.test_metrics.BrokenMetricsBackend'
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_METRICS_BACKEND = DEFAULTS['PASSWORDLESS_METRICS_BACKEND']
+        api_settings.PASSWORDLESS_EMAIL_NOREPLY_ADDRESS = DEFAULTS['PASSWORDLESS_EMAIL_NOREPLY_ADDRESS']
+        api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS = DEFAULTS['PASSWORDLESS_TOKEN_MAX_ATTEMPTS']
+
+
+class MetricsAdapterTests(TestCase):
+
+    def test_statsd_names(self):
+        backend = StatsdMetricsBackend()
+        backend._client = mock.Mock()
+        backend.timing('send_token', 0.25, {'outcome': 'success', 'alias_type': 'email', 'token_type': 'AUTH'})
+        backend.increment('token_key_retries', 2, {})
+
+        backend.client.timing.assert_called_once_with('drfpasswordless.send_token.email.success.AUTH', 250)
+        backend.client.incr.assert_called_once_with('drfpasswordless.token_key_retries', 2)
+
+    @skipUnless(prometheus_client, 'Requires prometheus_client.')
+    def test_prometheus_metrics(self):
+        from drfpasswordless.metrics import PrometheusMetricsBackend
+        backend = PrometheusMetricsBackend()
+        backend.timing('redeem', 0.1, {'alias_type': 'email', 'token_type': 'AUTH', 'outcome': 'success'})
+        backend.increment('lockouts', 1, {'alias_type': 'email', 'token_type': 'AUTH'})
+
+        registry = prometheus_client.REGISTRY
+        labels = {'alias_type': 'email', 'token_type': 'AUTH'}
+        self.assertEqual(registry.get_sample_value('drfpasswordless_lockouts_total', labels), 1)
+        self.assertEqual(registry.get_sample_value('drfpasswordless_redeem_seconds_count',
+                                                   dict(labels, outcome='success')), 1)
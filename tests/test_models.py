@@ -0,0 +1,85 @@
+import uuid
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.test import TestCase
+from django.utils import timezone
+from drfpasswordless.models import CallbackToken, MagicLinkToken, generate_uuid7
+from drfpasswordless.stores import save_with_unique_key
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plan output is backend specific.')
+class CallbackTokenIndexTests(TestCase):
+    """
+    Make sure the hot lookup paths are served by the partial indexes instead of a table scan.
+    """
+
+    def test_active_key_lookup_uses_index(self):
+        plan = CallbackToken.objects.filter(key='123456', is_active=True).explain()
+        self.assertIn('drfpasswordless_unique_key', plan)
+
+    def test_active_user_type_lookup_uses_index(self):
+        plan = CallbackToken.objects.active().filter(user_id=1, type=CallbackToken.TOKEN_TYPE_AUTH).explain()
+        self.assertIn('drfpasswordless_active_user', plan)
+
+    def test_magic_link_purge_uses_index(self):
+        purgeable = MagicLinkToken.objects.filter(Q(is_active=False) | Q(created_at__lt=timezone.now()))
+        plan = purgeable.order_by('created_at').values_list('pk', flat=True)[:1000].explain()
+        self.assertIn('drfpasswordless_link_created', plan)
+
+
+@skipUnless(connection.features.supports_partial_indexes, 'Requires partial unique constraints.')
+class CallbackTokenUniqueKeyTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='aaron@example.com')
+        self.other_user = User.objects.create(email='aaron2@example.com')
+        self.token = CallbackToken.objects.create(user=self.user, type=CallbackToken.TOKEN_TYPE_AUTH)
+
+    def test_active_keys_are_unique(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CallbackToken.objects.create(user=self.other_user, key=self.token.key, type=CallbackToken.TOKEN_TYPE_AUTH)
+
+    def test_inactive_keys_can_repeat(self):
+        CallbackToken.objects.filter(pk=self.token.pk).update(is_active=False)
+        CallbackToken.objects.create(user=self.other_user, key=self.token.key, type=CallbackToken.TOKEN_TYPE_AUTH)
+
+    def test_colliding_key_is_redrawn(self):
+        token = CallbackToken(user=self.other_user, key=self.token.key, type=CallbackToken.TOKEN_TYPE_AUTH)
+        save_with_unique_key(token)
+        self.assertNotEqual(token.key, self.token.key)
+        self.assertTrue(CallbackToken.objects.filter(pk=token.pk, is_active=True).exists())
+
+    def test_other_integrity_errors_not_retried(self):
+        token = CallbackToken(user=self.other_user, type=CallbackToken.TOKEN_TYPE_AUTH)
+        with mock.patch.object(CallbackToken, 'save', side_effect=IntegrityError('FOREIGN KEY constraint failed')) \
+                as save, self.assertRaises(IntegrityError):
+            save_with_unique_key(token)
+        self.assertEqual(save.call_count, 1)
+
+    def test_issue_without_collision_is_a_single_insert(self):
+        token = CallbackToken(user=self.other_user, type=CallbackToken.TOKEN_TYPE_AUTH)
+        # Savepoint, insert, invalidation of previous tokens, release.
+        with self.assertNumQueries(4):
+            save_with_unique_key(token)
+
+
+class CallbackTokenIdTests(TestCase):
+
+    def test_ids_are_time_ordered(self):
+        ids = [generate_uuid7() for i in range(1000)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 1000)
+        self.assertEqual(ids[0].version, 7)
+        self.assertEqual(ids[0].variant, uuid.RFC_4122)
+
+    def test_newest_token_first(self):
+        user = User.objects.create(email='aaron@example.com')
+        tokens = [CallbackToken.objects.create(user=user, key='%06d' % i, type=CallbackToken.TOKEN_TYPE_VERIFY,
+                                               is_active=False) for i in range(5)]
+        self.assertEqual(list(CallbackToken.objects.all()), tokens[::-1])
+        self.assertEqual(sorted(token.pk for token in tokens), [token.pk for token in tokens])
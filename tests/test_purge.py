@@ -0,0 +1,71 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from drfpasswordless.models import MagicLinkToken
+from drfpasswordless.settings import api_settings
+from drfpasswordless.utils import CallbackToken, create_magic_link_token_for_user, purge_callback_tokens
+
+User = get_user_model()
+
+
+class PurgeCallbackTokenTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='aaron@example.com')
+        self.expired_at = timezone.now() - timedelta(seconds=api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME + 1)
+
+        self.expired = self.create_token(created_at=self.expired_at)
+        self.used = self.create_token(is_active=False)
+        self.active = self.create_token()
+
+    def create_token(self, **fields):
+        token = CallbackToken.objects.create(user=self.user, type=CallbackToken.TOKEN_TYPE_AUTH)
+        # Bypass auto_now_add and the invalidation signal by writing the fields directly.
+        CallbackToken.objects.filter(pk=token.pk).update(**dict({'is_active': True}, **fields))
+        return token
+
+    def test_purge_removes_expired_and_used_tokens(self):
+        stats = purge_callback_tokens()
+        self.assertEqual(stats['deleted'], 2)
+        self.assertEqual(list(CallbackToken.objects.values_list('pk', flat=True)), [self.active.pk])
+
+    def test_purge_removes_used_magic_links(self):
+        used, _ = create_magic_link_token_for_user(self.user)
+        active, _ = create_magic_link_token_for_user(self.user)
+
+        stats = purge_callback_tokens()
+        self.assertEqual(stats['deleted'], 3)
+        self.assertEqual(list(MagicLinkToken.objects.values_list('pk', flat=True)), [active.pk])
+
+    def test_purge_in_batches(self):
+        stats = purge_callback_tokens(batch_size=1)
+        self.assertEqual(stats['batches'], 2)
+        self.assertEqual(stats['deleted'], 2)
+
+    def test_purge_resumes_after_max_batches(self):
+        stats = purge_callback_tokens(batch_size=1, max_batches=1)
+        self.assertEqual(stats['deleted'], 1)
+        # Oldest tokens go first.
+        self.assertFalse(CallbackToken.objects.filter(pk=self.expired.pk).exists())
+
+        stats = purge_callback_tokens(batch_size=1)
+        self.assertEqual(stats['deleted'], 1)
+        self.assertEqual(CallbackToken.objects.count(), 1)
+
+    def test_purge_dry_run(self):
+        stats = purge_callback_tokens(dry_run=True)
+        self.assertEqual(stats['deleted'], 2)
+        self.assertEqual(CallbackToken.objects.count(), 3)
+
+    def test_purge_command(self):
+        out = StringIO()
+        call_command('purge_callback_tokens', '--dry-run', stdout=out)
+        self.assertIn('2 callback tokens would be deleted', out.getvalue())
+
+        call_command('purge_callback_tokens', '--batch-size', '1', stdout=out)
+        self.assertIn('Deleted 2 callback tokens in 2 batches', out.getvalue())
+        self.assertEqual(CallbackToken.objects.count(), 1)
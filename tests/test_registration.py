@@ -0,0 +1,74 @@
+import threading
+from contextlib import nullcontext
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase
+from drfpasswordless.utils import get_or_register_user, register_user
+
+User = get_user_model()
+
+
+class RegistrationTests(TestCase):
+
+    def test_registered_with_single_insert(self):
+        # Lookup, savepoint, insert, release.
+        with self.assertNumQueries(4):
+            user, created = get_or_register_user('email', 'aaron@example.com')
+        self.assertTrue(created)
+        self.assertFalse(user.has_usable_password())
+        self.assertFalse(User.objects.get(pk=user.pk).has_usable_password())
+
+    def test_existing_user_found(self):
+        existing = User.objects.create(email='aaron@example.com')
+        user, created = get_or_register_user('email', 'Aaron@Example.com')
+        self.assertEqual(user, existing)
+        self.assertFalse(created)
+
+    def test_conflicting_insert_returns_existing_user(self):
+        existing = User.objects.create(email='aaron@example.com')
+        user, created = register_user('email', 'aaron@example.com')
+        self.assertEqual(user, existing)
+        self.assertFalse(created)
+
+    def test_other_integrity_errors_raised(self):
+        error = IntegrityError('NOT NULL constraint failed')
+        with mock.patch.object(User, 'save', side_effect=error):
+            with self.assertRaises(IntegrityError) as raised:
+                register_user('email', 'aaron@example.com')
+        self.assertIs(raised.exception, error)
+        self.assertFalse(User.objects.exists())
+
+
+class ConcurrentRegistrationTests(TransactionTestCase):
+
+    def test_one_user_per_alias(self):
+        threads = 8
+        barrier = threading.Barrier(threads)
+        results, errors = [], []
+        # SQLite's shared in-memory test database fails writes that overlap instead
+        # of waiting for them, so there the inserts take turns. They still all
+        # happen after every thread has missed the lookup.
+        writes = threading.Lock() if connection.vendor == 'sqlite' else nullcontext()
+
+        def register():
+            try:
+                barrier.wait()
+                with writes:
+                    results.append(register_user('email', 'aaron@example.com'))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=register) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(User.objects.filter(email='aaron@example.com').count(), 1)
+        self.assertEqual(len({user.pk for user, created in results}), 1)
+        self.assertEqual(sum(created for user, created in results), 1)
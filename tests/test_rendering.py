@@ -0,0 +1,101 @@
+from unittest import mock
+
+from django.template import engines, loader
+from django.test import TestCase
+from django.utils import translation
+from drfpasswordless.rendering import template_cache
+from drfpasswordless.settings import api_settings, DEFAULTS
+from drfpasswordless.utils import inject_template_context
+
+processor_calls = []
+
+
+def site_context_processor():
+    processor_calls.append(1)
+    return {'site_url': 'https://example.com'}
+
+
+class TemplateRenderCacheTests(TestCase):
+
+    def setUp(self):
+        template_cache.clear()
+        processor_calls.clear()
+        self.template_name = api_settings.PASSWORDLESS_EMAIL_TOKEN_HTML_TEMPLATE_NAME
+
+    def test_matches_full_render(self):
+        for key in ('123456', '654321'):
+            self.assertEqual(template_cache.render(self.template_name, key),
+                             loader.render_to_string(self.template_name, {'callback_token': key}))
+        self.assertEqual((template_cache.hits, template_cache.misses), (1, 1))
+
+    def test_template_rendered_once(self):
+        template_cache.render(self.template_name, '123456')
+        with mock.patch('drfpasswordless.rendering.loader') as mock_loader:
+            template_cache.render(self.template_name, '654321')
+        mock_loader.get_template.assert_not_called()
+        mock_loader.render_to_string.assert_not_called()
+
+    def test_context_change_rerenders(self):
+        api_settings.PASSWORDLESS_CONTEXT_PROCESSORS = [lambda: {'site_name': str(len(processor_calls))},
+                                                        site_context_processor]
+        template_cache.render(self.template_name, '123456')
+        template_cache.render(self.template_name, '123456')
+        self.assertEqual(template_cache.misses, 2)
+
+    def test_context_processors_memoized_with_ttl(self):
+        api_settings.PASSWORDLESS_CONTEXT_PROCESSORS = [site_context_processor]
+        for key in ('111111', '222222', '333333'):
+            template_cache.render(self.template_name, key)
+        self.assertEqual(len(processor_calls), 3)
+
+        api_settings.PASSWORDLESS_CONTEXT_PROCESSORS_CACHE_TTL = 60
+        for key in ('111111', '222222', '333333'):
+            template_cache.render(self.template_name, key)
+        self.assertEqual(len(processor_calls), 4)
+
+    def test_inject_template_context(self):
+        api_settings.PASSWORDLESS_CONTEXT_PROCESSORS = [site_context_processor]
+        api_settings.PASSWORDLESS_CONTEXT_PROCESSORS_CACHE_TTL = 60
+        template_cache.render(self.template_name, '123456')
+        context = inject_template_context({'callback_token': '123456'})
+        self.assertEqual(context, {'callback_token': '123456', 'site_url': 'https://example.com'})
+        self.assertEqual(len(processor_calls), 1)
+
+    def test_template_altering_token_rendered_in_full(self):
+        with mock.patch('drfpasswordless.rendering.loader.get_template') as get_template:
+            get_template.return_value.render.side_effect = lambda context: context['callback_token'][:3]
+            with mock.patch('drfpasswordless.rendering.loader.render_to_string',
+                            side_effect=lambda name, context: context['callback_token'][:3]):
+                self.assertEqual(template_cache.render('sliced.html', '123456'), '123')
+                self.assertEqual(template_cache.render('sliced.html', '654321'), '654')
+
+    def test_filtered_token_rendered_in_full(self):
+        for source in ('{{ callback_token|length }}-digit code', '{{ callback_token|first }}',
+                       '{{ callback_token|slice:"3" }}', '{{ callback_token|make_list|join:" " }}',
+                       '{{ callback_token.0 }}'):
+            template = engines['django'].from_string(source)
+            with self.subTest(source=source), \
+                    mock.patch('drfpasswordless.rendering.loader.get_template', return_value=template), \
+                    mock.patch('drfpasswordless.rendering.loader.render_to_string',
+                               side_effect=lambda name, context: template.render(context)):
+                template_cache.clear()
+                for key in ('123456', '654321'):
+                    self.assertEqual(template_cache.render('filtered.html', key),
+                                     template.render({'callback_token': key}))
+                self.assertIsNone(template_cache._renders[('filtered.html', translation.get_language())][1])
+
+    def test_rendered_per_language(self):
+        with mock.patch('drfpasswordless.rendering.loader.get_template') as get_template:
+            get_template.return_value.render.side_effect = \
+                lambda context: 'lang=%s %s' % (translation.get_language(), context['callback_token'])
+            with translation.override('fr'):
+                self.assertEqual(template_cache.render('translated.html', '123456'), 'lang=fr 123456')
+            with translation.override('de'):
+                self.assertEqual(template_cache.render('translated.html', '654321'), 'lang=de 654321')
+            with translation.override('fr'):
+                self.assertEqual(template_cache.render('translated.html', '111111'), 'lang=fr 111111')
+        self.assertEqual((template_cache.hits, template_cache.misses), (1, 2))
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_CONTEXT_PROCESSORS = DEFAULTS['PASSWORDLESS_CONTEXT_PROCESSORS']
+        api_settings.PASSWORDLESS_CONTEXT_PROCESSORS_CACHE_TTL = DEFAULTS['PASSWORDLESS_CONTEXT_PROCESSORS_CACHE_TTL']
@@ -0,0 +1,76 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from drfpasswordless.delivery import get_delivery_backend
+from drfpasswordless.services import TokenService
+from drfpasswordless.settings import api_settings, DEFAULTS
+from drfpasswordless.throttling import record_failed_attempt
+from drfpasswordless.utils import CallbackToken, consume_callback_token
+
+User = get_user_model()
+
+
+class BulkTokenIssuanceTests(TestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.LocmemDeliveryBackend'
+        self.backend = get_delivery_backend()
+        self.backend.outbox.clear()
+
+        self.email_field_name = api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME
+        User.objects.bulk_create([User(**{self.email_field_name: 'user%d@example.com' % i}) for i in range(50)])
+        self.users = User.objects.order_by('pk')
+
+    def test_tokens_issued_and_delivered(self):
+        stats = TokenService.send_bulk_tokens(self.users, 'email', CallbackToken.TOKEN_TYPE_VERIFY, batch_size=20)
+        self.assertEqual(stats, {'issued': 50, 'failed_batches': 0, 'undelivered': 0})
+        self.assertEqual(len(self.backend.outbox), 50)
+
+        tokens = CallbackToken.objects.active().filter(type=CallbackToken.TOKEN_TYPE_VERIFY)
+        self.assertEqual(tokens.count(), 50)
+        self.assertEqual(len(set(tokens.values_list('key', flat=True))), 50)
+
+        token = tokens.get(user=self.users.first())
+        self.assertEqual(token.to_alias, 'user0@example.com')
+        self.assertEqual(token.to_alias_type, 'EMAIL')
+
+    def test_previous_tokens_invalidated(self):
+        user = self.users.first()
+        TokenService.send_token(user, 'email', CallbackToken.TOKEN_TYPE_VERIFY)
+        old_token = CallbackToken.objects.get(user=user, is_active=True)
+
+        TokenService.send_bulk_tokens(self.users, 'email', CallbackToken.TOKEN_TYPE_VERIFY)
+        old_token.refresh_from_db()
+        self.assertFalse(old_token.is_active)
+        self.assertEqual(CallbackToken.objects.active().filter(user=user).count(), 1)
+
+    def test_query_count_is_fixed_per_batch(self):
+        users = list(self.users)
+        # Key check, savepoint, invalidation, insert, release.
+        with self.assertNumQueries(5):
+            TokenService.send_bulk_tokens(users, 'email', CallbackToken.TOKEN_TYPE_VERIFY, batch_size=50)
+
+    def test_locked_out_alias_can_redeem_new_token(self):
+        user = self.users.first()
+        for i in range(api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS):
+            record_failed_attempt(CallbackToken.TOKEN_TYPE_VERIFY, 'email', 'user0@example.com')
+
+        TokenService.send_bulk_tokens([user], 'email', CallbackToken.TOKEN_TYPE_VERIFY)
+        token = CallbackToken.objects.get(user=user, is_active=True)
+        self.assertIsNotNone(consume_callback_token(token.key, CallbackToken.TOKEN_TYPE_VERIFY, 'email',
+                                                    'user0@example.com'))
+
+    def test_demo_users_skipped(self):
+        api_settings.PASSWORDLESS_DEMO_USERS = {self.users.first().pk: '123456'}
+        stats = TokenService.send_bulk_tokens(self.users, 'email', CallbackToken.TOKEN_TYPE_VERIFY)
+        self.assertEqual(stats['issued'], 49)
+
+    def test_failed_delivery_reported(self):
+        with mock.patch.object(self.backend, 'send_many', side_effect=[True, False, True]):
+            stats = TokenService.send_bulk_tokens(self.users, 'email', CallbackToken.TOKEN_TYPE_VERIFY, batch_size=20)
+        self.assertEqual(stats, {'issued': 50, 'failed_batches': 1, 'undelivered': 20})
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = DEFAULTS['PASSWORDLESS_DELIVERY_BACKEND']
+        api_settings.PASSWORDLESS_DEMO_USERS = DEFAULTS['PASSWORDLESS_DEMO_USERS']
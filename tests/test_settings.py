@@ -1,10 +1,15 @@
+from unittest import mock
+
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
 
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
 from django.urls import reverse
-from drfpasswordless.settings import api_settings, DEFAULTS
+from drfpasswordless.settings import api_settings, resolved_settings, DEFAULTS
+from drfpasswordless.utils import send_email_with_callback_token
 from drfpasswordless.utils import CallbackToken
 
 User = get_user_model()
@@ -182,3 +187,53 @@ class AliasMobileVerificationTests(APITestCase):
         api_settings.PASSWORDLESS_AUTH_TYPES = DEFAULTS['PASSWORDLESS_AUTH_TYPES']
         api_settings.PASSWORDLESS_MOBILE_NOREPLY_ADDRESS = DEFAULTS['PASSWORDLESS_EMAIL_NOREPLY_ADDRESS']
         api_settings.PASSWORDLESS_USER_MARK_MOBILE_VERIFIED = DEFAULTS['PASSWORDLESS_USER_MARK_MOBILE_VERIFIED']
+
+
+class ResolvedSettingsTests(TestCase):
+
+    def setUp(self):
+        resolved_settings.clear()
+
+    def test_imported_once(self):
+        with mock.patch('drfpasswordless.settings.import_string', wraps=lambda path: send_email_with_callback_token) \
+                as import_string:
+            for i in range(3):
+                self.assertIs(resolved_settings.PASSWORDLESS_EMAIL_CALLBACK, send_email_with_callback_token)
+        self.assertEqual(import_string.call_count, 1)
+
+    def test_follows_changed_setting(self):
+        api_settings.PASSWORDLESS_EMAIL_CALLBACK = 'tests.test_delivery.flaky_email_callback'
+        self.assertEqual(resolved_settings.PASSWORDLESS_EMAIL_CALLBACK.__name__, 'flaky_email_callback')
+
+    def test_reloaded_with_django_settings(self):
+        with override_settings(PASSWORDLESS_AUTH={'PASSWORDLESS_SMS_CALLBACK': 'tests.test_delivery.flaky_email_callback'}):
+            self.assertEqual(resolved_settings.PASSWORDLESS_SMS_CALLBACK.__name__, 'flaky_email_callback')
+        self.assertEqual(api_settings.PASSWORDLESS_SMS_CALLBACK, DEFAULTS['PASSWORDLESS_SMS_CALLBACK'])
+
+    def test_bad_path_fails_validation(self):
+        api_settings.PASSWORDLESS_AUTH_TOKEN_CREATOR = 'drfpasswordless.utils.does_not_exist'
+        with self.assertRaises(ImproperlyConfigured):
+            resolved_settings.validate()
+
+    def test_non_callable_fails_validation(self):
+        api_settings.PASSWORDLESS_AUTH_TOKEN_CREATOR = 'drfpasswordless.settings.DEFAULTS'
+        with self.assertRaises(ImproperlyConfigured):
+            resolved_settings.validate()
+
+    def test_instance_kept_per_path(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.LocmemDeliveryBackend'
+        backend = resolved_settings.instance('PASSWORDLESS_DELIVERY_BACKEND')
+        self.assertEqual(type(backend).__name__, 'LocmemDeliveryBackend')
+        self.assertIs(resolved_settings.instance('PASSWORDLESS_DELIVERY_BACKEND'), backend)
+
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = DEFAULTS['PASSWORDLESS_DELIVERY_BACKEND']
+        self.assertIsNot(resolved_settings.instance('PASSWORDLESS_DELIVERY_BACKEND'), backend)
+
+        resolved_settings.clear()
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.LocmemDeliveryBackend'
+        self.assertIs(resolved_settings.instance('PASSWORDLESS_DELIVERY_BACKEND'), backend)
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_EMAIL_CALLBACK = DEFAULTS['PASSWORDLESS_EMAIL_CALLBACK']
+        api_settings.PASSWORDLESS_AUTH_TOKEN_CREATOR = DEFAULTS['PASSWORDLESS_AUTH_TOKEN_CREATOR']
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = DEFAULTS['PASSWORDLESS_DELIVERY_BACKEND']
@@ -0,0 +1,60 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from drfpasswordless.services import TokenService
+from drfpasswordless.settings import api_settings, DEFAULTS
+from drfpasswordless.sms import LocmemSMSProvider, TwilioSMSProvider, get_sms_provider
+from drfpasswordless.utils import CallbackToken
+
+User = get_user_model()
+
+
+class SMSProviderTests(TestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_SMS_PROVIDER = 'drfpasswordless.sms.LocmemSMSProvider'
+        api_settings.PASSWORDLESS_MOBILE_NOREPLY_NUMBER = '+15550000000'
+        self.provider = get_sms_provider()
+        self.provider.outbox.clear()
+
+        self.mobile = '+15551234567'
+        self.user = User.objects.create(**{api_settings.PASSWORDLESS_USER_MOBILE_FIELD_NAME: self.mobile})
+
+    def test_token_sent_through_provider(self):
+        self.assertIsInstance(self.provider, LocmemSMSProvider)
+        self.assertTrue(TokenService.send_token(self.user, 'mobile', CallbackToken.TOKEN_TYPE_AUTH))
+
+        token = CallbackToken.objects.get(user=self.user, is_active=True)
+        self.assertEqual(self.provider.outbox, [(self.mobile, api_settings.PASSWORDLESS_MOBILE_MESSAGE % token.key)])
+
+    def test_provider_is_shared(self):
+        self.assertIs(get_sms_provider(), self.provider)
+
+    def test_send_many(self):
+        results = self.provider.send_many([('+15551111111', 'one'), ('+15552222222', 'two')])
+        self.assertEqual(results, [True, True])
+        self.assertEqual(len(self.provider.outbox), 2)
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_SMS_PROVIDER = DEFAULTS['PASSWORDLESS_SMS_PROVIDER']
+        api_settings.PASSWORDLESS_MOBILE_NOREPLY_NUMBER = DEFAULTS['PASSWORDLESS_MOBILE_NOREPLY_NUMBER']
+
+
+class TwilioSMSProviderTests(TestCase):
+
+    def test_client_built_once_for_all_threads(self):
+        provider = TwilioSMSProvider()
+        with mock.patch.object(TwilioSMSProvider, 'build_client', return_value=mock.Mock()) as build_client:
+            clients = []
+            threads = [threading.Thread(target=lambda: clients.append(provider.client)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            provider.send_many([('+15551111111', 'one'), ('+15552222222', 'two')])
+
+        build_client.assert_called_once_with()
+        self.assertEqual(len(set(map(id, clients))), 1)
+        self.assertEqual(provider.client.messages.create.call_count, 2)
@@ -0,0 +1,286 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from rest_framework import serializers, status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from drfpasswordless.delivery import get_delivery_backend
+from drfpasswordless.serializers import token_age_validator
+from drfpasswordless.settings import api_settings, DEFAULTS
+from drfpasswordless.stores import get_token_store
+from drfpasswordless.utils import CallbackToken, authenticate_by_token, create_callback_token_for_user, validate_token_age
+
+User = get_user_model()
+
+
+class CacheTokenStoreTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        api_settings.PASSWORDLESS_TOKEN_STORE = 'drfpasswordless.stores.CacheTokenStore'
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.LocmemDeliveryBackend'
+        self.outbox = get_delivery_backend().outbox
+        self.outbox.clear()
+
+        self.email = 'aaron@example.com'
+        self.url = reverse('drfpasswordless:auth_email')
+        self.challenge_url = reverse('drfpasswordless:auth_token')
+
+        self.email_field_name = api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME
+        self.user = User.objects.create(**{self.email_field_name: self.email})
+
+    def request_token(self):
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return self.outbox[-1].token.key
+
+    def test_auth_without_token_table(self):
+        key = self.request_token()
+        self.assertFalse(CallbackToken.objects.exists())
+        self.assertTrue(validate_token_age(key))
+
+        challenge_response = self.client.post(self.challenge_url, {'email': self.email, 'token': key})
+        self.assertEqual(challenge_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(challenge_response.data['token'], Token.objects.get(user=self.user).key)
+
+        # Tokens are used up on redemption.
+        self.assertFalse(validate_token_age(key))
+        challenge_response = self.client.post(self.challenge_url, {'email': self.email, 'token': key})
+        self.assertEqual(challenge_response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_token_age_validator(self):
+        key = self.request_token()
+        self.assertEqual(token_age_validator(key), key)
+        with self.assertRaises(serializers.ValidationError):
+            token_age_validator('%06d' % ((int(key) + 1) % 1000000))
+
+    def test_new_token_invalidates_previous(self):
+        first_key = self.request_token()
+        second_key = self.request_token()
+
+        challenge_response = self.client.post(self.challenge_url, {'email': self.email, 'token': first_key})
+        self.assertEqual(challenge_response.status_code, status.HTTP_400_BAD_REQUEST)
+        challenge_response = self.client.post(self.challenge_url, {'email': self.email, 'token': second_key})
+        self.assertEqual(challenge_response.status_code, status.HTTP_200_OK)
+
+    def test_token_bound_to_alias(self):
+        key = self.request_token()
+        User.objects.create(**{self.email_field_name: 'abcde@example.com'})
+
+        challenge_response = self.client.post(self.challenge_url, {'email': 'abcde@example.com', 'token': key})
+        self.assertEqual(challenge_response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_authenticate_by_token(self):
+        key = self.request_token()
+        self.assertEqual(authenticate_by_token(key), self.user)
+        self.assertIsNone(authenticate_by_token(key))
+
+    def test_reissued_key_not_invalidated_by_previous_owner(self):
+        other_user = User.objects.create(**{self.email_field_name: 'abcde@example.com'})
+        store = get_token_store()
+        with mock.patch('drfpasswordless.stores.generate_numeric_token', return_value='111111'):
+            store.create_token(self.user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+            self.assertIsNotNone(store.consume_token('111111', CallbackToken.TOKEN_TYPE_AUTH, 'email', self.email))
+            store.create_token(other_user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+
+        # The first user's new token mustn't touch the key that now belongs to the other user.
+        store.create_token(self.user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        self.assertTrue(validate_token_age('111111'))
+
+    def test_tokens_expire_with_cache_timeout(self):
+        api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME = -1
+        token = get_token_store().create_token(self.user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        self.assertFalse(validate_token_age(token.key))
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_TOKEN_STORE = DEFAULTS['PASSWORDLESS_TOKEN_STORE']
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = DEFAULTS['PASSWORDLESS_DELIVERY_BACKEND']
+        api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME = DEFAULTS['PASSWORDLESS_TOKEN_EXPIRE_TIME']
+
+
+class SignedTokenStoreTests(APITestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_TOKEN_STORE = 'drfpasswordless.stores.SignedTokenStore'
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.LocmemDeliveryBackend'
+        self.outbox = get_delivery_backend().outbox
+        self.outbox.clear()
+
+        self.email = 'aaron@example.com'
+        self.url = reverse('drfpasswordless:auth_email')
+        self.challenge_url = reverse('drfpasswordless:auth_token')
+
+        self.email_field_name = api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME
+        self.user = User.objects.create(**{self.email_field_name: self.email})
+        self.store = get_token_store()
+
+    def request_token(self):
+        response = self.client.post(self.url, {'email': self.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return self.outbox[-1].token.key
+
+    def challenge(self, key, email=None):
+        return self.client.post(self.challenge_url, {'email': email or self.email, 'token': key})
+
+    def test_issued_without_queries(self):
+        with self.assertNumQueries(0):
+            token = self.store.create_token(self.user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        self.assertRegex(token.key, r'^\d{6}$')
+
+    def test_auth_without_token_table(self):
+        key = self.request_token()
+        self.assertFalse(CallbackToken.objects.exists())
+
+        challenge_response = self.challenge(key)
+        self.assertEqual(challenge_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(challenge_response.data['token'], Token.objects.get(user=self.user).key)
+
+        # Used tokens can't be replayed.
+        self.assertEqual(self.challenge(key).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_new_token_invalidates_previous(self):
+        first_key = self.request_token()
+        second_key = self.request_token()
+        self.assertNotEqual(first_key, second_key)
+
+        self.assertEqual(self.challenge(first_key).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.challenge(second_key).status_code, status.HTTP_200_OK)
+
+    def test_token_bound_to_user_and_type(self):
+        key = self.request_token()
+        User.objects.create(**{self.email_field_name: 'abcde@example.com'})
+
+        self.assertEqual(self.challenge(key, email='abcde@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIsNone(self.store.consume_token(key, CallbackToken.TOKEN_TYPE_VERIFY, 'email', self.email))
+        self.assertIsNone(self.store.consume_token(key, CallbackToken.TOKEN_TYPE_AUTH, 'email', self.email,
+                                                   user_id=self.user.pk + 1))
+
+    def test_token_bound_to_alias(self):
+        key = self.request_token()
+        setattr(self.user, self.email_field_name, 'changed@example.com')
+        self.user.save()
+        self.assertEqual(self.challenge(key, email='changed@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tokens_expire(self):
+        key = self.request_token()
+        with mock.patch('drfpasswordless.stores.time.time',
+                        return_value=time.time() + api_settings.PASSWORDLESS_TOKEN_EXPIRE_TIME + 1):
+            self.assertEqual(self.challenge(key).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_lockout_invalidates_token(self):
+        key = self.request_token()
+        wrong_key = '%06d' % ((int(key) + 1) % 1000000)
+        for i in range(api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS):
+            self.challenge(wrong_key)
+        # Let the alias try again, its token should be gone regardless.
+        cache.clear()
+        self.assertEqual(self.challenge(key).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_key_changes_after_invalidation(self):
+        with mock.patch('drfpasswordless.stores.time.time', return_value=time.time()):
+            first = self.store.create_token(self.user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+            self.store.invalidate_tokens(CallbackToken.TOKEN_TYPE_AUTH, 'email', self.email)
+            self.assertIsNone(self.store.consume_token(first.key, CallbackToken.TOKEN_TYPE_AUTH, 'email', self.email))
+            self.assertIsNone(self.store.reusable_token(self.user, 'email', CallbackToken.TOKEN_TYPE_AUTH, 60))
+
+            second = self.store.create_token(self.user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        self.assertNotEqual(first.key, second.key)
+        self.assertEqual(self.challenge(second.key).status_code, status.HTTP_200_OK)
+
+    def test_demo_user_pin(self):
+        api_settings.PASSWORDLESS_DEMO_USERS = {self.user.pk: '123456'}
+        token = create_callback_token_for_user(self.user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        self.assertEqual(token.key, '123456')
+        self.assertEqual(self.challenge('654321').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.challenge('123456').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.challenge('123456').status_code, status.HTTP_200_OK)
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_TOKEN_STORE = DEFAULTS['PASSWORDLESS_TOKEN_STORE']
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = DEFAULTS['PASSWORDLESS_DELIVERY_BACKEND']
+        api_settings.PASSWORDLESS_DEMO_USERS = DEFAULTS['PASSWORDLESS_DEMO_USERS']
+
+
+class TokenReuseTests(APITestCase):
+
+    stores = ('drfpasswordless.stores.ModelTokenStore', 'drfpasswordless.stores.CacheTokenStore',
+              'drfpasswordless.stores.SignedTokenStore')
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_TOKEN_REUSE_WINDOW = 60
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.LocmemDeliveryBackend'
+        self.outbox = get_delivery_backend().outbox
+        self.outbox.clear()
+
+        self.email = 'aaron@example.com'
+        self.url = reverse('drfpasswordless:auth_email')
+        self.challenge_url = reverse('drfpasswordless:auth_token')
+        self.user = User.objects.create(**{api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME: self.email})
+
+    def issue(self, token_type=CallbackToken.TOKEN_TYPE_AUTH):
+        return create_callback_token_for_user(self.user, 'email', token_type).key
+
+    def challenge(self, key):
+        return self.client.post(self.challenge_url, {'email': self.email, 'token': key})
+
+    def test_resend_reuses_token(self):
+        for store in self.stores:
+            with self.subTest(store=store):
+                cache.clear()
+                api_settings.PASSWORDLESS_TOKEN_STORE = store
+                self.client.post(self.url, {'email': self.email})
+                self.client.post(self.url, {'email': self.email})
+                self.assertEqual(self.outbox[-1].token.key, self.outbox[-2].token.key)
+                self.assertEqual(self.challenge(self.outbox[-1].token.key).status_code, status.HTTP_200_OK)
+
+    def test_used_token_not_reused(self):
+        for store in self.stores:
+            with self.subTest(store=store):
+                cache.clear()
+                api_settings.PASSWORDLESS_TOKEN_STORE = store
+                key = self.issue()
+                self.assertEqual(self.challenge(key).status_code, status.HTTP_200_OK)
+                self.assertEqual(self.challenge(self.issue()).status_code, status.HTTP_200_OK)
+
+    def test_token_types_kept_apart(self):
+        for store in self.stores:
+            with self.subTest(store=store):
+                cache.clear()
+                api_settings.PASSWORDLESS_TOKEN_STORE = store
+                auth_key = self.issue()
+                self.issue(CallbackToken.TOKEN_TYPE_VERIFY)
+                self.assertEqual(self.issue(), auth_key)
+
+    def test_reuse_skips_writes(self):
+        key = self.issue()
+        # A single lookup, no insert and no invalidation of previous tokens.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.issue(), key)
+        self.assertEqual(CallbackToken.objects.count(), 1)
+
+    def test_reuse_window_passed(self):
+        key = self.issue()
+        CallbackToken.objects.update(created_at=timezone.now() - timedelta(seconds=61))
+        self.assertNotEqual(self.issue(), key)
+
+    def test_reuse_keeps_attempts(self):
+        api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS = 2
+        key = self.issue()
+        wrong_key = '%06d' % ((int(key) + 1) % 1000000)
+        self.challenge(wrong_key)
+        self.issue()
+        self.challenge(wrong_key)
+        # Both guesses counted, so the token was invalidated rather than reused again.
+        self.assertEqual(self.challenge(key).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_TOKEN_REUSE_WINDOW = DEFAULTS['PASSWORDLESS_TOKEN_REUSE_WINDOW']
+        api_settings.PASSWORDLESS_TOKEN_STORE = DEFAULTS['PASSWORDLESS_TOKEN_STORE']
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = DEFAULTS['PASSWORDLESS_DELIVERY_BACKEND']
+        api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS = DEFAULTS['PASSWORDLESS_TOKEN_MAX_ATTEMPTS']
@@ -0,0 +1,193 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from drfpasswordless.delivery import get_delivery_backend
+from drfpasswordless.services import TokenService
+from drfpasswordless.settings import api_settings, DEFAULTS
+from drfpasswordless.utils import CallbackToken, aconsume_callback_token
+
+User = get_user_model()
+
+
+class TokenRequestThrottlingTests(APITestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.LocmemDeliveryBackend'
+        self.outbox = get_delivery_backend().outbox
+        self.outbox.clear()
+
+        self.url = reverse('drfpasswordless:auth_email')
+        self.verify_url = reverse('drfpasswordless:verify_email')
+        self.email_field_name = api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME
+
+    def test_alias_throttled(self):
+        api_settings.PASSWORDLESS_THROTTLE_RATES = {'alias': '3/hour'}
+        for _ in range(3):
+            response = self.client.post(self.url, {'email': 'aaron@example.com'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Differently cased, it's still the same alias.
+        response = self.client.post(self.url, {'email': 'AARON@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(len(self.outbox), 3)
+
+        response = self.client.post(self.url, {'email': 'aaron2@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_ip_throttled(self):
+        api_settings.PASSWORDLESS_THROTTLE_RATES = {'ip': '2/hour'}
+        for i in range(2):
+            response = self.client.post(self.url, {'email': 'aaron%d@example.com' % i})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post(self.url, {'email': 'aaron3@example.com'}, REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        response = self.client.post(self.url, {'email': 'aaron3@example.com'}, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_user_throttled(self):
+        api_settings.PASSWORDLESS_THROTTLE_RATES = {'user': '1/hour'}
+        user = User.objects.create(**{self.email_field_name: 'aaron@example.com'})
+        self.client.force_authenticate(user)
+
+        response = self.client.post(self.verify_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(self.verify_url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_sliding_window_counts_previous_window(self):
+        api_settings.PASSWORDLESS_THROTTLE_RATES = {'alias': '2/min'}
+        with mock.patch('time.time', return_value=6000.0):
+            for _ in range(2):
+                self.client.post(self.url, {'email': 'aaron@example.com'})
+
+        # A quarter into the next window, three quarters of the previous one still count.
+        with mock.patch('time.time', return_value=6075.0):
+            response = self.client.post(self.url, {'email': 'aaron@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        # Once the previous window has mostly slid out, requests are allowed again.
+        with mock.patch('time.time', return_value=6115.0):
+            response = self.client.post(self.url, {'email': 'aaron@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_resend_cooldown(self):
+        api_settings.PASSWORDLESS_RESEND_COOLDOWN = 30
+        with mock.patch('time.time', return_value=1000.0):
+            response = self.client.post(self.url, {'email': 'aaron@example.com'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with mock.patch('time.time', return_value=1010.0):
+            response = self.client.post(self.url, {'email': 'aaron@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '20')
+        self.assertEqual(len(self.outbox), 1)
+
+    def test_disabled_scopes(self):
+        api_settings.PASSWORDLESS_THROTTLE_RATES = {'alias': None, 'ip': None}
+        for _ in range(15):
+            response = self.client.post(self.url, {'email': 'aaron@example.com'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = DEFAULTS['PASSWORDLESS_DELIVERY_BACKEND']
+        api_settings.PASSWORDLESS_THROTTLE_RATES = DEFAULTS['PASSWORDLESS_THROTTLE_RATES']
+        api_settings.PASSWORDLESS_RESEND_COOLDOWN = DEFAULTS['PASSWORDLESS_RESEND_COOLDOWN']
+
+
+class TokenAttemptLockoutTests(APITestCase):
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = 'drfpasswordless.delivery.LocmemDeliveryBackend'
+        api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS = 3
+        self.outbox = get_delivery_backend().outbox
+        self.outbox.clear()
+
+        self.email = 'aaron@example.com'
+        self.challenge_url = reverse('drfpasswordless:auth_token')
+        self.user = User.objects.create(**{api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME: self.email})
+
+    def issue_token(self):
+        TokenService.send_token(self.user, 'email', CallbackToken.TOKEN_TYPE_AUTH)
+        return self.outbox[-1].token.key
+
+    def wrong_key(self, key):
+        return '%06d' % ((int(key) + 1) % 1000000)
+
+    def challenge(self, key, email=None):
+        return self.client.post(self.challenge_url, {'email': email or self.email, 'token': key})
+
+    def test_token_invalidated_after_max_attempts(self):
+        key = self.issue_token()
+        for _ in range(3):
+            self.assertEqual(self.challenge(self.wrong_key(key)).status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertFalse(CallbackToken.objects.active().filter(user=self.user).exists())
+        self.assertEqual(self.challenge(key).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_guessing_flood_does_not_query(self):
+        key = self.issue_token()
+        for _ in range(3):
+            self.challenge(self.wrong_key(key), email='AARON@example.com')
+
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                self.assertEqual(self.challenge(self.wrong_key(key)).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_success_resets_attempts(self):
+        key = self.issue_token()
+        for _ in range(2):
+            self.challenge(self.wrong_key(key))
+        self.assertEqual(self.challenge(key).status_code, status.HTTP_200_OK)
+
+        key = self.issue_token()
+        for _ in range(2):
+            self.challenge(self.wrong_key(key))
+        self.assertEqual(self.challenge(key).status_code, status.HTTP_200_OK)
+
+    def test_new_token_lifts_lockout(self):
+        key = self.issue_token()
+        for _ in range(3):
+            self.challenge(self.wrong_key(key))
+
+        key = self.issue_token()
+        self.assertEqual(self.challenge(key).status_code, status.HTTP_200_OK)
+
+    def test_cache_store_token_invalidated(self):
+        api_settings.PASSWORDLESS_TOKEN_STORE = 'drfpasswordless.stores.CacheTokenStore'
+        key = self.issue_token()
+        for _ in range(3):
+            self.challenge(self.wrong_key(key))
+
+        api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS = None
+        self.assertEqual(self.challenge(key).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_async_redemption_uses_async_cache(self):
+        blocking = AssertionError('Blocking cache call on the event loop.')
+
+        def redeem(key):
+            with mock.patch('drfpasswordless.utils.is_locked_out', side_effect=blocking), \
+                    mock.patch('drfpasswordless.utils.record_failed_attempt', side_effect=blocking), \
+                    mock.patch('drfpasswordless.utils.reset_attempts', side_effect=blocking):
+                return async_to_sync(aconsume_callback_token)(key, CallbackToken.TOKEN_TYPE_AUTH, 'email', self.email)
+
+        key = self.issue_token()
+        for _ in range(2):
+            self.assertIsNone(redeem(self.wrong_key(key)))
+        self.assertIsNotNone(redeem(key))
+
+        key = self.issue_token()
+        for _ in range(3):
+            self.assertIsNone(redeem(self.wrong_key(key)))
+        self.assertIsNone(redeem(key))
+        self.assertFalse(CallbackToken.objects.active().filter(user=self.user).exists())
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_DELIVERY_BACKEND = DEFAULTS['PASSWORDLESS_DELIVERY_BACKEND']
+        api_settings.PASSWORDLESS_TOKEN_MAX_ATTEMPTS = DEFAULTS['PASSWORDLESS_TOKEN_MAX_ATTEMPTS']
+        api_settings.PASSWORDLESS_TOKEN_STORE = DEFAULTS['PASSWORDLESS_TOKEN_STORE']
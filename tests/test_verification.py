@@ -160,3 +160,74 @@ class AliasMobileVerificationTests(APITestCase):
         api_settings.PASSWORDLESS_AUTH_TYPES = DEFAULTS['PASSWORDLESS_AUTH_TYPES']
         api_settings.PASSWORDLESS_MOBILE_NOREPLY_ADDRESS = DEFAULTS['PASSWORDLESS_MOBILE_NOREPLY_NUMBER']
         api_settings.PASSWORDLESS_USER_MARK_MOBILE_VERIFIED = DEFAULTS['PASSWORDLESS_USER_MARK_MOBILE_VERIFIED']
+
+
+class AliasChangeTrackingTests(APITestCase):
+    """
+    Saving users shouldn't cost extra queries to detect alias changes.
+    """
+
+    def setUp(self):
+        api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED = True
+        api_settings.PASSWORDLESS_USER_MARK_MOBILE_VERIFIED = True
+        self.email_field_name = api_settings.PASSWORDLESS_USER_EMAIL_FIELD_NAME
+        self.email_verified_field_name = api_settings.PASSWORDLESS_USER_EMAIL_VERIFIED_FIELD_NAME
+
+        User.objects.bulk_create([
+            User(**{self.email_field_name: 'user%d@example.com' % i, self.email_verified_field_name: True})
+            for i in range(20)
+        ])
+
+    def test_bulk_saves_without_alias_changes(self):
+        users = list(User.objects.all())
+        # One UPDATE per user and nothing else.
+        with self.assertNumQueries(len(users)):
+            for user in users:
+                user.save()
+
+    def test_alias_change_confirmed_with_one_lookup(self):
+        user = User.objects.get(**{self.email_field_name: 'user0@example.com'})
+        setattr(user, self.email_field_name, 'changed@example.com')
+        # The stored alias, then the UPDATE.
+        with self.assertNumQueries(2):
+            user.save()
+        user.refresh_from_db()
+        self.assertEqual(getattr(user, self.email_verified_field_name), False)
+
+        # The snapshot follows the save, so saving again doesn't flag anything.
+        setattr(user, self.email_verified_field_name, True)
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual(getattr(user, self.email_verified_field_name), True)
+
+    def test_update_fields_without_aliases_skipped(self):
+        user = User.objects.get(**{self.email_field_name: 'user0@example.com'})
+        setattr(user, self.email_field_name, 'changed@example.com')
+        user.save(update_fields=['last_login'])
+        self.assertEqual(getattr(user, self.email_verified_field_name), True)
+
+        # The unsaved alias change is still picked up by the next full save.
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual(getattr(user, self.email_field_name), 'changed@example.com')
+        self.assertEqual(getattr(user, self.email_verified_field_name), False)
+
+    def test_refreshed_user_not_flagged(self):
+        user = User.objects.get(**{self.email_field_name: 'user0@example.com'})
+        User.objects.filter(pk=user.pk).update(**{self.email_field_name: 'elsewhere@example.com'})
+        user.refresh_from_db()
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual(getattr(user, self.email_field_name), 'elsewhere@example.com')
+        self.assertEqual(getattr(user, self.email_verified_field_name), True)
+
+    def test_deferred_alias_falls_back_to_lookup(self):
+        user = User.objects.defer(self.email_field_name).get(**{self.email_field_name: 'user0@example.com'})
+        setattr(user, self.email_field_name, 'changed@example.com')
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual(getattr(user, self.email_verified_field_name), False)
+
+    def tearDown(self):
+        api_settings.PASSWORDLESS_USER_MARK_EMAIL_VERIFIED = DEFAULTS['PASSWORDLESS_USER_MARK_EMAIL_VERIFIED']
+        api_settings.PASSWORDLESS_USER_MARK_MOBILE_VERIFIED = DEFAULTS['PASSWORDLESS_USER_MARK_MOBILE_VERIFIED']